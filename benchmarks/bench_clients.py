@@ -0,0 +1,58 @@
+"""Замер времени поиска клиентов в реестре Clients
+
+Запуск из корня репозитория:
+    PYTHONPATH=src database=sqlite:///:memory: python benchmarks/bench_clients.py
+"""
+import timeit
+from nano_async_chat.async_chat.server.clients import Client, Clients
+
+
+class FakeSocket:
+    def __init__(self, fileno: int):
+        self._fileno = fileno
+
+    def fileno(self) -> int:
+        return self._fileno
+
+
+def fill_clients(count: int) -> tuple[Clients, list[Client]]:
+    clients = Clients()
+    items = []
+    for i in range(count):
+        client = Client(socket=FakeSocket(i + 3))
+        clients.append(client)
+        clients.login(client, user_id=i + 1, account_name=f'Ivan{i + 1}')
+        items.append(client)
+    return clients, items
+
+
+def bench(count: int, number: int = 100000) -> dict[str, float]:
+    clients, items = fill_clients(count)
+    last = items[-1]
+    lookups = {
+        'socket': lambda: clients.get_client_by_socket(last.socket),
+        'fileno': lambda: clients.get_client_by_fileno(last.fileno),
+        'user_id': lambda: clients.get_client_by_user_id(last.user_id),
+        'account_name': lambda: clients.get_client_by_account_name(
+            last.account_name
+        ),
+    }
+    return {
+        name: timeit.timeit(lookup, number=number) / number * 1e9
+        for name, lookup in lookups.items()
+    }
+
+
+def main():
+    print(f'{"clients":>8} ' + ' '.join(
+        f'{name:>13}' for name in ('socket', 'fileno', 'user_id', 'account_name')
+    ) + '  (ns per lookup)')
+    for count in (100, 1000, 10000, 50000):
+        result = bench(count)
+        print(f'{count:>8} ' + ' '.join(
+            f'{value:>13.1f}' for value in result.values()
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 from .client import ClientChat
+from .reconnect_policy import ReconnectPolicy
 
 
 __all__ = [
-    'ClientChat'
+    'ClientChat',
+    'ReconnectPolicy'
 ]
@@ -115,6 +115,14 @@ class BaseResponseHandler(ABC):
     ):
         pass
 
+    @abstractmethod
+    def result_contact_presence(
+        self,
+        request_model: None,
+        response_model: jim.MessageContactPresence
+    ):
+        pass
+
     def dispatch_result_dict(self, result_dict: dict[str, Any]):
         request_model = result_dict['request_model']
         if request_model and isinstance(request_model, jim.MessageUserQuit):
@@ -131,6 +139,9 @@ class BaseResponseHandler(ABC):
             self.result_leave_room(**result_dict)
         elif request_model and isinstance(request_model, jim.MessageSendMessage):
             self.result_out_message(**result_dict)
+        elif isinstance(result_dict['response_model'], jim.MessageContacts):
+            # Изменения контактов, которые сервер присылает сам
+            self.result_get_contacts(**result_dict)
         else:
             self.strange_result(**result_dict)
 
@@ -176,6 +187,11 @@ class BaseResponseHandler(ABC):
                 request_model=request_model,
                 response_model=response_model
             )
+        elif isinstance(response_model, jim.MessageContactPresence):
+            return self.result_contact_presence(
+                request_model=request_model,
+                response_model=response_model
+            )
         else:
             logger.error(
                 f'Unknown message for response_model={response_model}'
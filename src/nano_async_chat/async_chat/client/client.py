@@ -1,4 +1,9 @@
-"""Основной класс клиента ассинхронного чата"""
+"""Основной класс клиента ассинхронного чата
+
+Клиент работает на задачах trio поверх SocketStream: задача приема
+разбирает все пришедшие кадры сразу, задача отправки забирает из очереди
+все накопившиеся запросы и отправляет их одним вызовом, задача команд
+обрабатывает команды интерфейса. Опроса сокета по таймауту нет."""
 import sys
 import socket
 import signal
@@ -9,7 +14,9 @@ import datetime as dt
 from typing import Any
 from typing import TypeVar
 import json
+import base64
 from pydantic import BaseModel
+from .. import jim
 from ..utils import (
     WrongCommand,
 )
@@ -19,7 +26,9 @@ from ..client.client_verifier import ClientVerifier
 from ..client.client_ui.client_ui_talk import ClientUiTalk
 from ..client.client_response_handler import ClientResponseHandler
 from ..client.message_chain import messages_chain
-from ..utils import encrypt, load_keys
+from ..client.reconnect_policy import ReconnectPolicy
+from ..utils import SessionCipher, encrypt, load_keys
+from ..frame_codec import HEAD_SIZE, FrameDecoder, FrameError, encode_frame
 
 
 logger = logging.getLogger('client-logger')
@@ -46,6 +55,10 @@ class ClientChat(metaclass=ClientVerifier):
             ip_address: str,
             port: int,
             client_ui_talk: ClientUiTalk,
+            session_encryption: bool = True,
+            max_outgoing: int = 1000,
+            reply_timeout: float = 10,
+            reconnect_policy: ReconnectPolicy | None = None,
     ):
         self.current_user = current_user
         self.current_user.account_name = account_name
@@ -56,13 +69,31 @@ class ClientChat(metaclass=ClientVerifier):
         self.port = port
         self.ip_address = ipaddress.ip_address(ip_address)
         self.client_ui_talk = client_ui_talk
-        self.message_head_size = 4
+        self.message_head_size = HEAD_SIZE
         self.message_chain = messages_chain
         signal.signal(signal.SIGTERM, self.close_client)
         signal.signal(signal.SIGINT, self.close_client)
-        self.counter = 0
         _, publick_key = load_keys()
         self.publick_key = publick_key
+        self.session_encryption = session_encryption
+        self.cipher: SessionCipher | None = None
+        # Номер последнего полученного сообщения чата для возобновления
+        # сессии после переподключения
+        self.last_seq = 0
+        # Номер из кадра номера, относится к следующему кадру
+        self.next_seq: int | None = None
+        self.stream: trio.SocketStream | None = None
+        self.decoder = FrameDecoder()
+        # Очередь запросов переживает переподключения
+        self._outgoing_send, self._outgoing_receive = trio.open_memory_channel(
+            max_outgoing
+        )
+        self._unsent: list[str] = []
+        # Ответы на служебные запросы, которые ждет установка сессии
+        self._replies: dict[str, trio.MemorySendChannel] = {}
+        self.reply_timeout = reply_timeout
+        self._connection_scope: trio.CancelScope | None = None
+        self.reconnect_policy = reconnect_policy or ReconnectPolicy()
 
     def close_client(self, signum, frame):
         signame = signal.Signals(signum).name
@@ -70,65 +101,132 @@ class ClientChat(metaclass=ClientVerifier):
         self.close_socket()
         sys.exit(0)
 
-    def connect_to_server(self) -> None:
-        self._chat_socket = socket.socket(
+    async def connect_to_server(self) -> None:
+        chat_socket = trio.socket.socket(
             family=socket.AF_INET,
             type=socket.SOCK_STREAM
         )
-        self._chat_socket = socket.create_connection(
-            address=(str(self.ip_address), self.port),
-            timeout=0.01
-        )
-        self._chat_socket.settimeout(0.01)
+        try:
+            await chat_socket.connect((str(self.ip_address), self.port))
+        except BaseException:
+            chat_socket.close()
+            raise
+        self.stream = trio.SocketStream(chat_socket)
+        self.decoder = FrameDecoder()
+        self.next_seq = None
 
     async def connect_to_server_loop(self) -> None:
         while True:
             try:
-                self.connect_to_server()
+                await self.connect_to_server()
+                self.reconnect_policy.on_connected()
                 self.client_ui_talk.set_connected(
                     connected=True,
                     message='Подключились'
                 )
                 break
-            except Exception as exc:
+            except OSError as exc:
+                self.reconnect_policy.on_failure()
+                delay = self.reconnect_policy.next_delay()
                 self.client_ui_talk.set_connected(
                     connected=False,
-                    message=f'Ошибка подключения {exc.__repr__()}'
+                    message=f'Ошибка подключения {exc.__repr__()}, '
+                            f'повтор через {delay:.1f} с'
                 )
                 logger.error(
                     f'Неудачное подключение к серверу {exc.__repr__()}'
                 )
-            await trio.sleep(0.1)
+                await trio.sleep(delay)
 
-    def get_message_size(self, head: str) -> int:
-        return int(head, 16)
-
-    async def get_incomming_message(self) -> str | None:
-        self.counter = self.counter + 1
-        # print(f'{self.counter}---{self.account_name}---get_incomming_message')
-        try:
-            message_head = (
-                self._chat_socket.recv(self.message_head_size)
+    async def connection_loop(self) -> None:
+        """Держит подключение к серверу, переподключаясь при обрыве"""
+        while True:
+            await self.connect_to_server_loop()
+            try:
+                await self.run_connection()
+            finally:
+                self.close_socket()
+                self.reconnect_policy.on_disconnected()
+            # Клиенты, отключенные одновременно, возвращаются вразброс
+            delay = self.reconnect_policy.next_delay()
+            self.client_ui_talk.set_connected(
+                connected=False,
+                message=f'Соединение потеряно, повтор через {delay:.1f} с'
             )
-            print(f'{message_head=}')
-            if len(message_head) == 0:
-                raise ConnectionResetError()
-            message_size = self.get_message_size(message_head)
-            incomming_message = (
-                self._chat_socket.recv(message_size).decode()
+            logger.debug(
+                'Сокет закрыт, переподключимся через %.2f с: %s',
+                delay,
+                self.reconnect_policy.get_stats()
             )
-        except BlockingIOError:
-            # logger.debug('BlockingIOError')
-            return
-        except TimeoutError:
-            # logger.debug('TimeoutError')
-            return
-        except ConnectionResetError:
-            logger.debug('Сокет закрыт, пробуем переподлючиться')
-            await self.connect_to_server_loop()
-            return
-        logger.debug('get_incomming_message: %s', incomming_message)
-        return incomming_message
+            await trio.sleep(delay)
+
+    async def run_connection(self) -> None:
+        async with trio.open_nursery() as nursery:
+            self._connection_scope = nursery.cancel_scope
+            nursery.start_soon(self.receiving_loop)
+            try:
+                await self.start_session()
+            except (trio.TooSlowError, trio.BrokenResourceError, trio.ClosedResourceError, OSError) as exc:
+                logger.error('Не удалось начать сессию %s', exc.__repr__())
+                self.drop_connection()
+                return
+            # Запросы из очереди уходят после ключа сессии и входа
+            nursery.start_soon(self.sending_loop)
+
+    def drop_connection(self) -> None:
+        if self._connection_scope:
+            self._connection_scope.cancel()
+
+    async def start_session(self) -> None:
+        await self.send_session_key()
+        if self.current_user.is_entered and self.current_user.token:
+            await self.resume_session()
+
+    async def call(self, message_model: BaseModel) -> dict[str, Any]:
+        """Отправляет служебный запрос в обход очереди и ждет ответа"""
+        send_channel, receive_channel = trio.open_memory_channel(1)
+        self._replies[message_model.id] = send_channel
+        try:
+            await self.send_messages([message_model.json()])
+            with trio.fail_after(self.reply_timeout):
+                return await receive_channel.receive()
+        finally:
+            del self._replies[message_model.id]
+
+    async def receiving_loop(self) -> None:
+        try:
+            while await self.decoder.receive_into(self.stream.socket):
+                # Разбираем все кадры, пришедшие за одно чтение
+                for data in self.decoder.pop_frames():
+                    incomming_data = self.parse_incomming_message(
+                        data.decode()
+                    )
+                    if incomming_data:
+                        self.dispatch_incomming_data(incomming_data)
+                    else:
+                        # Номер относился к неразобранному кадру
+                        self.next_seq = None
+        except (trio.BrokenResourceError, trio.ClosedResourceError, FrameError, OSError) as exc:
+            logger.debug('Ошибка приема %s', exc.__repr__())
+        self.drop_connection()
+
+    async def sending_loop(self) -> None:
+        while True:
+            messages = self._unsent or [await self._outgoing_receive.receive()]
+            while True:
+                try:
+                    messages.append(self._outgoing_receive.receive_nowait())
+                except trio.WouldBlock:
+                    break
+            self._unsent = messages
+            try:
+                await self.send_messages(messages)
+            except (trio.BrokenResourceError, trio.ClosedResourceError, OSError) as exc:
+                # Пачка уйдет еще раз после переподключения
+                logger.error('Ошибка отправки %s', exc.__repr__())
+                self.drop_connection()
+                return
+            self._unsent = []
 
     def parse_incomming_message(self, incomming_message: str) -> dict[str, Any] | None:
         try:
@@ -142,12 +240,96 @@ class ClientChat(metaclass=ClientVerifier):
             return
         return incomming_data
 
+    async def send_session_key(self) -> None:
+        self.cipher = None
+        if not self.session_encryption:
+            return
+        cipher = SessionCipher()
+        message_model = jim.MessageSessionKey(
+            key=base64.b64encode(cipher.key).decode()
+        )
+        incomming_data = await self.call(message_model)
+        if incomming_data.get('response') == jim.StatusCodes.HTTP_200_OK:
+            self.cipher = cipher
+            logger.debug('Сервер принял ключ сессии')
+        else:
+            logger.warning(
+                'Сервер не принял ключ сессии, продолжаем шифровать по rsa: %s',
+                incomming_data.get('error')
+            )
+
+    async def resume_session(self) -> None:
+        message_model = jim.MessageSessionResume(
+            user=dict(account_name=self.current_user.account_name),
+            token=self.current_user.token,
+            last_seq=self.last_seq,
+            room=self.current_user.room
+        )
+        incomming_data = await self.call(message_model)
+        if incomming_data.get('response') == jim.StatusCodes.HTTP_200_OK:
+            logger.debug('Сессия возобновлена: %s', incomming_data.get('alert'))
+            return
+        logger.debug(
+            'Сессию не удалось возобновить, входим заново: %s',
+            incomming_data.get('error')
+        )
+        self.current_user.is_entered = False
+        request_model = await self.response_handler.action_login(
+            account_name=str(self.current_user.account_name),
+            password=str(self.current_user.password)
+        )
+        await self.send_messages([request_model.json()])
+        self.register_outgoing_model(request_model)
+
+    def is_seq_header(self, incomming_data: dict[str, Any]) -> bool:
+        """Запоминает номер сообщения чата, пришедший кадром перед ним"""
+        if incomming_data.keys() != {'seq'}:
+            return False
+        self.next_seq = incomming_data['seq']
+        return True
+
+    def is_replayed(self, incomming_data: dict[str, Any]) -> bool:
+        """Пропускает сообщения чата, уже полученные до переподключения"""
+        seq, self.next_seq = self.next_seq, None
+        if seq is None:
+            return False
+        if seq <= self.last_seq:
+            logger.debug('Сообщение %s уже получено', seq)
+            return True
+        self.last_seq = seq
+        return False
+
     def dispatch_incomming_data(self, incomming_data: dict[str, Any]) -> None:
         logger.debug('dispatch_incomming_data %s', incomming_data)
+        if (self.is_seq_header(incomming_data)
+                or self.is_replayed(incomming_data)):
+            return
+        reply_channel = self._replies.get(incomming_data.get('chain_id'))
+        if reply_channel:
+            return reply_channel.send_nowait(incomming_data)
+        if incomming_data.get('schema_class') == jim.MessageToken.__name__:
+            # После перезапуска сервера номера начинаются заново
+            self.last_seq = 0
         handler = ClientResponseHandler()
         message_model = handler.dispatch_incomming_data(incomming_data)
+        if (isinstance(message_model, jim.MessageContacts)
+                and self.current_user.contacts_version is None):
+            # Пропустили изменение контактов, список нужен целиком
+            self.request_contacts()
         self.client_ui_talk.put_message_to_ui(message_model)
 
+    def request_contacts(self) -> None:
+        message_model = jim.MessageGetContacts(
+            user=dict(account_name=self.current_user.account_name),
+            token=self.current_user.token
+        )
+        try:
+            self._outgoing_send.send_nowait(message_model.json())
+        except trio.WouldBlock:
+            logger.warning('Очередь отправки полна, контакты не запрошены')
+            return
+        self.register_outgoing_model(message_model)
+
     def print_message(self, incomming_data: dict[str, Any]) -> None:
         print(f'Пришло сообщение: {incomming_data["message"]}')
 
@@ -160,55 +342,54 @@ class ClientChat(metaclass=ClientVerifier):
             )
 
     def form_data(self, data: bytes) -> bytes:
-        length = len(data)
-        hex_legth = hex(length)[2:]
-        head_message = f'00{hex_legth}'[-4:]
-        return head_message.encode() + data
+        return encode_frame(data)
+
+    def encrypt_message(self, outgoing_message: str) -> bytes:
+        if self.cipher:
+            return self.cipher.encrypt(outgoing_message)
+        return encrypt(outgoing_message, self.publick_key)
+
+    async def send_messages(self, outgoing_messages: list[str]) -> None:
+        logger.debug('send_messages: %s', outgoing_messages)
+        data = b''.join(
+            self.form_data(self.encrypt_message(outgoing_message))
+            for outgoing_message in outgoing_messages
+        )
+        if not self.stream:
+            raise trio.ClosedResourceError('no connection')
+        await self.stream.send_all(data)
 
     async def send_outgoing_message(self, outgoing_message: str) -> None:
-        try:
-            logger.debug('send_outgoing_message: %s', outgoing_message)
-            encrypted_data = encrypt(outgoing_message, self.publick_key)
-            data = self.form_data(encrypted_data)
-            self._chat_socket.send(data)
-        except OSError as exc:
-            logger.error('OSError= %s', str(exc))
-            await self.connect_to_server_loop()
+        """Ставит запрос в очередь задачи отправки"""
+        await self._outgoing_send.send(outgoing_message)
 
     def close_socket(self) -> None:
-        if hasattr(self, '_chat_socket'):
-            self._chat_socket.close()
+        if self.stream:
+            self.stream.socket.close()
+            self.stream = None
 
     async def run(self):
         await self.main_loop()
 
     async def main_loop(self):
-        await self.connect_to_server_loop()
         async with trio.open_nursery() as nursery:
             ui = self.client_ui_talk.get_ui()
             nursery.start_soon(ui.command_handler)
-            while True:
-                await trio.sleep(0.1)
-                command = self.client_ui_talk.get_command_to_client()
-                if command:
-                    print(f'Получили новую команду {command}')
-                    try:
-                        await self.processing_command(command)
-                    except WrongCommand as exc:
-                        print(exc.__repr__())
-                    except SystemExit:
-                        logger.debug('Выходим')
-                        self.close_socket()
-                        return
-
-                # logger.debug('incomming_messages_loop: тик-так')
-                incomming_message = await self.get_incomming_message()
-                if incomming_message:
-                    incomming_data = self.parse_incomming_message(
-                        incomming_message
-                    )
-                    if incomming_data:
-                        self.dispatch_incomming_data(incomming_data)
+            nursery.start_soon(self.connection_loop)
+            await self.command_loop()
+            nursery.cancel_scope.cancel()
+
+    async def command_loop(self) -> None:
+        async for command in self.client_ui_talk.receive_channel_to_client:
+            print(f'Получили новую команду {command}')
+            try:
+                await self.processing_command(command)
+            except WrongCommand as exc:
+                print(exc.__repr__())
+            except SystemExit:
+                logger.debug('Выходим')
+                self.close_socket()
+                return
 
     async def processing_command(self, command: str) -> None:
         request_model = await self.response_handler.processing_command(command)
@@ -219,6 +400,9 @@ class ClientChat(metaclass=ClientVerifier):
     async def processing_outgoing_model(self, message_model: BaseModel):
         outgoing_message = str(message_model.json())
         await self.send_outgoing_message(outgoing_message=outgoing_message)
+        self.register_outgoing_model(message_model)
+
+    def register_outgoing_model(self, message_model: BaseModel) -> None:
         self.client_ui_talk.put_outgoing_message(
             message_model
         )
@@ -19,6 +19,8 @@ class ClientResponseHandler(BaseResponseHandler):
         self.current_user.is_entered = success
         self.current_user.token = response_model.token
         if success:
+            # Версии контактов другого входа к этому не относятся
+            self.current_user.contacts_version = None
             logger.debug('Вход удачный')
         else:
             logger.debug('Вход не удачный')
@@ -41,16 +43,57 @@ class ClientResponseHandler(BaseResponseHandler):
         response_model: jim.MessageContacts,
     ):
         success = self.is_success(response_model)
-        if success:
+        if success and self.apply_contacts(response_model):
             logger.debug(
                 'Успешно получили контакты %s',
                 response_model.alert
             )
+        elif success:
+            logger.debug(
+                'Пропущены изменения контактов до версии %s',
+                response_model.since_version
+            )
         else:
             logger.debug(
                 'Не удалось получить контакты'
             )
 
+    def apply_contacts(self, response_model: jim.MessageContacts) -> bool:
+        """Применяет список контактов или изменения в нем
+
+        Если изменения начинаются не с нашей версии, сбрасывает версию и
+        возвращает False: список нужно запросить заново."""
+        user = self.current_user
+        online = {contact.account_name for contact in response_model.online}
+        if response_model.since_version is None:
+            user.contacts = list(response_model.alert)
+            user.contacts_version = response_model.version
+            user.online_contacts = online
+            return True
+        if (user.contacts_version is not None
+                and response_model.version is not None
+                and response_model.version <= user.contacts_version):
+            # Эти изменения уже пришли вместе с более новыми
+            return True
+        if response_model.since_version != user.contacts_version:
+            user.contacts_version = None
+            return False
+        removed = {contact.account_name for contact in response_model.removed}
+        contacts = [
+            contact for contact in user.contacts
+            if contact.account_name not in removed
+        ]
+        known = {contact.account_name for contact in contacts}
+        contacts.extend(
+            contact for contact in response_model.alert
+            if contact.account_name not in known
+        )
+        user.contacts = contacts
+        user.contacts_version = response_model.version
+        user.online_contacts -= removed
+        user.online_contacts |= online
+        return True
+
     def result_add_contact(
         self,
         request_model: jim.MessageAddContact,
@@ -148,6 +191,22 @@ class ClientResponseHandler(BaseResponseHandler):
     ) -> jim.MessageUserPresence:
         logger.debug(f'get message: {response_model}')
 
+    def result_contact_presence(
+        self,
+        request_model: None,
+        response_model: jim.MessageContactPresence
+    ):
+        account_name = response_model.user.account_name
+        if response_model.online:
+            self.current_user.online_contacts.add(account_name)
+        else:
+            self.current_user.online_contacts.discard(account_name)
+        logger.debug(
+            'Контакт %s %s',
+            account_name,
+            'в сети' if response_model.online else 'вышел из сети'
+        )
+
     def result_out_message(
         self,
         request_model: jim.MessageSendMessage,
@@ -323,7 +382,8 @@ class ClientResponseHandler(BaseResponseHandler):
             user=dict(
                 account_name=self.current_user.account_name,
             ),
-            token=self.current_user.token
+            token=self.current_user.token,
+            since_version=self.current_user.contacts_version
         )
         return message_model
 
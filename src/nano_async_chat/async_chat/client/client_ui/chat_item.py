@@ -1,4 +1,11 @@
-"""Утилиты управления окном сообщений чата"""
+"""Утилиты управления окном сообщений чата
+
+История ограничена max_lines строками. При переполнении старые строки
+срезаются сразу пачкой trim_step, что бы не сдвигать список на каждой
+новой строке.
+
+Строки проиндексированы по message_id и message_chain_id, поэтому
+подтверждение доставки находит свою строку без перебора истории."""
 from enum import Enum, auto
 from dataclasses import dataclass, field
 
@@ -44,16 +51,57 @@ class ChatItem:
     lines: list[ChatLine | OutgoingChatLine | IncommintChatLine] = (
         field(default_factory=list)
     )
+    max_lines: int = 100000
+    trim_step: int = 10000
+    # Сколько строк срезано с начала истории. Индексы хранят позицию
+    # строки, которая при срезке не меняется, номер в окне - позиция
+    # минус offset
+    offset: int = field(default=0, init=False)
+    by_message_id: dict[str, int] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    by_chain_id: dict[str, int] = field(
+        default_factory=dict, init=False, repr=False
+    )
+    # Позиции первой и последней измененной строки с последней отрисовки
+    dirty: tuple[int, int] | None = field(default=None, init=False)
 
     class MessageDirection(str, Enum):
         incoming = auto()
         outgoing = auto()
         inner = auto()
 
+    def __post_init__(self):
+        for position, line in enumerate(self.lines):
+            self._index_line(position, line)
+
+    def _index_line(self, position: int, line: ChatLine) -> None:
+        if line.message_id:
+            self.by_message_id[line.message_id] = position
+        if line.message_chain_id:
+            self.by_chain_id[line.message_chain_id] = position
+
+    def _unindex_line(self, position: int, line: ChatLine) -> None:
+        # Ключ мог быть перезаписан более новой строкой с тем же id
+        if self.by_message_id.get(line.message_id) == position:
+            del self.by_message_id[line.message_id]
+        if self.by_chain_id.get(line.message_chain_id) == position:
+            del self.by_chain_id[line.message_chain_id]
+
+    def _get_line(self, position: int | None):
+        if position is None:
+            return None
+        return self.lines[position - self.offset]
+
+    def get_line_by_message_id(self, message_id: str):
+        return self._get_line(self.by_message_id.get(message_id))
+
     def get_line_by_chain_id(self, chain_id: str):
-        for line in self.lines:
-            if chain_id == line.message_id:
-                return line
+        # chain_id ответа совпадает с message_id исходного сообщения
+        return self.get_line_by_message_id(chain_id)
+
+    def get_line_by_message_chain_id(self, message_chain_id: str):
+        return self._get_line(self.by_chain_id.get(message_chain_id))
 
     def get_plain_text(self) -> str:
         contents = [
@@ -62,7 +110,49 @@ class ChatItem:
         ]
         return '\n'.join(contents)
 
-    def accepted_lines(self, message_id: str):
-        for line in self.lines:
-            if line.message_id == message_id:
-                line.accepted = True
+    def append_line(self, line: ChatLine) -> int:
+        row = len(self.lines)
+        self.lines.append(line)
+        self._index_line(self.offset + row, line)
+        return row
+
+    def get_overflow(self) -> int:
+        if len(self.lines) <= self.max_lines:
+            return 0
+        return min(
+            len(self.lines), len(self.lines) - self.max_lines + self.trim_step
+        )
+
+    def trim(self, count: int) -> None:
+        for position, line in enumerate(self.lines[:count], self.offset):
+            self._unindex_line(position, line)
+        del self.lines[:count]
+        self.offset += count
+
+    def mark_dirty(self, row: int) -> None:
+        position = self.offset + row
+        if self.dirty is None:
+            self.dirty = (position, position)
+        else:
+            first, last = self.dirty
+            self.dirty = (min(first, position), max(last, position))
+
+    def pop_dirty(self) -> tuple[int, int] | None:
+        """Диапазон строк окна, которые нужно перерисовать"""
+        if self.dirty is None:
+            return None
+        first, last = self.dirty
+        self.dirty = None
+        last = last - self.offset
+        if last < 0:
+            return None
+        return max(first - self.offset, 0), last
+
+    def accepted_lines(self, message_id: str) -> int | None:
+        position = self.by_message_id.get(message_id)
+        if position is None:
+            return None
+        row = position - self.offset
+        self.lines[row].accepted = True
+        self.mark_dirty(row)
+        return row
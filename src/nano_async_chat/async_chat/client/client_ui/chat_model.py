@@ -0,0 +1,52 @@
+"""Модель окна сообщений чата для QListView
+
+Вид запрашивает у модели только видимые строки, поэтому отрисовка не
+зависит от длины истории. Новая строка добавляется одной вставкой в
+конец, а при переполнении ChatItem старые строки удаляются пачкой.
+Измененные строки копятся в ChatItem.dirty и перерисовываются одним
+сигналом dataChanged за тик интерфейса."""
+from PySide6.QtCore import QAbstractListModel, QModelIndex, Qt
+from .chat_item import ChatItem, ChatLine
+
+
+class ChatListModel(QAbstractListModel):
+    def __init__(self, chat_item: ChatItem, parent=None):
+        super().__init__(parent)
+        self.chat_item = chat_item
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.chat_item.lines)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.DisplayRole, Qt.ToolTipRole):
+            return self.chat_item.lines[index.row()].get_row()
+        return None
+
+    def append_line(self, line: ChatLine) -> None:
+        row = len(self.chat_item.lines)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.chat_item.append_line(line)
+        self.endInsertRows()
+
+        overflow = self.chat_item.get_overflow()
+        if overflow:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            self.chat_item.trim(overflow)
+            self.endRemoveRows()
+
+    def update_dirty_rows(self) -> None:
+        dirty = self.chat_item.pop_dirty()
+        if dirty:
+            first, last = dirty
+            self.dataChanged.emit(
+                self.index(first), self.index(last), [Qt.DisplayRole]
+            )
+
+    def set_chat_item(self, chat_item: ChatItem) -> None:
+        self.beginResetModel()
+        self.chat_item = chat_item
+        self.endResetModel()
@@ -7,13 +7,12 @@ import outcome
 import trio
 from queue import Queue, Empty
 from dataclasses import dataclass
-from PySide6 import QtWidgets, QtCore, QtUiTools
+from PySide6 import QtWidgets, QtCore, QtGui, QtUiTools
 from PySide6.QtCore import QEvent, QObject, Signal, Slot, QTimer
 from PySide6.QtWidgets import QApplication
 from ..client_ui.client_ui_talk import ClientUiTalk
 from ..client import ClientChat
 from ..base_ui import BaseUI
-from ... import jim
 from ..current_user import current_user
 from ...jim.common_schemas import UserBase
 from ..client_ui_response_handler import ClientUIResponseHandler
@@ -23,6 +22,7 @@ from ..client_ui.chat_item import (
     OutgoingChatLine,
     IncommintChatLine
 )
+from ..client_ui.chat_model import ChatListModel
 
 
 @dataclass
@@ -37,6 +37,8 @@ class MainWindowContol(BaseUI):
     ui_path = Path(__file__).resolve().parent / 'client.ui'
     grey = "background-color: rgb(224, 224, 224);"
     white = "background-color: rgb(255, 255, 255);"
+    # Сколько сообщений от клиента разбирать за один тик таймера
+    ui_batch_size = 500
 
     def __init__(
         self,
@@ -46,12 +48,10 @@ class MainWindowContol(BaseUI):
         self.parent = parent
         self.client_ui_talk = client_ui_talk
         self.chat_item = ChatItem()
+        self.chat_model = ChatListModel(self.chat_item)
 
         self.current_user = current_user
 
-        self._get_contacts = QTimer()
-        self._get_contacts.timeout.connect(self.action_get_contacts)
-
         self.response_handler = ClientUIResponseHandler(ui=self)
 
         self.loginLine: QtWidgets.QLineEdit = parent.loginLine
@@ -72,7 +72,7 @@ class MainWindowContol(BaseUI):
         self.leaveRoomButton: QtWidgets.QPushButton = parent.leaveRoomButton
 
         self.messageField: QtWidgets.QPlainTextEdit = parent.messageField
-        self.roomChat: QtWidgets.QTextBrowser = parent.roomChat
+        self.roomChat: QtWidgets.QListView = parent.roomChat
 
         self.contactsList: QtWidgets.QListWidget = parent.contactsList
 
@@ -91,6 +91,7 @@ class MainWindowContol(BaseUI):
         self.roomNameLine.insert('gamers')
         self.set_status(self.onlineStatus, 'offline', 'red')
         self.set_status(self.loginStatus, 'no login', 'red')
+        self.roomChat.setModel(self.chat_model)
 
         self.loginButton.setEnabled(False)
         self.set_enable_control_buttons(False)
@@ -116,11 +117,10 @@ class MainWindowContol(BaseUI):
         self.current_user.try_login = False
         self.login_status(success=success)
         if success:
-            self._get_contacts.start(10000)
+            # Дальше сервер сам присылает изменения контактов
             self.action_get_contacts()
             self.set_enable_control_buttons(True)
         else:
-            self._get_contacts.stop()
             self.loginButton.setEnabled(True)
             self.loginLine.setReadOnly(False)
             self.loginLine.setStyleSheet(self.__class__.white)
@@ -255,14 +255,12 @@ class MainWindowContol(BaseUI):
 
         new_line = line_class(**line_dict)
 
-        self.chat_item.lines.append(new_line)
-        self.rerender_chat()
+        self.chat_model.append_line(new_line)
+        self.roomChat.scrollToBottom()
 
     def rerender_chat(self):
-        text = self.chat_item.get_plain_text()
-        self.roomChat.setPlainText(text)
-        verScrollBar = self.roomChat.verticalScrollBar()
-        verScrollBar.setValue(verScrollBar.maximum())
+        self.chat_model.set_chat_item(self.chat_item)
+        self.roomChat.scrollToBottom()
 
     def set_status(self, target: QtWidgets.QLabel, status: str, color: str):
         target.setText(status)
@@ -285,6 +283,7 @@ class MainWindowContol(BaseUI):
 
         self.outgoing_messages_processing()
         self.incomming_messages_processing()
+        self.chat_model.update_dirty_rows()
 
     def login_status(self, success=False) -> None:
         if success:
@@ -293,32 +292,23 @@ class MainWindowContol(BaseUI):
             self.set_status(self.loginStatus, 'no login', 'red')
 
     def incomming_messages_processing(self):
-        incomming_model = self.client_ui_talk.get_message_to_ui()
-        if incomming_model:
+        for _ in range(self.ui_batch_size):
+            incomming_model = self.client_ui_talk.get_message_to_ui()
+            if not incomming_model:
+                break
             self.response_handler.dispatch_incomming_model(incomming_model)
 
     def outgoing_messages_processing(self):
-        outgoing_model = self.client_ui_talk.get_outgoing_message()
-        if outgoing_model:
+        for _ in range(self.ui_batch_size):
+            outgoing_model = self.client_ui_talk.get_outgoing_message()
+            if not outgoing_model:
+                break
             self.response_handler.dispatch_outgoing_model(outgoing_model)
 
-    def save_contacts_and_render(self, incomming_model: jim.MessageContacts):
-        self.current_user.contacts = incomming_model.alert
-        self.rerender_contacts()
-
-    def append_contact_and_render(self, contact: UserBase):
-        self.current_user.contacts.append(contact)
-        self.rerender_contacts()
-
     def clean_contacts(self):
         self.current_user.contacts: list[UserBase] = []
-
-    def delete_contact_and_render(self, contact: UserBase):
-        for i, account_name in enumerate(self.current_user.contacts):
-            if account_name == contact.account_name:
-                del self.current_user.contacts[i]
-                break
-        self.rerender_contacts()
+        self.current_user.contacts_version = None
+        self.current_user.online_contacts.clear()
 
     def rerender_contacts(self):
         self.contactsList.clear()
@@ -326,9 +316,13 @@ class MainWindowContol(BaseUI):
         sorted_contacts = sorted(
             contacts, key=lambda u: u.account_name
         )
+        online_contacts = self.current_user.online_contacts
         for contact in sorted_contacts:
             account_name = contact.account_name
-            self.contactsList.addItem(QtWidgets.QListWidgetItem(account_name))
+            item = QtWidgets.QListWidgetItem(account_name)
+            if account_name in online_contacts:
+                item.setForeground(QtGui.QBrush(QtCore.Qt.darkGreen))
+            self.contactsList.addItem(item)
 
     def success_join_room(self, new_room: str):
         self.roomNameLabel.setText(new_room)
@@ -342,9 +336,8 @@ class MainWindowContol(BaseUI):
         )
 
     def accept_messages(self, message_id: str):
+        # Строка перерисуется в конце тика вместе с остальными
         self.chat_item.accepted_lines(message_id)
-        # Что бы видеть как меняется статус accepted
-        self.rerender_chat()
 
     def init_config(self) -> None:
         login = self.loginLine.text()
@@ -15,9 +15,9 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QApplication, QDialog, QLabel, QLineEdit,
-    QListWidget, QListWidgetItem, QPlainTextEdit, QPushButton,
-    QSizePolicy, QTextBrowser, QWidget)
+from PySide6.QtWidgets import (QAbstractItemView, QApplication, QDialog, QLabel,
+    QLineEdit, QListView, QListWidget, QListWidgetItem,
+    QPlainTextEdit, QPushButton, QSizePolicy, QWidget)
 
 class Ui_Dialog(object):
     def setupUi(self, Dialog):
@@ -144,14 +144,15 @@ class Ui_Dialog(object):
         self.label_6.setObjectName(u"label_6")
         self.label_6.setGeometry(QRect(40, 550, 151, 21))
         self.label_6.setFont(font)
-        self.roomChat = QTextBrowser(Dialog)
+        self.roomChat = QListView(Dialog)
         self.roomChat.setObjectName(u"roomChat")
         self.roomChat.setEnabled(True)
         self.roomChat.setGeometry(QRect(40, 61, 471, 371))
         self.roomChat.setFont(font5)
         self.roomChat.setLayoutDirection(Qt.LeftToRight)
         self.roomChat.setAutoFillBackground(False)
-        self.roomChat.setOverwriteMode(False)
+        self.roomChat.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.roomChat.setUniformItemSizes(True)
         self.loginButton = QPushButton(Dialog)
         self.loginButton.setObjectName(u"loginButton")
         self.loginButton.setGeometry(QRect(420, 720, 141, 41))
@@ -189,11 +190,6 @@ class Ui_Dialog(object):
 #if QT_CONFIG(tooltip)
         self.roomChat.setToolTip("")
 #endif // QT_CONFIG(tooltip)
-        self.roomChat.setHtml(QCoreApplication.translate("Dialog", u"<!DOCTYPE HTML PUBLIC \"-//W3C//DTD HTML 4.0//EN\" \"http://www.w3.org/TR/REC-html40/strict.dtd\">\n"
-"<html><head><meta name=\"qrichtext\" content=\"1\" /><style type=\"text/css\">\n"
-"p, li { white-space: pre-wrap; }\n"
-"</style></head><body style=\" font-family:'Consolas'; font-size:12pt; font-weight:400; font-style:normal;\">\n"
-"<p style=\"-qt-paragraph-type:empty; margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px; font-family:'MS Shell Dlg 2';\"><br /></p></body></html>", None))
         self.loginButton.setText(QCoreApplication.translate("Dialog", u"\u0410\u0432\u0442\u043e\u0440\u0438\u0437\u0430\u0446\u0438\u044f", None))
         self.roomName.setText(QCoreApplication.translate("Dialog", u"<html><head/><body><p>x</p></body></html>", None))
     # retranslateUi
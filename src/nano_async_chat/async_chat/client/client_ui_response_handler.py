@@ -43,7 +43,8 @@ class ClientUIResponseHandler(BaseResponseHandler):
     ):
         success = self.is_success(response_model)
         if success:
-            self.ui.save_contacts_and_render(response_model)
+            # Список уже обновил обработчик клиента
+            self.ui.rerender_contacts()
         else:
             self.ui.show_error('Произошла ошибка при получении контактов')
 
@@ -52,11 +53,8 @@ class ClientUIResponseHandler(BaseResponseHandler):
         request_model: jim.MessageAddContact,
         response_model: jim.MessageAlert | jim.MessageError,
     ):
-        success = self.is_success(response_model)
-        if success:
-            target_user = request_model.target_user
-            self.ui.append_contact_and_render(target_user)
-        else:
+        # Новый контакт сервер пришлет изменением списка контактов
+        if not self.is_success(response_model):
             self.ui.show_error(response_model.error)
 
     def result_delete_contact(
@@ -64,11 +62,7 @@ class ClientUIResponseHandler(BaseResponseHandler):
         request_model: jim.MessageDeleteContact,
         response_model: jim.MessageAlert | jim.MessageError,
     ):
-        success = self.is_success(response_model)
-        if success:
-            target_user = request_model.target_user
-            self.ui.delete_contact_and_render(target_user)
-        else:
+        if not self.is_success(response_model):
             self.ui.show_error(response_model.error)
 
     def result_join_room(
@@ -106,6 +100,14 @@ class ClientUIResponseHandler(BaseResponseHandler):
     def result_probe(self, *args, **kwargs):
         pass
 
+    def result_contact_presence(
+        self,
+        request_model: None,
+        response_model: jim.MessageContactPresence
+    ):
+        # Набор контактов в сети уже обновил обработчик клиента
+        self.ui.rerender_contacts()
+
     def result_message(
         self,
         request_model: None,
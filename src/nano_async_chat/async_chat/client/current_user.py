@@ -10,6 +10,10 @@ class User:
     is_entered: bool = False
     room: str = DEFAULT_ROOM
     contacts: list[str] = field(default_factory=list)
+    # Версия списка контактов на сервере, None - списка еще нет
+    contacts_version: int | None = None
+    # Имена контактов, которые сейчас в сети
+    online_contacts: set[str] = field(default_factory=set)
     try_login: bool = False
     token: str = ''
 
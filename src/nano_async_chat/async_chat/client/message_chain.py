@@ -1,64 +1,99 @@
 """Хранилище цепочек сообщений
 
 Позволяет узнать к какому запросу клиента пришел ответ от сервера.
-Реализация основанна на самоотчищающемся словаре"""
-from collections import UserDict
-import datetime as dt
-from typing import Hashable
+Реализация основанна на самоотчищающемся словаре: запись живет timeout
+секунд с момента добавления, а при превышении max_size вытесняется
+запись, к которой дольше всего не обращались.
+
+Сроки лежат в очереди в порядке добавления, поэтому при каждой вставке
+удаляются только истекшие записи из ее начала. Записи очереди для
+перезаписанных и вытесненных ключей пропускаются, а когда их становится
+слишком много, очередь пересобирается."""
+import time
+from collections import OrderedDict, deque
+from collections.abc import MutableMapping
+from typing import Any, Callable, Hashable
 from pydantic import BaseModel
 
 
-class AutoCleaningDict(UserDict):
-    def __init__(self, timeout=180):
-        self.timeout = dt.timedelta(seconds=timeout)
-        self.timer: dict[Hashable, dt.datetime] = {}
-        super().__init__()
-
-    def __delitem__(self, key):
-        super().__delitem__(key)
-
-    def __contains__(self, key: object) -> bool:
-        self.clean_key(key)
-        return super().__contains__(key)
-
-    def __setitem__(self, key, value):
-        self.timer[key] = dt.datetime.now()
-        super().__setitem__(key, value)
+class AutoCleaningDict(MutableMapping):
+    def __init__(
+        self,
+        timeout: float = 180,
+        max_size: int = 10000,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.clock = clock
+        # Порядок словаря - порядок обращений, последний - самый свежий
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._expiry: deque[tuple[float, Hashable]] = deque()
+        self.expired = 0
+        self.evicted = 0
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        now = self.clock()
+        self.clean_keys(now)
+        deadline = now + self.timeout
+        self._data[key] = (deadline, value)
+        self._data.move_to_end(key)
+        self._expiry.append((deadline, key))
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evicted += 1
+        if len(self._expiry) > 2 * self.max_size:
+            self._compact()
+
+    def __getitem__(self, key: Hashable) -> Any:
+        deadline, value = self._data[key]
+        if deadline <= self.clock():
+            del self._data[key]
+            self.expired += 1
+            raise KeyError(key)
+        self._data.move_to_end(key)
+        return value
+
+    def __delitem__(self, key: Hashable) -> None:
+        # Запись в очереди сроков станет устаревшей и будет пропущена
+        del self._data[key]
 
     def __iter__(self):
-        for key in list(super().__iter__()):
-            self.clean_key(key)
-            yield key
-
-    def keys(self):
         self.clean_keys()
-        return self.keys()
-
-    def is_key_expired(self, key):
-        return dt.datetime.now() - self.timer[key] > self.timeout
+        return iter(list(self._data))
 
-    def clean_key(self, key):
-        try:
-            if (self.is_key_expired(key)):
-                super().__delitem__(key)
-        except KeyError:
-            pass
-
-    def clean_keys(self):
-        for key in list(super().keys()):
-            self.clean_key(key)
-
-    def __getitem__(self, key):
-        self.clean_key(key)
-        return super().__getitem__(key)
-
-    def get_data(self):
-        for key in list(self.data):
-            self.clean_key(key)
-        return self.data
+    def __len__(self) -> int:
+        self.clean_keys()
+        return len(self._data)
+
+    def clean_keys(self, now: float | None = None) -> None:
+        now = self.clock() if now is None else now
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            deadline, key = expiry.popleft()
+            entry = self._data.get(key)
+            if entry and entry[0] == deadline:
+                del self._data[key]
+                self.expired += 1
+
+    def _compact(self) -> None:
+        self._expiry = deque(sorted(
+            ((deadline, key) for key, (deadline, _) in self._data.items()),
+            key=lambda item: item[0]
+        ))
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'size': len(self._data),
+            'expiry_queue': len(self._expiry),
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
 
     def __repr__(self):
-        return f"{type(self).__name__}({self.get_data()})"
+        self.clean_keys()
+        data = {key: value for key, (_, value) in self._data.items()}
+        return f"{type(self).__name__}({data})"
 
 
 messages_chain: dict[str, BaseModel] = AutoCleaningDict()
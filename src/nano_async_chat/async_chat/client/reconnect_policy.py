@@ -0,0 +1,79 @@
+"""Политика переподключения клиента к серверу
+
+Пауза перед попыткой растет экспоненциально от base_delay до max_delay
+и выбирается случайно от нуля до этой границы (полный джиттер), поэтому
+клиенты, потерявшие связь одновременно, например при перезапуске
+сервера, возвращаются постепенно, а не все разом.
+
+Счетчик попыток сбрасывается, только если соединение продержалось
+reset_after секунд: сервер, который принимает подключения и сразу их
+рвет, не должен возвращать клиентов к самым коротким паузам."""
+import time
+import random
+from typing import Callable
+
+# Больший показатель уже не меняет паузу, а степень может переполниться
+MAX_EXPONENT = 64
+
+
+class ReconnectPolicy:
+    def __init__(
+        self,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+        multiplier: float = 2.0,
+        reset_after: float = 10.0,
+        random_: Callable[[], float] = random.random,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.reset_after = reset_after
+        self.random = random_
+        self.clock = clock
+        # Попыток подряд с последнего устойчивого соединения
+        self.attempts = 0
+        self.connected_at: float | None = None
+        self.last_delay = 0.0
+        self.total_delay = 0.0
+        self.connects = 0
+        self.failures = 0
+        self.disconnects = 0
+
+    def get_ceiling(self) -> float:
+        exponent = min(self.attempts, MAX_EXPONENT)
+        return min(
+            self.max_delay, self.base_delay * self.multiplier ** exponent
+        )
+
+    def next_delay(self) -> float:
+        delay = self.random() * self.get_ceiling()
+        self.attempts += 1
+        self.last_delay = delay
+        self.total_delay += delay
+        return delay
+
+    def on_connected(self) -> None:
+        self.connects += 1
+        self.connected_at = self.clock()
+
+    def on_failure(self) -> None:
+        self.failures += 1
+
+    def on_disconnected(self) -> None:
+        self.disconnects += 1
+        if (self.connected_at is not None
+                and self.clock() - self.connected_at >= self.reset_after):
+            self.attempts = 0
+        self.connected_at = None
+
+    def get_stats(self) -> dict[str, float]:
+        return {
+            'attempts': self.attempts,
+            'connects': self.connects,
+            'failures': self.failures,
+            'disconnects': self.disconnects,
+            'last_delay': self.last_delay,
+            'total_delay': self.total_delay,
+        }
@@ -0,0 +1,144 @@
+"""Кодек кадров протокола чата
+
+Кадр состоит из заголовка длины в 4 шестнадцатеричных цифры и тела.
+Декодер хранит буфер приема соединения: за один вызов recv_into забирает
+все, что успело прийти в ядро, отдает все полные кадры из буфера,
+а неполный кадр сохраняет до следующего чтения.
+
+Исходящий буфер копит готовые кадры соединения и отправляет их
+одним вызовом sendmsg, помня, сколько байт кадра уже ушло в сокет."""
+import os
+import re
+from collections import deque
+from itertools import islice
+from typing import Any, Protocol
+
+HEAD_SIZE = 4
+MAX_FRAME_SIZE = 16 ** HEAD_SIZE - 1
+RECEIVE_SIZE = 65536
+# int(..., 16) принял бы и '-004', ' +04', '0x04'
+HEAD_PATTERN = re.compile(rb'[0-9a-fA-F]{%d}' % HEAD_SIZE)
+IOV_MAX = (
+    os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+)
+
+
+class FrameError(Exception):
+    pass
+
+
+class SupportsRecvInto(Protocol):
+    def recv_into(self, buffer: memoryview) -> int:
+        ...
+
+
+def encode_frame(data: bytes) -> bytes:
+    length = len(data)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(
+            f'frame size {length} is bigger than {MAX_FRAME_SIZE}'
+        )
+    return b'%04x' % length + data
+
+
+class FrameDecoder:
+    def __init__(self, receive_size: int = RECEIVE_SIZE):
+        self._buffer = bytearray()
+        self._chunk_view = memoryview(bytearray(receive_size))
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+
+    def recv_into(self, sock: SupportsRecvInto) -> int:
+        """Читает из блокирующего сокета, 0 означает закрытое соединение"""
+        nbytes = sock.recv_into(self._chunk_view)
+        self._buffer += self._chunk_view[:nbytes]
+        return nbytes
+
+    async def receive_into(self, sock) -> int:
+        """То же, что recv_into, для сокетов trio"""
+        nbytes = await sock.recv_into(self._chunk_view)
+        self._buffer += self._chunk_view[:nbytes]
+        return nbytes
+
+    def pop_frames(self) -> list[bytes]:
+        buffer = self._buffer
+        end = len(buffer)
+        offset = 0
+        frames = []
+        while end - offset >= HEAD_SIZE:
+            head = bytes(buffer[offset:offset + HEAD_SIZE])
+            if not HEAD_PATTERN.fullmatch(head):
+                raise FrameError(f'bad frame head {head!r}')
+            size = int(head, 16)
+            start = offset + HEAD_SIZE
+            if end - start < size:
+                break
+            frames.append(bytes(buffer[start:start + size]))
+            offset = start + size
+        if offset:
+            del buffer[:offset]
+        return frames
+
+
+class SendBuffer:
+    def __init__(self):
+        # Пары [еще не отправленная часть кадра, исходное сообщение]
+        self._entries: deque[list[memoryview | Any]] = deque()
+        self._size = 0
+        self.would_block = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, frame: bytes, message: Any = None) -> None:
+        self._entries.append([memoryview(frame), message])
+        self._size += len(frame)
+
+    def pending_messages(self) -> list[Any]:
+        """Сообщения, кадры которых не ушли в сокет целиком
+
+        Служебные кадры без сообщения, например номер, пропускаются"""
+        return [
+            message for _, message in self._entries if message is not None
+        ]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def send(self, sock) -> int:
+        """Отправляет накопленные кадры одним системным вызовом
+
+        would_block выставляется, если сокет принял не все данные"""
+        self.would_block = False
+        if not self._entries:
+            return 0
+        buffers = [
+            view for view, _ in islice(self._entries, IOV_MAX)
+        ]
+        try:
+            if hasattr(sock, 'sendmsg'):
+                sent = sock.sendmsg(buffers)
+            else:
+                sent = sock.send(b''.join(buffers))
+        except (BlockingIOError, InterruptedError):
+            self.would_block = True
+            return 0
+        self._consume(sent)
+        self.would_block = bool(self._entries)
+        return sent
+
+    def _consume(self, sent: int) -> None:
+        self._size -= sent
+        while sent:
+            entry = self._entries[0]
+            view = entry[0]
+            if sent < len(view):
+                entry[0] = view[sent:]
+                return
+            sent -= len(view)
+            self._entries.popleft()
@@ -9,6 +9,8 @@ from .client_schemas import (
     MessageGetContacts,
     MessageAddContact,
     MessageDeleteContact,
+    MessageSessionKey,
+    MessageSessionResume,
     ClientActions,
     Statuses
 )
@@ -17,6 +19,7 @@ from .server_schemas import (
     MessageError,
     MessageProbe,
     MessageContacts,
+    MessageContactPresence,
     MessageToken,
     ServerActions,
     StatusCodes,
@@ -36,12 +39,15 @@ __all__ = [
     'MessageGetContacts',
     'MessageAddContact',
     'MessageDeleteContact',
+    'MessageSessionKey',
+    'MessageSessionResume',
     'ClientActions',
     'Statuses',
     'MessageAlert',
     'MessageError',
     'MessageProbe',
     'MessageContacts',
+    'MessageContactPresence',
     'ServerActions',
     'StatusCodes',
     'ServerMessageType',
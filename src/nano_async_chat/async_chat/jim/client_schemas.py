@@ -13,6 +13,8 @@ class ClientActions(str, Enum):
     get_contacts = 'get_contacts'
     add_contact = 'add_contact'
     del_contact = 'del_contact'
+    session_key = 'session_key'
+    resume = 'resume'
 
 
 class Statuses(str, Enum):
@@ -75,6 +77,8 @@ class MessageGetContacts(ActionTimeBase):
     action: str = Field(ClientActions.get_contacts.value, const=True)
     user: UserBase
     token: str
+    # Версия списка, который уже есть у клиента: придут только изменения
+    since_version: int | None = Field(None, ge=0)
 
 
 class MessageAddContact(ActionTimeBase):
@@ -89,3 +93,17 @@ class MessageDeleteContact(ActionTimeBase):
     target_user: UserBase
     user: UserBase
     token: str
+
+
+class MessageSessionKey(ActionTimeBase):
+    action: str = Field(ClientActions.session_key.value, const=True)
+    key: str
+
+
+class MessageSessionResume(ActionTimeBase):
+    action: str = Field(ClientActions.resume.value, const=True)
+    user: UserBase
+    token: str
+    # Номер последнего полученного сообщения чата
+    last_seq: int = Field(0, ge=0)
+    room: str | None = None
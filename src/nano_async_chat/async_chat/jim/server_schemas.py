@@ -6,6 +6,7 @@ from pydantic import Field
 class ServerActions(str, Enum):
     probe = 'probe'
     token = 'Bearer'
+    presence = 'presence'
 
 
 class ServerMessageType(str, Enum):
@@ -24,7 +25,8 @@ class StatusCodes(int, Enum):
     HTTP_403_FORBIDDEN = 403
     HTTP_404_NOT_FOUND = 404
     HTTP_409_CONFLICT = 409
-    HTTP_410_GONE = 409
+    HTTP_410_GONE = 410
+    HTTP_503_SERVICE_UNAVAILABLE = 503
 
 
 class RequestResponseBase(TimeBase):
@@ -44,7 +46,20 @@ class MessageProbe(ActionTimeBase):
 
 
 class MessageContacts(MessageAlert):
+    # Без since_version alert - весь список, иначе изменения после этой
+    # версии: alert - добавленные контакты, removed - удаленные
     alert: list[UserBase]
+    removed: list[UserBase] = Field(default_factory=list)
+    # Контакты из alert, которые сейчас в сети
+    online: list[UserBase] = Field(default_factory=list)
+    version: int | None = None
+    since_version: int | None = None
+
+
+class MessageContactPresence(ActionTimeBase):
+    action: str = Field(ServerActions.presence.value, const=True)
+    user: UserBase
+    online: bool
 
 
 class MessageToken(RequestResponseBase):
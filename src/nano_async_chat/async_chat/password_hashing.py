@@ -0,0 +1,16 @@
+"""Хеширование и проверка паролей bcrypt
+
+Модуль импортирует только passlib: его функции выполняются в процессах
+PasswordVerifier, и дочерний процесс не должен загружать пакет сервера
+вместе с базой данных."""
+from passlib.context import CryptContext
+
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
@@ -3,8 +3,10 @@
 В данном пакете реализован асинхронных сервер чата."""
 
 from .server import ServerChat
+from .trio_server import TrioServerChat
 
 
 __all__ = [
-    'ServerChat'
+    'ServerChat',
+    'TrioServerChat'
 ]
@@ -3,6 +3,8 @@ import sys
 from pathlib import Path
 from PySide6 import QtWidgets, QtCore, QtUiTools
 from ..admin_ui.paginator import Paginator
+from ..admin_ui.server_ui_talk import client_ui_talk
+from ..presence import PresenceEvent
 
 
 class ItemList:
@@ -14,6 +16,9 @@ class ItemList:
         }
     ]
     title = ''
+    # Период перечитывания из базы в мс для данных, о которых нет событий,
+    # вход и выход перерисовываются по событиям присутствия
+    reload_interval: int | None = None
     ui_path = Path(__file__).resolve().parent / 'item_list.ui'
 
     def __init__(
@@ -39,13 +44,56 @@ class ItemList:
         self.nextPageButton.clicked.connect(self.render_next)
         self.previousPageButton.clicked.connect(self.render_previous)
         self.onlyOnlineButton.stateChanged.connect(self.render_only_online)
+        self._presence_changed = False
+        self._unknown_user = False
+        self._presence = None
+        self._timer = None
 
     def show(self):
-        self._timer = QtCore.QTimer()
-        self._timer.timeout.connect(self.reload)
-        self._timer.start(1000)
+        if self.reload_interval and not self._timer:
+            self._timer = QtCore.QTimer()
+            self._timer.timeout.connect(self.reload)
+            self._timer.start(self.reload_interval)
+        self.subscribe_presence()
         self.parent.show()
 
+    def subscribe_presence(self) -> None:
+        # Окно открывают много раз, подписка нужна одна на сервис
+        presence = client_ui_talk.get_presence()
+        if presence is self._presence:
+            return
+        if self._presence:
+            self._presence.unsubscribe(self.on_presence_changed)
+        if presence:
+            presence.subscribe(self.on_presence_changed)
+        self._presence = presence
+
+    def is_online(self, item) -> bool:
+        presence = client_ui_talk.get_presence()
+        if presence:
+            return presence.is_online(item.id)
+        return item.is_online()
+
+    def on_presence_changed(self, event: PresenceEvent) -> None:
+        if not any(
+            item.id == event.user_id for item in self.paginator.items_origin
+        ):
+            # Вошел пользователь, зарегистрированный после загрузки окна
+            self._unknown_user = True
+        # Пачку событий, например при перезапуске клиентов, рисуем один раз
+        if not self._presence_changed:
+            self._presence_changed = True
+            QtCore.QTimer.singleShot(200, self.render_presence)
+
+    def render_presence(self) -> None:
+        self._presence_changed = False
+        if self._unknown_user:
+            self._unknown_user = False
+            self.reload()
+            return
+        self.paginator.reload_items(self.paginator.items_origin)
+        self.render_curent_page()
+
     def init_table(self):
         self.itemTableWidget.setColumnCount(len(self.__class__.colums))
         labels = [col['label'] for col in self.__class__.colums]
@@ -108,7 +156,7 @@ class ItemList:
     def render_only_online(self, arg__1):
         if arg__1 > 0:
             self.paginator.apply_filter(
-                lambda items: [i for i in items if i.is_online()]
+                lambda items: [i for i in items if self.is_online(i)]
             )
         else:
             self.paginator.reset_filter()
@@ -1,3 +1,4 @@
+import argparse
 import signal
 import sys
 import traceback
@@ -13,6 +14,7 @@ from ..admin_ui.user_list import UserList
 from ..admin_ui.user_list_stat import UserListStat
 from ..admin_ui.server_ui_talk import client_ui_talk
 from ..server import ServerChat
+from ... import settings
 
 
 @dataclass
@@ -21,6 +23,7 @@ class ServerConfig:
     password_db: str
     server_port: int
     server_max_users: int
+    idle_timeout: float | None = settings.IDLE_TIMEOUT
 
 
 class MainWindowContol:
@@ -31,6 +34,7 @@ class MainWindowContol:
         parent: QtWidgets.QMainWindow,
     ):
         self.parent = parent
+        self.idle_timeout = settings.IDLE_TIMEOUT
 
         self.loginDb: QtWidgets.QLineEdit = parent.loginDb
         self.passwordDb: QtWidgets.QLineEdit = parent.passwordDb
@@ -81,6 +85,25 @@ class MainWindowContol:
         else:
             self.set_db_status('Не подключены к бд', 'red')
 
+        outbox = server_status.get('outbox')
+        if outbox:
+            self.render_outbox_stats(outbox)
+
+    def render_outbox_stats(self, outbox: dict[str, Any]):
+        lines = [
+            f"Очереди: {outbox['messages']} сообщений, "
+            f"{outbox['bytes'] // 1024} КБ, "
+            f"отброшено {outbox['dropped']}, "
+            f"отключено {outbox['disconnected']}"
+        ]
+        for item in outbox['largest']:
+            lines.append(
+                f"{item['target']}: {item['messages']} / "
+                f"{item['bytes'] // 1024} КБ, "
+                f"пик {item['high_water_bytes'] // 1024} КБ"
+            )
+        self.serverStatus.setToolTip('\n'.join(lines))
+
     def get_config(self) -> ServerConfig:
         login_db = self.loginDb.text()
         password_db = self.passwordDb.text()
@@ -90,7 +113,8 @@ class MainWindowContol:
             login_db=login_db,
             password_db=password_db,
             server_port=server_port,
-            server_max_users=server_max_users
+            server_max_users=server_max_users,
+            idle_timeout=self.idle_timeout
         )
         return config_dto
 
@@ -212,7 +236,8 @@ async def start_server():
     if server_config_dto:
         server_chat = ServerChat(
             port=server_config_dto.server_port,
-            max_users=server_config_dto.server_max_users
+            max_users=server_config_dto.server_max_users,
+            idle_timeout=server_config_dto.idle_timeout
         )
         client_ui_talk.put_client(server_chat)
         await server_chat.run()
@@ -223,10 +248,24 @@ async def async_task_creator():
         nursery.start_soon(start_server)
 
 
+def parse_args() -> tuple[argparse.Namespace, list[str]]:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--idle-timeout',
+        type=float,
+        default=settings.IDLE_TIMEOUT or 0,
+        help='отключать клиентов без запросов дольше стольких секунд, '
+             '0 - не отключать'
+    )
+    return parser.parse_known_args()
+
+
 def main():
-    app = QApplication(sys.argv)
+    args, qt_args = parse_args()
+    app = QApplication([sys.argv[0], *qt_args])
     async_helper = AsyncHelper()
     main_window = MainWindowContol.start_widget(async_helper.trigger_signal)
+    main_window.idle_timeout = args.idle_timeout or None
     client_ui_talk.put_window(main_window)
 
     async_helper.set_entry(async_task_creator)
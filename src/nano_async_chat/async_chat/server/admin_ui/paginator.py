@@ -21,9 +21,11 @@ class Paginator:
             self.apply_filter(self.filter_)
 
     def apply_filter(self, filter: Callable[[], None]) -> None:
-        self.items = filter(self.items)
+        self.filter_ = filter
+        self.items = filter(self.items_origin)
 
     def reset_filter(self) -> None:
+        self.filter_ = None
         self.items = self.items_origin
 
     def is_it_first_page(self) -> bool:
@@ -3,13 +3,14 @@ import typing
 if typing.TYPE_CHECKING:
     from ..server.admin_ui.main import MainWindowContol, ServerConfig
     from ..server import ServerChat
+    from ..server.presence import PresenceService
 
 
 class ServerUiTalk:
     def __init__(self):
         self.server_config: ServerConfig | None = None
         self.main_window_control: MainWindowContol | None = None
-        self.chat_server: ServerChat | None = None
+        self.server_chat: ServerChat | None = None
 
     def put_window(self, main_window_control: 'MainWindowContol') -> None:
         self.main_window_control = main_window_control
@@ -27,9 +28,18 @@ class ServerUiTalk:
         if self.server_chat:
             return {
                 'database_connected': self.server_chat.database_connected,
-                'socket_connected': self.server_chat.socket_connected
+                'socket_connected': self.server_chat.socket_connected,
+                'outbox': self.server_chat.clients.users_messages.get_stats(),
+                'replay': self.server_chat.clients.users_messages.replay.get_stats(),
+                'contacts': self.server_chat.contacts_log.get_stats(),
+                'presence': self.server_chat.presence.get_stats()
             }
         return None
 
+    def get_presence(self) -> 'PresenceService | None':
+        if self.server_chat:
+            return self.server_chat.presence
+        return None
+
 
 client_ui_talk = ServerUiTalk()
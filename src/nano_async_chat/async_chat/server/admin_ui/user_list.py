@@ -25,7 +25,9 @@ class UserList(ItemList):
     title = 'Пользователи'
 
     def get_columns_data(self, item: User) -> dict[str, str]:
-        return item.__dict__
+        result = dict(item.__dict__)
+        result['has_entered'] = self.is_online(item)
+        return result
 
     def get_queryset(self) -> list[object]:
         with SessionLocal() as session:
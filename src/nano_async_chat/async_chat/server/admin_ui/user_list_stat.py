@@ -1,6 +1,7 @@
 """Класс окна со списком статистики пользователей"""
-from ..user_service import UserService
-from ..db import SessionLocal, User
+from dataclasses import asdict
+from ..user_service import UserService, UserStat
+from ..db import SessionLocal
 from ..admin_ui.item_list import ItemList
 
 
@@ -38,22 +39,16 @@ class UserListStat(ItemList):
         },
     ]
     title = 'Статистика'
+    # Число и время сообщений меняются без событий присутствия
+    reload_interval = 5000
 
-    def get_columns_data(self, user: User) -> dict[str, str]:
-        with SessionLocal() as session:
-            session.add(user)
-
-            result = user.__dict__
-            result['last_login_time'] = user.last_login
-            result['last_message_time'] = user.last_send_message
-            user_service = UserService(session)
-            result['send_messages_count'] = (
-                user_service.get_user_send_messages_count(user)
-            )
-            return result
+    def get_columns_data(self, user: UserStat) -> dict[str, str]:
+        # Все столбцы уже посчитаны в get_queryset, база не нужна
+        result = asdict(user)
+        result['has_entered'] = self.is_online(user)
+        return result
 
-    def get_queryset(self) -> list[object]:
+    def get_queryset(self) -> list[UserStat]:
+        # Один запрос на обновление окна при любом размере страницы
         with SessionLocal() as session:
-            user_service = UserService(session)
-            users = user_service.get_users()
-        return users
+            return UserService(session).get_users_stats()
@@ -1,15 +1,15 @@
 """Модуль миксина аутентификации пользователя"""
 
-from passlib.context import CryptContext
+from .. import password_hashing
 
 
 class AuthMixin:
-    pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+    pwd_context = password_hashing.pwd_context
 
     @classmethod
     def verify_password(cls, plain_password: str, hashed_password: str):
-        return cls.pwd_context.verify(plain_password, hashed_password)
+        return password_hashing.verify_password(plain_password, hashed_password)
 
     @classmethod
     def get_password_hash(cls, password: str) -> str:
-        return cls.pwd_context.hash(password)
+        return password_hashing.get_password_hash(password)
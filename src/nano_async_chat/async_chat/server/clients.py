@@ -1,76 +1,253 @@
 """Модуль структуры хранящей текущих клиентов и их очередей сообщений"""
 import socket
+import logging
+from typing import Any, Callable
 from dataclasses import dataclass, field
-from collections import defaultdict, deque
-import datetime as dt
-from ..server import db
-from ..server.user_service import UserService
+from collections import defaultdict
+import trio
+from ..frame_codec import FrameDecoder, SendBuffer
+from ..settings import DEFAULT_ROOM
+from ..utils import SessionCipher
+from ..server.presence import PresenceService
+from ..server.utils_auth import token_cache
+from ..server.outbox import Outbox, OutboxLimits, QueueMessage, SequencedMessage
+from ..server.replay_log import ReplayLog
+
+logger = logging.getLogger('server-logger')
 
 
 @dataclass
 class UsersMessages:
-    _users_messages_queue: dict[int, deque[str]] = field(
-        default_factory=lambda: defaultdict(deque)
-    )
-    _socket_messages_queue: dict[socket.socket, deque[str]] = field(
-        default_factory=lambda: defaultdict(deque)
+    """Очереди исходящих сообщений по пользователям и сокетам"""
+    limits: OutboxLimits = field(default_factory=OutboxLimits)
+    _users_messages_queue: dict[int, Outbox] = field(default_factory=dict)
+    _socket_messages_queue: dict[socket.socket, Outbox] = field(
+        default_factory=dict
     )
+    # Вызывается при появлении нового сообщения в очереди адресата
+    listener: Callable[[int | socket.socket], None] | None = None
+    # Вызывается, если очередь адресата переполнена при политике disconnect
+    overflow_listener: Callable[[int | socket.socket], None] | None = None
+    # Нумерует сообщения чата пользователям для возобновления сессии
+    replay: ReplayLog = field(default_factory=ReplayLog)
+    # Общий объем всех очередей
+    total_messages: int = 0
+    total_bytes: int = 0
+    dropped: int = 0
+    disconnected: int = 0
 
-    def get_all_messages_from_queue(self, target: int | socket.socket):
-        messages = []
-        try:
-            while True:
-                messages.append(self.get_message_from_queue(target))
-        except IndexError:
-            return messages
+    def get_all_messages_from_queue(self, target: int | socket.socket) -> list[QueueMessage]:
+        messages_queue = self.get_queue_for_target(target, create=False)
+        if not messages_queue:
+            return []
+        self.total_messages -= len(messages_queue)
+        self.total_bytes -= messages_queue.size
+        return messages_queue.take_all()
 
-    def get_message_from_queue(self, target: int | socket.socket) -> str:
-        messages_queue = self.get_queue_for_target(target)
-        try:
-            return messages_queue.popleft()
-        except IndexError:
+    def get_message_from_queue(self, target: int | socket.socket) -> QueueMessage:
+        messages_queue = self.get_queue_for_target(target, create=False)
+        if not messages_queue:
             return None
+        message = messages_queue.popleft()
+        self.total_messages -= 1
+        self.total_bytes -= len(message)
+        return message
+
+    def take_messages_from_queue(self, target: int | socket.socket, max_messages: int) -> list[QueueMessage]:
+        """Забирает пачку сообщений, служебные раньше сообщений чата"""
+        messages_queue = self.get_queue_for_target(target, create=False)
+        if not messages_queue:
+            return []
+        size, count = messages_queue.size, len(messages_queue)
+        messages = messages_queue.take_batch(max_messages)
+        self.total_messages -= count - len(messages_queue)
+        self.total_bytes -= size - messages_queue.size
+        return messages
+
+    def take_bulk_messages(self) -> dict[int, list[QueueMessage]]:
+        """Забирает сообщения чата из очередей всех пользователей"""
+        messages = {}
+        for user_id, messages_queue in self._users_messages_queue.items():
+            size, count = messages_queue.size, len(messages_queue)
+            bulk = messages_queue.take_bulk()
+            self.total_messages -= count - len(messages_queue)
+            self.total_bytes -= size - messages_queue.size
+            if bulk:
+                messages[user_id] = bulk
+        return messages
 
-    def put_message_to_queue(self, target: int | socket.socket, message: str) -> None:
+    def put_message_to_queue(
+        self,
+        target: int | socket.socket,
+        message: QueueMessage,
+        bulk: bool = False
+    ) -> None:
+        """bulk отправляет сообщение в полосу чата за служебными"""
+        if bulk and isinstance(target, int):
+            message = self.replay.push(target, message)
         messages_queue = self.get_queue_for_target(target)
-        messages_queue.append(message)
+        self._change_queue(
+            target,
+            messages_queue,
+            lambda: messages_queue.append(message, bulk=bulk)
+        )
+        self.notify(target)
 
-    def put_back_message_to_queue(self, target: int | socket.socket, message: str) -> None:
+    def put_back_message_to_queue(self, target: int | socket.socket, message: QueueMessage) -> None:
         messages_queue = self.get_queue_for_target(target)
-        messages_queue.appendleft(message)
+        self._change_queue(
+            target, messages_queue, lambda: messages_queue.appendleft(message)
+        )
+        self.notify(target)
+
+    def resume_messages(self, user_id: int, last_seq: int) -> int | None:
+        """Ставит в начало очереди сообщения, отправленные после last_seq
+
+        Сообщения, которые еще лежат в очереди, уйдут обычным порядком.
+        Возвращает число повторенных сообщений или None, если часть
+        сообщений после last_seq уже не сохранилась"""
+        ring = self.replay.get(user_id)
+        if not ring or not ring.can_resume(last_seq):
+            self.replay.rejected += 1
+            return None
+        messages_queue = self.get_queue_for_target(user_id)
+        queued_seq = next(
+            (
+                message.seq for message in messages_queue
+                if isinstance(message, SequencedMessage)
+            ),
+            None
+        )
+        messages = ring.take_since(last_seq, before_seq=queued_seq)
+
+        def put_back() -> int:
+            return sum(
+                messages_queue.appendleft(message)
+                for message in reversed(messages)
+            )
+
+        self._change_queue(user_id, messages_queue, put_back)
+        self.replay.resumed += 1
+        self.replay.replayed += len(messages)
+        if messages:
+            self.notify(user_id)
+        return len(messages)
 
-    def get_queue_for_target(self, target: int | socket.socket) -> deque:
+    def _change_queue(
+        self,
+        target: int | socket.socket,
+        messages_queue: Outbox,
+        change: Callable[[], int]
+    ) -> None:
+        size, count = messages_queue.size, len(messages_queue)
+        self.dropped += change()
+        if messages_queue.is_overflowed():
+            # Политика disconnect: очередь сбрасывается, клиента отключают
+            self.dropped += messages_queue.clear()
+            self.disconnected += 1
+            logger.warning(
+                'Очередь %s переполнена, клиент будет отключен', target
+            )
+            if self.overflow_listener:
+                self.overflow_listener(target)
+        self.total_messages += len(messages_queue) - count
+        self.total_bytes += messages_queue.size - size
+
+    def notify(self, target: int | socket.socket) -> None:
+        if self.listener:
+            self.listener(target)
+
+    def get_queue_for_target(self, target: int | socket.socket, create: bool = True) -> Outbox | None:
         if isinstance(target, int):
-            sock: socket.socket = target
-            messages_queue = self._socket_messages_queue[sock]
+            queues = self._users_messages_queue
         else:
-            user_id: int = target
-            messages_queue = self._socket_messages_queue[user_id]
+            queues = self._socket_messages_queue
+        messages_queue = queues.get(target)
+        if messages_queue is None and create:
+            messages_queue = queues[target] = Outbox(self.limits)
         return messages_queue
 
-    def _remove_closed_sockets(self):
-        for sock in self._socket_messages_queue:
-            if sock._closed:
-                del self._socket_messages_queue[sock]
+    def discard(self, target: int | socket.socket) -> None:
+        """Удаляет очередь адресата вместе с сообщениями"""
+        if isinstance(target, int):
+            messages_queue = self._users_messages_queue.pop(target, None)
+        else:
+            messages_queue = self._socket_messages_queue.pop(target, None)
+        if messages_queue:
+            self.total_messages -= len(messages_queue)
+            self.total_bytes -= messages_queue.size
+
+    def get_stats(self, top: int = 10) -> dict[str, Any]:
+        """Общий объем очередей и самые большие очереди по пику объема"""
+        queues = [
+            (f'user {target}', messages_queue)
+            for target, messages_queue in self._users_messages_queue.items()
+        ] + [
+            (f'socket {target.fileno()}', messages_queue)
+            for target, messages_queue in self._socket_messages_queue.items()
+        ]
+        queues.sort(key=lambda item: item[1].high_water_bytes, reverse=True)
+        return {
+            'messages': self.total_messages,
+            'bytes': self.total_bytes,
+            'dropped': self.dropped,
+            'disconnected': self.disconnected,
+            'largest': [
+                {
+                    'target': name,
+                    'messages': len(messages_queue),
+                    'bulk': messages_queue.bulk_count,
+                    'bytes': messages_queue.size,
+                    'high_water_messages': messages_queue.high_water_messages,
+                    'high_water_bytes': messages_queue.high_water_bytes,
+                    'dropped': messages_queue.dropped,
+                }
+                for name, messages_queue in queues[:top]
+            ],
+        }
 
 
 @dataclass
 class Client:
     socket: socket.socket
     user_id: int | None = None
-    time: dt.datetime = field(default_factory=dt.datetime.now)
+    account_name: str | None = None
+    fileno: int | None = None
+    # Время последней активности по часам планировщика проверок
+    last_activity: float = field(default=0.0, repr=False)
+    last_received: float = field(default=0.0, repr=False)
+    heartbeat_token: int | None = field(default=None, repr=False)
+    decoder: FrameDecoder = field(default_factory=FrameDecoder, repr=False)
+    send_buffer: SendBuffer = field(default_factory=SendBuffer, repr=False)
+    request_lock: trio.Lock = field(default_factory=trio.Lock, repr=False)
+    cipher: SessionCipher | None = field(default=None, repr=False)
+    # Будит задачу отправки клиента, если движок сервера ее использует
+    wakeup: Callable[[], None] | None = field(default=None, repr=False)
 
 
 class Clients:
+    """Текущие подключения с индексами по сокету, fileno, user_id и имени"""
+
     def __init__(self):
-        self.all_clients: list[Client] = []
+        self._by_socket: dict[socket.socket, Client] = {}
+        self._by_fileno: dict[int, Client] = {}
+        self._by_user_id: dict[int, Client] = {}
+        self._by_account_name: dict[str, Client] = {}
         self.users_messages = UsersMessages()
-        self._rooms: dict[str, dict[int, Client]] = defaultdict(dict)
+        # Участники комнат, в общей комнате состоят все вошедшие
+        self._rooms: dict[str, set[int]] = defaultdict(set)
         self._room_by_user_id: dict[int, str] = {}
-        self.default_room = 'common'
+        # Неизменяемые списки получателей, сбрасываются при смене состава
+        self._room_snapshots: dict[str, frozenset[int]] = {}
+        self.default_room = DEFAULT_ROOM
+        self.presence = PresenceService()
+
+    @property
+    def all_clients(self) -> list[Client]:
+        return list(self._by_socket.values())
 
     def __len__(self) -> int:
-        return len(self.all_clients)
+        return len(self._by_socket)
 
     def get_room_name(self, client: Client):
         if not client.user_id:
@@ -79,80 +256,140 @@ class Clients:
             return self.default_room
         return self._room_by_user_id[client.user_id]
 
+    def _add_to_room(self, user_id: int, room: str) -> None:
+        members = self._rooms[room]
+        if user_id in members:
+            return
+        members.add(user_id)
+        self._room_snapshots.pop(room, None)
+
+    def _remove_from_room(self, user_id: int, room: str) -> None:
+        members = self._rooms.get(room)
+        if not members or user_id not in members:
+            return
+        members.discard(user_id)
+        if not members:
+            del self._rooms[room]
+        self._room_snapshots.pop(room, None)
+
     def _leave_current_room(self, user_id: int) -> None:
-        room = self._room_by_user_id.get(user_id)
+        room = self._room_by_user_id.pop(user_id, None)
         if not room:
             return
-        if room in self._rooms and user_id in self._rooms[room]:
-            del self._rooms[room][user_id]
+        self._remove_from_room(user_id, room)
 
-    def get_users_ids_in_room(self, room: str | None) -> list[int]:
-        if not room or room == self.default_room:
-            return [client.user_id for client in self.all_clients]
-        if room in self._rooms:
-            return list(self._rooms[room].keys())
-        return []
+    def get_users_ids_in_room(self, room: str | None) -> frozenset[int]:
+        room = room or self.default_room
+        snapshot = self._room_snapshots.get(room)
+        if snapshot is None:
+            snapshot = frozenset(self._rooms.get(room, ()))
+            self._room_snapshots[room] = snapshot
+        return snapshot
 
     def join_to_room(self, client: Client, room: str) -> None:
         if not client.user_id:
             raise Exception('No client.user_id')
         self._leave_current_room(client.user_id)
-        self._rooms[room][client.user_id] = client
+        if room == self.default_room:
+            return
+        self._add_to_room(client.user_id, room)
         self._room_by_user_id[client.user_id] = room
 
-    def _find_client_by_socket(self, sock: socket.socket) -> int | None:
-        for i in range(len(self.all_clients)):
-            if self.all_clients[i].socket == sock:
-                return i
+    def leave_room(self, client: Client) -> str:
+        if not client.user_id:
+            raise Exception('No client.user_id')
+        room = self.get_room_name(client)
+        self._leave_current_room(client.user_id)
+        return room
+
+    def get_client_by_socket(self, sock: socket.socket) -> Client | None:
+        return self._by_socket.get(sock)
 
-    def _find_client_by_user_id(self, user_id: int) -> int | None:
-        for i in range(len(self.all_clients)):
-            if self.all_clients[i].user_id == user_id:
-                return i
+    def get_client_by_fileno(self, fileno: int) -> Client | None:
+        return self._by_fileno.get(fileno)
 
-    def get_client_by_socket(self, sock: socket.socket) -> Client:
-        index = self._find_client_by_socket(sock)
-        if index is None:
-            return
-        return self.all_clients[index]
+    def get_client_by_user_id(self, user_id: int) -> Client | None:
+        return self._by_user_id.get(user_id)
+
+    def get_client_by_account_name(self, account_name: str) -> Client | None:
+        return self._by_account_name.get(account_name)
 
     def append(self, client: Client):
-        self.all_clients.append(client)
+        client.fileno = client.socket.fileno()
+        self._by_socket[client.socket] = client
+        self._by_fileno[client.fileno] = client
+        if client.user_id:
+            self.login(client, client.user_id, client.account_name)
+
+    def login(self, client: Client, user_id: int, account_name: str | None) -> None:
+        """Привязывает подключение к вошедшему пользователю"""
+        if client.user_id and client.user_id != user_id:
+            self.logout(client)
+        client.user_id = user_id
+        client.account_name = account_name
+        self._by_user_id[user_id] = client
+        if account_name:
+            self._by_account_name[account_name] = client
+        self._add_to_room(user_id, self.default_room)
+
+    def logout(self, client: Client) -> None:
+        """Отвязывает подключение от пользователя, не закрывая его"""
+        if not client.user_id:
+            return
+        if self._by_user_id.get(client.user_id) is client:
+            del self._by_user_id[client.user_id]
+        if (client.account_name
+                and self._by_account_name.get(client.account_name) is client):
+            del self._by_account_name[client.account_name]
+        self._leave_current_room(client.user_id)
+        self._remove_from_room(client.user_id, self.default_room)
+        client.user_id = None
+        client.account_name = None
 
     def logout_client(self, client: Client):
-        with db.SessionLocal() as session:
-            user_service = UserService(session=session)
-            user_service.logout(client.user_id)
+        user_id = client.user_id
+        account_name = client.account_name
+        if account_name:
+            token_cache.evict_account(account_name)
+        # Пользователь мог уже войти с другого подключения
+        bound_client = self._by_user_id.get(user_id)
+        if bound_client is None or bound_client is client:
+            self.presence.set_offline(user_id)
+            self.users_messages.replay.detach(user_id)
 
     def remove_another_client_with_user(self, user_id: int) -> None:
-        index = self._find_client_by_user_id(user_id)
-        if index is None:
+        client = self._by_user_id.get(user_id)
+        if not client:
             return
-        del self.all_clients[index]
+        self.logout(client)
+        self._forget(client)
+
+    def _forget(self, client: Client) -> None:
+        if self._by_socket.get(client.socket) is client:
+            del self._by_socket[client.socket]
+            self.users_messages.discard(client.socket)
+        if self._by_fileno.get(client.fileno) is client:
+            del self._by_fileno[client.fileno]
 
     def remove(self, obj: Client | socket.socket):
-        if isinstance(obj, socket.socket):
-            index = self._find_client_by_socket(obj)
-            if index is None:
-                return
-            self.all_clients.pop(index)
-        else:
+        if isinstance(obj, Client):
             client = obj
-            self.all_clients.remove(client)
-            if not client.user_id:
-                return
-            self.logout_client(client)
-            room = self._room_by_user_id.get(client.user_id)
-            if not room:
+        else:
+            client = self._by_socket.get(obj)
+            if not client:
                 return
-            self._leave_current_room(client.user_id)
+        self._forget(client)
+        if not client.user_id:
+            return
+        self.logout_client(client)
+        self.logout(client)
 
     def __iter__(self):
-        for client in self.all_clients:
-            yield client.socket
+        for sock in list(self._by_socket):
+            yield sock
 
     def __bool__(self):
-        return bool(self.all_clients)
+        return bool(self._by_socket)
 
     def __str__(self):
         return f'{self.all_clients}'
@@ -0,0 +1,111 @@
+"""Версии списков контактов пользователей
+
+Каждое добавление или удаление контакта получает номер из общего для
+сервера счетчика, и этот номер становится версией списка контактов
+пользователя. Последние изменения каждого пользователя хранятся в
+коротком журнале: клиент, знающий версию N, получает только изменения
+после нее, без запроса к базе. Если журнал N уже не покрывает, клиент
+получает список целиком.
+
+Счетчик начинается с отметки времени запуска сервера в миллисекундах,
+а журнал пользователя, созданный заново после вытеснения, начинается с
+текущего значения счетчика. Поэтому версия пользователя не уменьшается,
+а версия от прошлого процесса не попадает в журнал и приводит к полной
+выдаче списка."""
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+
+@dataclass(slots=True)
+class ContactChange:
+    version: int
+    account_name: str
+    added: bool
+
+
+class ContactsHistory:
+    def __init__(self, version: int, max_changes: int):
+        # Версия, начиная с которой журнал полон
+        self.start_version = version
+        self.version = version
+        self._changes: deque[ContactChange] = deque(maxlen=max_changes)
+
+    def record(self, change: ContactChange) -> None:
+        if len(self._changes) == self._changes.maxlen:
+            self.start_version = self._changes[0].version
+        self._changes.append(change)
+        self.version = change.version
+
+    def changes_since(self, version: int) -> list[ContactChange] | None:
+        if not self.start_version <= version <= self.version:
+            return None
+        return [change for change in self._changes if change.version > version]
+
+
+class ContactsLog:
+    def __init__(
+        self,
+        max_changes: int = 100,
+        max_users: int = 10000,
+        start_version: int | None = None
+    ):
+        self.max_changes = max_changes
+        self.max_users = max_users
+        self._version = (
+            int(time.time() * 1000) if start_version is None else start_version
+        )
+        self._histories: OrderedDict[int, ContactsHistory] = OrderedDict()
+        self.deltas = 0
+        self.full = 0
+
+    def _get_history(self, user_id: int) -> ContactsHistory:
+        history = self._histories.get(user_id)
+        if history:
+            self._histories.move_to_end(user_id)
+            return history
+        history = ContactsHistory(self._version, self.max_changes)
+        self._histories[user_id] = history
+        while len(self._histories) > self.max_users:
+            self._histories.popitem(last=False)
+        return history
+
+    def get_version(self, user_id: int) -> int:
+        return self._get_history(user_id).version
+
+    def record(self, user_id: int, account_name: str, added: bool) -> tuple[int, ContactChange]:
+        """Записывает изменение, возвращает прошлую версию и изменение"""
+        history = self._get_history(user_id)
+        previous_version = history.version
+        self._version += 1
+        change = ContactChange(
+            version=self._version,
+            account_name=account_name,
+            added=added
+        )
+        history.record(change)
+        return previous_version, change
+
+    def changes_since(self, user_id: int, version: int) -> list[ContactChange] | None:
+        changes = self._get_history(user_id).changes_since(version)
+        if changes is None:
+            self.full += 1
+        else:
+            self.deltas += 1
+        return changes
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'users': len(self._histories),
+            'version': self._version,
+            'deltas': self.deltas,
+            'full': self.full,
+        }
+
+
+def squash_changes(changes: list[ContactChange]) -> tuple[list[str], list[str]]:
+    """Добавленные и удаленные контакты, последнее изменение побеждает"""
+    last_changes = {change.account_name: change.added for change in changes}
+    added = [name for name, is_added in last_changes.items() if is_added]
+    removed = [name for name, is_added in last_changes.items() if not is_added]
+    return added, removed
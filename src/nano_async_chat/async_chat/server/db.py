@@ -101,6 +101,10 @@ class User(Base, AuthMixin):
 
 class History(Base):
     __tablename__ = 'history'
+    # Статистика пользователей считается по индексу, не читая таблицу
+    __table_args__ = (
+        sa.Index('ix_history_user_event_time', 'user_id', 'event', 'time'),
+    )
 
     class Event(str, enum.Enum):
         login = 'login'
@@ -137,7 +141,20 @@ class Contact(Base):
     )
 
 
+class OfflineMessage(Base):
+    """Сообщения для пользователей, которые были не в сети"""
+    __tablename__ = 'offline_message'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey('user.id'), index=True)
+    message: Mapped[str]
+    time: Mapped[dt.datetime]
+
+
 Base.metadata.create_all(bind=engine)
+# create_all не добавляет индексы в уже существующие таблицы
+for index in History.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
 
 
 def create_test_data():
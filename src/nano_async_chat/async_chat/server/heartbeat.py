@@ -0,0 +1,100 @@
+"""Планировщик проверок соединений
+
+Для каждого подключения в куче лежит срок следующей проверки. Трафик
+только обновляет время активности клиента, куча при этом не меняется:
+когда срок наступает, запись перекладывается на новый срок, если клиент
+успел проявить активность. Поэтому обход затрагивает только клиентов,
+у которых срок действительно истек, а не всех подключенных.
+
+Клиенту, молчавшему period_probe секунд, отправляется MessageProbe.
+Если задан idle_timeout, клиент, от которого столько времени не было
+запросов, отключается.
+
+Когда новая запись становится ближайшей, вызывается on_earlier_deadline,
+чтобы ожидающий цикл проверок проснулся раньше."""
+import time
+import heapq
+import itertools
+from typing import Callable
+from ..server.clients import Client
+
+
+class HeartbeatScheduler:
+    def __init__(
+        self,
+        period_probe: float,
+        idle_timeout: float | None = None,
+        is_active: Callable[[Client], bool] | None = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.period_probe = period_probe
+        self.idle_timeout = idle_timeout
+        # Отключенные клиенты выпадают из кучи при наступлении их срока
+        self.is_active = is_active
+        self.clock = clock
+        self._heap: list[tuple[float, int, Client]] = []
+        self._counter = itertools.count()
+        self.on_earlier_deadline: Callable[[], None] | None = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, client: Client) -> None:
+        now = self.clock()
+        client.last_activity = now
+        client.last_received = now
+        self._schedule(client, self._get_deadline(client))
+
+    def remove(self, client: Client) -> None:
+        # Запись в куче станет устаревшей и будет пропущена
+        client.heartbeat_token = None
+
+    def touch(self, client: Client, received: bool = False) -> None:
+        now = self.clock()
+        client.last_activity = now
+        if received:
+            client.last_received = now
+
+    def next_deadline(self) -> float | None:
+        return self._heap[0][0] if self._heap else None
+
+    def _schedule(self, client: Client, deadline: float) -> None:
+        token = next(self._counter)
+        client.heartbeat_token = token
+        heapq.heappush(self._heap, (deadline, token, client))
+        if self._heap[0][1] == token and self.on_earlier_deadline:
+            self.on_earlier_deadline()
+
+    def _get_deadline(self, client: Client) -> float:
+        deadline = client.last_activity + self.period_probe
+        if self.idle_timeout is not None:
+            deadline = min(deadline, client.last_received + self.idle_timeout)
+        return deadline
+
+    def pop_due(self) -> tuple[list[Client], list[Client]]:
+        """Возвращает клиентов для проверки и клиентов для отключения"""
+        now = self.clock()
+        to_probe = []
+        to_reap = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, token, client = heapq.heappop(heap)
+            if client.heartbeat_token != token:
+                continue
+            if self.is_active and not self.is_active(client):
+                client.heartbeat_token = None
+                continue
+            if (self.idle_timeout is not None
+                    and client.last_received + self.idle_timeout <= now):
+                client.heartbeat_token = None
+                to_reap.append(client)
+                continue
+            deadline = self._get_deadline(client)
+            if deadline <= now:
+                # Проверка тоже считается активностью, следующая через период
+                client.last_activity = now
+                if client.user_id:
+                    to_probe.append(client)
+                deadline = self._get_deadline(client)
+            self._schedule(client, deadline)
+        return to_probe, to_reap
@@ -0,0 +1,109 @@
+"""Отложенная запись истории пользователей
+
+События копятся в памяти и записываются в таблицу history одной пачкой
+в одной транзакции раз в flush_interval секунд или по набору flush_size
+строк, запись выполняется в рабочем потоке исполнителя операций с базой.
+Очередь ограничена max_size событиями, лишние события отбрасываются
+и учитываются в счетчике dropped."""
+import logging
+import datetime as dt
+from collections import deque
+from typing import Any
+import trio
+from sqlalchemy import insert
+from ..server.db import SessionLocal, History
+from ..server.storage import StorageExecutor
+
+logger = logging.getLogger('server-logger')
+
+
+class HistoryWriter:
+    def __init__(
+        self,
+        flush_interval: float = 0.5,
+        flush_size: int = 500,
+        max_size: int = 100000,
+    ):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_size = max_size
+        self._events: deque[dict[str, Any]] = deque()
+        self._flush_needed = trio.Event()
+        self.flushed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def record(
+        self,
+        event: History.Event,
+        user_id: int | None,
+        adress: str = '',
+        time: dt.datetime | None = None
+    ) -> None:
+        if len(self._events) >= self.max_size:
+            self.dropped += 1
+            return
+        self._events.append(dict(
+            user_id=user_id,
+            event=event,
+            time=time or dt.datetime.now(dt.timezone.utc),
+            adress=adress
+        ))
+        if len(self._events) >= self.flush_size:
+            self._flush_needed.set()
+
+    def take_events(self) -> list[dict[str, Any]]:
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    def write_events(self, events: list[dict[str, Any]]) -> None:
+        with SessionLocal() as session:
+            session.execute(insert(History), events)
+            session.commit()
+
+    def flush(self) -> int:
+        events = self.take_events()
+        if not events:
+            return 0
+        try:
+            self.write_events(events)
+        except Exception as exc:
+            return self._write_failed(events, exc)
+        self.flushed += len(events)
+        return len(events)
+
+    async def flush_in_thread(self, storage: StorageExecutor) -> int:
+        # События забираются в цикле событий, в поток уходит готовая пачка
+        events = self.take_events()
+        if not events:
+            return 0
+        try:
+            await storage.run_sync(
+                self.write_events, events, name='write_history'
+            )
+        except Exception as exc:
+            return self._write_failed(events, exc)
+        self.flushed += len(events)
+        return len(events)
+
+    def _write_failed(self, events: list[dict[str, Any]], exc: Exception) -> int:
+        self.dropped += len(events)
+        logger.error('Не удалось записать историю: %s', exc.__repr__())
+        return 0
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'pending': len(self._events),
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+        }
+
+    async def run(self, storage: StorageExecutor) -> None:
+        while True:
+            with trio.move_on_after(self.flush_interval):
+                await self._flush_needed.wait()
+            self._flush_needed = trio.Event()
+            await self.flush_in_thread(storage)
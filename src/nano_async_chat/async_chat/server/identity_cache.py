@@ -0,0 +1,81 @@
+"""Кэш учетных данных пользователей
+
+Хранит для account_name идентификатор и версию хэша пароля, чтобы
+обработка каждого запроса не читала таблицу user. Кто в сети, знает
+PresenceService. Размер кэша ограничен, давно не использованные записи
+вытесняются.
+
+Сам хэш в кэше не хранится: при входе он читается из базы, и если его
+версия не совпала с записью, пароль сменили в обход сервера и запись
+удаляется. Изменения пользователей в операциях StorageExecutor вызывают
+invalidate. Каждое изменение увеличивает generation: запись, прочитанная
+из базы до изменения, в кэш уже не попадет."""
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from ..server.db import User
+
+
+def get_password_version(password: str) -> str:
+    return hashlib.sha256(password.encode()).hexdigest()[:16]
+
+
+@dataclass
+class UserIdentity:
+    id: int
+    account_name: str
+    password_version: str
+
+    @classmethod
+    def from_user(cls, user: User) -> 'UserIdentity':
+        return cls(
+            id=user.id,
+            account_name=user.account_name,
+            password_version=get_password_version(user.password)
+        )
+
+
+class IdentityCache:
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._identities: OrderedDict[str, UserIdentity] = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._identities)
+
+    def get(self, account_name: str) -> UserIdentity | None:
+        identity = self._identities.get(account_name)
+        if identity is None:
+            self.misses += 1
+            return None
+        self._identities.move_to_end(account_name)
+        self.hits += 1
+        return identity
+
+    def put(self, identity: UserIdentity, generation: int) -> bool:
+        """Сохраняет запись, прочитанную при данном generation"""
+        if generation != self.generation:
+            return False
+        self._identities[identity.account_name] = identity
+        self._identities.move_to_end(identity.account_name)
+        if len(self._identities) > self.max_size:
+            self._identities.popitem(last=False)
+        return True
+
+    def invalidate(self, account_name: str) -> None:
+        self.generation += 1
+        self._identities.pop(account_name, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._identities.clear()
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'size': len(self._identities),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,172 @@
+"""Почтовый ящик для пользователей не в сети
+
+Личные сообщения пользователю не в сети копятся в памяти и дописываются
+в таблицу offline_message пачками, как история. После входа
+пользователя ящик выгружается страницами по page_size сообщений прямо
+в его очередь, следующая страница берется, когда очередь разгрузится.
+
+При остановке сервера сообщения чата, не отправленные пользователям,
+тоже сохраняются в ящик и будут доставлены после перезапуска."""
+import logging
+import datetime as dt
+from typing import Any, Callable
+import trio
+from sqlalchemy import insert
+from ..frame_codec import HEAD_SIZE
+from ..server.clients import UsersMessages, QueueMessage
+from ..server.outbox import SequencedMessage
+from ..server.db import SessionLocal, OfflineMessage
+from ..server.storage import StorageExecutor
+
+logger = logging.getLogger('server-logger')
+
+
+class OfflineMailbox:
+    def __init__(
+        self,
+        storage: StorageExecutor,
+        users_messages: UsersMessages,
+        is_online: Callable[[int], bool],
+        flush_interval: float = 0.5,
+        page_size: int = 500,
+    ):
+        self.storage = storage
+        self.users_messages = users_messages
+        self.is_online = is_online
+        self.flush_interval = flush_interval
+        self.page_size = page_size
+        self._pending: list[dict[str, Any]] = []
+        self._send_channel, self._receive_channel = trio.open_memory_channel(
+            float('inf')
+        )
+        # Выгрузка ящика ждет записи, начатой периодическим сохранением
+        self._flush_lock = trio.Lock()
+        self.stored = 0
+        self.delivered = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def store(self, user_id: int, message: QueueMessage) -> None:
+        if isinstance(message, SequencedMessage):
+            # После перезапуска номера начнутся заново
+            message = message.message
+        if isinstance(message, bytes):
+            # Кадр рассылки хранится без заголовка длины
+            message = message[HEAD_SIZE:].decode()
+        self._pending.append(dict(
+            user_id=user_id,
+            message=message,
+            time=dt.datetime.now(dt.timezone.utc)
+        ))
+
+    def take_pending(self) -> list[dict[str, Any]]:
+        pending = self._pending
+        self._pending = []
+        return pending
+
+    def write_messages(self, messages: list[dict[str, Any]]) -> None:
+        with SessionLocal() as session:
+            session.execute(insert(OfflineMessage), messages)
+            session.commit()
+
+    def flush(self) -> int:
+        """Сохраняет ящик при остановке, ошибка не прерывает остановку"""
+        messages = self.take_pending()
+        if not messages:
+            return 0
+        try:
+            self.write_messages(messages)
+        except Exception as exc:
+            self._pending[:0] = messages
+            logger.error('Не удалось сохранить ящик: %s', exc.__repr__())
+            return 0
+        self.stored += len(messages)
+        return len(messages)
+
+    async def flush_in_thread(self) -> int:
+        async with self._flush_lock:
+            messages = self.take_pending()
+            if not messages:
+                return 0
+            try:
+                await self.storage.run_sync(
+                    self.write_messages,
+                    messages,
+                    name='write_offline_messages'
+                )
+            except Exception:
+                # Вернем сообщения в буфер, чтобы не потерять их
+                self._pending[:0] = messages
+                raise
+        self.stored += len(messages)
+        return len(messages)
+
+    def save_queued(self) -> int:
+        """Переносит неотправленные сообщения чата из очередей в ящик"""
+        count = 0
+        for user_id, messages in self.users_messages.take_bulk_messages().items():
+            for message in messages:
+                self.store(user_id, message)
+                count += 1
+        return count
+
+    def request_delivery(self, user_id: int) -> None:
+        self._send_channel.send_nowait(user_id)
+
+    async def deliver(self, user_id: int) -> int:
+        await self.flush_in_thread()
+        count = 0
+        while self.is_online(user_id):
+            messages_queue = self.users_messages.get_queue_for_target(user_id)
+            if len(messages_queue) >= self.page_size:
+                await trio.sleep(self.flush_interval)
+                continue
+            messages = await self.storage.run(
+                lambda user_service: user_service.take_offline_messages(
+                    user_id, self.page_size
+                ),
+                name='take_offline_messages'
+            )
+            for message in messages:
+                self.users_messages.put_message_to_queue(
+                    user_id, message, bulk=True
+                )
+            count += len(messages)
+            if len(messages) < self.page_size:
+                break
+        self.delivered += count
+        if count:
+            logger.debug('Доставлено %s сообщений из ящика %s', count, user_id)
+        return count
+
+    async def _deliver_safe(self, user_id: int) -> None:
+        try:
+            await self.deliver(user_id)
+        except Exception as exc:
+            logger.error(
+                'Не удалось выгрузить ящик %s: %s', user_id, exc.__repr__()
+            )
+
+    async def run(self) -> None:
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(self._flush_periodically)
+            async for user_id in self._receive_channel:
+                nursery.start_soon(self._deliver_safe, user_id)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await trio.sleep(self.flush_interval)
+            try:
+                await self.flush_in_thread()
+            except Exception as exc:
+                logger.error(
+                    'Не удалось сохранить ящик: %s', exc.__repr__()
+                )
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'pending': len(self._pending),
+            'stored': self.stored,
+            'delivered': self.delivered,
+        }
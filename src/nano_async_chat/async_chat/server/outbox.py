@@ -0,0 +1,187 @@
+"""Ограниченные очереди исходящих сообщений
+
+У каждого получателя своя очередь с ограничением по числу сообщений
+и по байтам. При переполнении действует политика: отбросить самые старые
+сообщения, отбросить самые новые или отключить медленного клиента.
+Служебные сообщения идут отдельной полосой впереди сообщений чата.
+
+Объем считается по каждой очереди отдельно, даже если кадр рассылки
+общий для нескольких получателей: так видно, сколько памяти удерживает
+каждый медленный клиент."""
+import enum
+import math
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from ..frame_codec import encode_frame
+
+
+@dataclass(slots=True)
+class SequencedMessage:
+    """Сообщение чата с номером по порядку для пользователя
+
+    Номер уходит отдельным маленьким кадром перед сообщением, поэтому
+    общий кадр рассылки отправляется без копирования и разбора json"""
+    seq: int
+    message: str | bytes
+
+    def __len__(self) -> int:
+        return len(self.message)
+
+    def to_frames(self) -> list[bytes]:
+        if isinstance(self.message, bytes):
+            frame = self.message
+        else:
+            frame = encode_frame(self.message.encode())
+        return [encode_frame(b'{"seq": %d}' % self.seq), frame]
+
+
+class BulkMessage(str):
+    """Строка json из полосы чата, по типу видно, куда ее вернуть"""
+    __slots__ = ()
+
+
+# Сообщение в очереди: строка json, уже готовый кадр, общий для
+# всех получателей рассылки, или сообщение чата с номером
+QueueMessage = str | bytes | SequencedMessage
+
+
+def is_bulk(message: QueueMessage) -> bool:
+    return not isinstance(message, str) or isinstance(message, BulkMessage)
+
+
+class OverflowPolicy(str, enum.Enum):
+    drop_oldest = 'drop_oldest'
+    drop_newest = 'drop_newest'
+    disconnect = 'disconnect'
+
+
+@dataclass
+class OutboxLimits:
+    max_messages: int = 10000
+    max_bytes: int = 8 * 1024 * 1024
+    policy: OverflowPolicy = OverflowPolicy.drop_oldest
+    # Доля пачки, которую получает чат, даже если служебных сообщений много
+    bulk_share: float = 0.25
+
+
+class Outbox:
+    """Очередь получателя из двух полос
+
+    Служебные ответы (токен, ошибки, подтверждения, проверки) уходят раньше
+    сообщений чата и рассылок. Порядок внутри полосы сохраняется."""
+
+    def __init__(self, limits: OutboxLimits):
+        self.limits = limits
+        self._control: deque[QueueMessage] = deque()
+        self._bulk: deque[QueueMessage] = deque()
+        self.size = 0
+        self.high_water_messages = 0
+        self.high_water_bytes = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._control) + len(self._bulk)
+
+    def __iter__(self):
+        return itertools.chain(self._control, self._bulk)
+
+    @property
+    def bulk_count(self) -> int:
+        return len(self._bulk)
+
+    def is_overflowed(self) -> bool:
+        return (
+            len(self) > self.limits.max_messages
+            or self.size > self.limits.max_bytes
+        )
+
+    def append(self, message: QueueMessage, bulk: bool = False) -> int:
+        if bulk:
+            if isinstance(message, str):
+                message = BulkMessage(message)
+            self._bulk.append(message)
+        else:
+            self._control.append(message)
+        self.size += len(message)
+        return self._enforce_limits()
+
+    def appendleft(self, message: QueueMessage) -> int:
+        """Возвращает неотправленное сообщение в начало его полосы"""
+        if is_bulk(message):
+            self._bulk.appendleft(message)
+        else:
+            self._control.appendleft(message)
+        self.size += len(message)
+        return self._enforce_limits()
+
+    def popleft(self) -> QueueMessage:
+        lane = self._control or self._bulk
+        message = lane.popleft()
+        self.size -= len(message)
+        return message
+
+    def take_batch(self, max_messages: int) -> list[QueueMessage]:
+        """Забирает до max_messages сообщений, служебные первыми
+
+        Часть пачки bulk_share резервируется за чатом, чтобы поток
+        служебных сообщений не задерживал его бесконечно"""
+        bulk_reserve = min(
+            len(self._bulk), math.ceil(max_messages * self.limits.bulk_share)
+        )
+        messages = self._take(self._control, max_messages - bulk_reserve)
+        messages.extend(self._take(self._bulk, max_messages - len(messages)))
+        return messages
+
+    def _take(self, lane: deque[QueueMessage], count: int) -> list[QueueMessage]:
+        if count >= len(lane):
+            messages = list(lane)
+            lane.clear()
+        else:
+            messages = [lane.popleft() for _ in range(count)]
+        self.size -= sum(map(len, messages))
+        return messages
+
+    def take_bulk(self) -> list[QueueMessage]:
+        return self._take(self._bulk, len(self._bulk))
+
+    def take_all(self) -> list[QueueMessage]:
+        messages = list(self)
+        self._control.clear()
+        self._bulk.clear()
+        self.size = 0
+        return messages
+
+    def clear(self) -> int:
+        count = len(self)
+        self.dropped += count
+        self._control.clear()
+        self._bulk.clear()
+        self.size = 0
+        return count
+
+    def _enforce_limits(self) -> int:
+        """Применяет политику переполнения, возвращает число отброшенных
+
+        Сначала отбрасываются сообщения чата, служебные только если
+        чата в очереди не осталось. При политике disconnect очередь
+        не трогается, решение об отключении принимает владелец очереди
+        по is_overflowed"""
+        self.high_water_messages = max(self.high_water_messages, len(self))
+        self.high_water_bytes = max(self.high_water_bytes, self.size)
+        policy = self.limits.policy
+        if policy == OverflowPolicy.disconnect:
+            return 0
+        dropped = 0
+        while self.is_overflowed():
+            lane = self._bulk or self._control
+            if not lane:
+                break
+            if policy == OverflowPolicy.drop_oldest:
+                message = lane.popleft()
+            else:
+                message = lane.pop()
+            self.size -= len(message)
+            dropped += 1
+        self.dropped += dropped
+        return dropped
@@ -0,0 +1,109 @@
+"""Проверка паролей в пуле процессов
+
+Проверка bcrypt занимает десятки миллисекунд процессорного времени,
+поэтому выполняется в отдельных процессах и не останавливает цикл
+событий, пока после перезапуска сервера сотни клиентов входят разом.
+
+Число ожидающих проверок ограничено max_pending, сверх него вход
+отклоняется исключением PasswordVerifierBusy.
+
+Процессы запускаются через spawn, а не fork: к этому времени у сервера
+уже могут быть рабочие потоки хранилища и trio, и дочерний процесс
+унаследовал бы захваченные ими блокировки. Процесс spawn заново импортирует
+модули, поэтому задачи берутся из password_hashing, не тянущего пакет
+сервера, а запускающие модули вызывают main() только под
+__name__ == '__main__'."""
+import os
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+import trio
+from .. import password_hashing
+
+logger = logging.getLogger('server-logger')
+
+
+class PasswordVerifierBusy(Exception):
+    pass
+
+
+class PasswordVerifier:
+    def __init__(self, max_workers: int | None = None, max_pending: int = 256):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pending = 0
+        self.verified = 0
+        self.rejected = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        """Создает пул, процессы запускаются при первой задаче"""
+        if self._executor:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    async def warm_up(self) -> None:
+        """Запускает процесс заранее, чтобы первый вход его не ждал
+
+        Ошибка прогрева не останавливает сервер: пул закрывается
+        и будет создан заново при первой проверке пароля."""
+        self.start()
+        try:
+            await self.wait_future(self._executor.submit(int))
+        except Exception as exc:
+            logger.error('Не удалось прогреть пул паролей: %s', exc.__repr__())
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordVerifierBusy(
+                f'{self.pending} password checks are pending'
+            )
+        self.start()
+        self.pending += 1
+        try:
+            future = self._executor.submit(
+                password_hashing.verify_password,
+                plain_password,
+                hashed_password
+            )
+            result = await self.wait_future(future)
+        finally:
+            self.pending -= 1
+        self.verified += 1
+        return result
+
+    @staticmethod
+    async def wait_future(future: Future) -> bool:
+        token = trio.lowlevel.current_trio_token()
+        done = trio.Event()
+
+        def set_done(_: Future) -> None:
+            try:
+                token.run_sync_soon(done.set)
+            except trio.RunFinishedError:
+                pass
+
+        future.add_done_callback(set_done)
+        try:
+            await done.wait()
+        except trio.Cancelled:
+            future.cancel()
+            raise
+        return future.result()
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'pending': self.pending,
+            'verified': self.verified,
+            'rejected': self.rejected,
+        }
@@ -0,0 +1,243 @@
+"""Присутствие пользователей в сети
+
+Кто из пользователей вошел, хранится в памяти сервера: проверка не
+обращается к базе. Вход и выход рассылаются подписчикам - истории,
+кэшу учетных данных, окнам администратора, а через списки наблюдения
+вошедшим пользователям, у которых сменивший статус есть в контактах.
+
+Столбец user.has_entered пишется в фоне: изменения копятся по
+пользователям, последнее побеждает, и записываются одной транзакцией
+раз в flush_interval секунд. При запуске сервера все пользователи в
+базе отмечаются вышедшими, так как в памяти еще никого нет.
+
+Подписчики - связанные методы хранятся по слабой ссылке, поэтому
+закрытое окно не нужно отписывать."""
+import logging
+import types
+import weakref
+import datetime as dt
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Iterable
+import trio
+from sqlalchemy import update
+from ..server.db import SessionLocal, User
+from ..server.storage import StorageExecutor
+
+logger = logging.getLogger('server-logger')
+
+# Сколько идентификаторов передавать в одном условии IN
+WRITE_CHUNK_SIZE = 500
+
+
+@dataclass(frozen=True, slots=True)
+class PresenceEvent:
+    user_id: int
+    account_name: str
+    online: bool
+    time: dt.datetime
+
+
+Subscriber = Callable[[PresenceEvent], None]
+
+
+class PresenceService:
+    def __init__(self, flush_interval: float = 0.5):
+        self.flush_interval = flush_interval
+        self._online: dict[int, str] = {}
+        self._online_by_name: dict[str, int] = {}
+        self._subscribers: list[Callable[[], Subscriber | None]] = []
+        # Пользователи, за которыми следит вошедший пользователь, и обратно
+        self._watching: dict[int, set[str]] = {}
+        self._watchers: defaultdict[str, set[int]] = defaultdict(set)
+        # Состояния для записи в базу, последнее по пользователю
+        self._pending: dict[int, bool] = {}
+        self.events = 0
+        self.flushed = 0
+
+    def __len__(self) -> int:
+        return len(self._online)
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        if isinstance(subscriber, types.MethodType):
+            self._subscribers.append(weakref.WeakMethod(subscriber))
+        else:
+            self._subscribers.append(lambda: subscriber)
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers = [
+            ref for ref in self._subscribers
+            if ref() not in (None, subscriber)
+        ]
+
+    def publish(self, event: PresenceEvent) -> None:
+        self.events += 1
+        has_dead = False
+        for ref in list(self._subscribers):
+            subscriber = ref()
+            if subscriber is None:
+                has_dead = True
+                continue
+            try:
+                subscriber(event)
+            except Exception as exc:
+                logger.error(
+                    'Подписчик присутствия %s упал: %s',
+                    subscriber,
+                    exc.__repr__()
+                )
+        if has_dead:
+            self._subscribers = [
+                ref for ref in self._subscribers if ref() is not None
+            ]
+
+    def set_online(self, user_id: int, account_name: str, time: dt.datetime | None = None) -> bool:
+        """Отмечает вход, False - пользователь уже был в сети"""
+        if user_id in self._online:
+            return False
+        self._online[user_id] = account_name
+        self._online_by_name[account_name] = user_id
+        self._change(user_id, account_name, True, time)
+        return True
+
+    def set_offline(self, user_id: int, time: dt.datetime | None = None) -> bool:
+        """Отмечает выход, False - пользователя не было в сети"""
+        account_name = self._online.pop(user_id, None)
+        if account_name is None:
+            return False
+        del self._online_by_name[account_name]
+        self.unwatch(user_id)
+        self._change(user_id, account_name, False, time)
+        return True
+
+    def _change(self, user_id: int, account_name: str, online: bool, time: dt.datetime | None) -> None:
+        self._pending[user_id] = online
+        self.publish(PresenceEvent(
+            user_id=user_id,
+            account_name=account_name,
+            online=online,
+            time=time or dt.datetime.now(dt.timezone.utc)
+        ))
+
+    def is_online(self, user_id: int) -> bool:
+        return user_id in self._online
+
+    def is_account_online(self, account_name: str) -> bool:
+        return account_name in self._online_by_name
+
+    def get_online_users(self) -> dict[int, str]:
+        return dict(self._online)
+
+    def get_online_account_names(self, account_names: Iterable[str]) -> list[str]:
+        return [name for name in account_names if name in self._online_by_name]
+
+    def watch(self, user_id: int, account_names: Iterable[str], replace: bool = False) -> None:
+        """Подписывает вошедшего пользователя на присутствие контактов"""
+        if replace:
+            self.unwatch(user_id)
+        watching = self._watching.setdefault(user_id, set())
+        for account_name in account_names:
+            watching.add(account_name)
+            self._watchers[account_name].add(user_id)
+
+    def unwatch(self, user_id: int, account_names: Iterable[str] | None = None) -> None:
+        watching = self._watching.get(user_id)
+        if not watching:
+            return
+        names = list(watching) if account_names is None else account_names
+        for account_name in names:
+            watching.discard(account_name)
+            watchers = self._watchers.get(account_name)
+            if watchers is not None:
+                watchers.discard(user_id)
+                if not watchers:
+                    del self._watchers[account_name]
+        if not watching:
+            del self._watching[user_id]
+
+    def get_watchers(self, account_name: str) -> set[int]:
+        return set(self._watchers.get(account_name, ()))
+
+    def take_pending(self) -> dict[int, bool]:
+        pending = self._pending
+        self._pending = {}
+        return pending
+
+    @staticmethod
+    def write_states(states: dict[int, bool]) -> None:
+        with SessionLocal() as session:
+            for has_entered in (True, False):
+                ids = iter([
+                    user_id
+                    for user_id, online in states.items()
+                    if online is has_entered
+                ])
+                while chunk := list(islice(ids, WRITE_CHUNK_SIZE)):
+                    session.execute(
+                        update(User)
+                        .where(User.id.in_(chunk))
+                        .values(has_entered=has_entered)
+                    )
+            session.commit()
+
+    @staticmethod
+    def write_all_offline() -> None:
+        with SessionLocal() as session:
+            session.execute(
+                update(User)
+                .where(User.has_entered.is_(True))
+                .values(has_entered=False)
+            )
+            session.commit()
+
+    def flush(self) -> int:
+        states = self.take_pending()
+        if not states:
+            return 0
+        try:
+            self.write_states(states)
+        except Exception as exc:
+            return self._write_failed(states, exc)
+        self.flushed += len(states)
+        return len(states)
+
+    async def flush_in_thread(self, storage: StorageExecutor) -> int:
+        states = self.take_pending()
+        if not states:
+            return 0
+        try:
+            await storage.run_sync(
+                self.write_states, states, name='write_presence'
+            )
+        except Exception as exc:
+            return self._write_failed(states, exc)
+        self.flushed += len(states)
+        return len(states)
+
+    def _write_failed(self, states: dict[int, bool], exc: Exception) -> int:
+        # Более новые изменения, пришедшие за время записи, важнее
+        for user_id, online in states.items():
+            self._pending.setdefault(user_id, online)
+        logger.error('Не удалось записать присутствие: %s', exc.__repr__())
+        return 0
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'online': len(self._online),
+            'watchers': len(self._watching),
+            'events': self.events,
+            'pending': len(self._pending),
+            'flushed': self.flushed,
+        }
+
+    async def run(self, storage: StorageExecutor) -> None:
+        try:
+            await storage.run_sync(self.write_all_offline, name='reset_presence')
+        except Exception as exc:
+            logger.error(
+                'Не удалось сбросить присутствие в базе: %s', exc.__repr__()
+            )
+        while True:
+            await trio.sleep(self.flush_interval)
+            await self.flush_in_thread(storage)
@@ -0,0 +1,163 @@
+"""Журнал повтора сообщений чата для возобновления сессии
+
+Сообщения чата, адресованные пользователю, получают на сервере номер
+по порядку и попадают в ограниченное кольцо пользователя. Клиент
+помнит номер последнего полученного сообщения и после переподключения
+присылает его вместе с токеном: сервер повторяет только отправленное
+после этого номера, без проверки пароля и повторной загрузки контактов.
+Если нужные сообщения уже вытеснены из кольца, клиент входит заново.
+
+Кольцо создается при входе и удаляется при выходе пользователя. После
+отключения кольцо живет еще ring_ttl секунд, чтобы клиент успел
+переподключиться. Общий объем колец ограничен max_total_bytes: сверх
+него вытесняются сначала кольца отключенных, потом давно вошедших
+пользователей."""
+import time
+from typing import Callable
+from itertools import islice
+from collections import OrderedDict, deque
+from ..server.outbox import QueueMessage, SequencedMessage
+
+
+class ReplayRing:
+    def __init__(self, max_messages: int, max_bytes: int):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._messages: deque[SequencedMessage] = deque()
+        self.next_seq = 1
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    @property
+    def first_seq(self) -> int:
+        """Номер самого старого сообщения, которое еще можно повторить"""
+        return self._messages[0].seq if self._messages else self.next_seq
+
+    def push(self, message: QueueMessage) -> SequencedMessage:
+        sequenced = SequencedMessage(seq=self.next_seq, message=message)
+        self.next_seq += 1
+        self._messages.append(sequenced)
+        self.size += len(sequenced)
+        while (len(self._messages) > self.max_messages
+                or self.size > self.max_bytes):
+            self.size -= len(self._messages.popleft())
+        return sequenced
+
+    def can_resume(self, last_seq: int) -> bool:
+        # Номера в кольце идут подряд, пропуск значит потерю сообщений
+        return self.first_seq - 1 <= last_seq < self.next_seq
+
+    def take_since(self, last_seq: int, before_seq: int | None = None) -> list[SequencedMessage]:
+        """Сообщения с номерами больше last_seq и меньше before_seq"""
+        start = max(last_seq + 1 - self.first_seq, 0)
+        stop = len(self._messages)
+        if before_seq is not None:
+            stop = min(max(before_seq - self.first_seq, 0), stop)
+        return list(islice(self._messages, start, stop))
+
+
+class ReplayLog:
+    """Кольца повтора по пользователям, число колец тоже ограничено"""
+
+    def __init__(
+        self,
+        max_messages: int = 1000,
+        max_bytes: int = 256 * 1024,
+        max_rings: int = 10000,
+        max_total_bytes: int = 64 * 1024 * 1024,
+        ring_ttl: float = 300.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_rings = max_rings
+        self.max_total_bytes = max_total_bytes
+        self.ring_ttl = ring_ttl
+        self.clock = clock
+        self._rings: OrderedDict[int, ReplayRing] = OrderedDict()
+        # Сроки колец отключенных пользователей в порядке отключения
+        self._detached: OrderedDict[int, float] = OrderedDict()
+        self.size = 0
+        self.resumed = 0
+        self.rejected = 0
+        self.replayed = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def open(self, user_id: int) -> ReplayRing:
+        self.expire()
+        self._detached.pop(user_id, None)
+        ring = self._rings.get(user_id)
+        if ring is None:
+            ring = self._rings[user_id] = ReplayRing(
+                self.max_messages, self.max_bytes
+            )
+            if len(self._rings) > self.max_rings:
+                self.discard(next(iter(self._rings)))
+        self._rings.move_to_end(user_id)
+        return ring
+
+    def get(self, user_id: int) -> ReplayRing | None:
+        return self._rings.get(user_id)
+
+    def push(self, user_id: int, message: QueueMessage) -> QueueMessage:
+        """Нумерует сообщение, если у пользователя открыта сессия"""
+        ring = self._rings.get(user_id)
+        if ring is None or isinstance(message, SequencedMessage):
+            return message
+        size = ring.size
+        sequenced = ring.push(message)
+        self.size += ring.size - size
+        if self.size > self.max_total_bytes:
+            self._evict(keep=user_id)
+        return sequenced
+
+    def detach(self, user_id: int) -> None:
+        """Запускает срок жизни кольца после отключения пользователя"""
+        if user_id in self._rings:
+            self._detached.pop(user_id, None)
+            self._detached[user_id] = self.clock() + self.ring_ttl
+        self.expire()
+
+    def expire(self) -> int:
+        now = self.clock()
+        count = 0
+        while self._detached:
+            user_id, deadline = next(iter(self._detached.items()))
+            if deadline > now:
+                break
+            self.discard(user_id)
+            count += 1
+        self.expired += count
+        return count
+
+    def discard(self, user_id: int) -> None:
+        self._detached.pop(user_id, None)
+        ring = self._rings.pop(user_id, None)
+        if ring is not None:
+            self.size -= ring.size
+
+    def _evict(self, keep: int) -> None:
+        while self._detached and self.size > self.max_total_bytes:
+            self.discard(next(iter(self._detached)))
+        for user_id in list(self._rings):
+            if self.size <= self.max_total_bytes:
+                break
+            if user_id != keep:
+                self.discard(user_id)
+
+    def get_stats(self) -> dict[str, int]:
+        return {
+            'sessions': len(self._rings),
+            'messages': sum(len(ring) for ring in self._rings.values()),
+            'bytes': self.size,
+            'detached': len(self._detached),
+            'expired': self.expired,
+            'resumed': self.resumed,
+            'rejected': self.rejected,
+            'replayed': self.replayed,
+        }
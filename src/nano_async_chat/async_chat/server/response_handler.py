@@ -4,14 +4,28 @@
 ответ записывает в очередь сообщений пользователя
 """
 import json
+import base64
 import logging
 from typing import Any, Type
 import datetime as dt
+from jose import JWTError
 from ..server.clients import Client, Clients
-from ..server.db import SessionLocal, User
-from ..server.user_service import UserService
-from ..server.utils_auth import append_current_user, login_required, create_access_token
-from ..utils import MessageDto, Request, Response, T, get_message_dto_
+from ..server.contacts_log import ContactsLog, squash_changes
+from ..server.db import History
+from ..server.history_writer import HistoryWriter
+from ..server.identity_cache import UserIdentity
+from ..server.offline_mailbox import OfflineMailbox
+from ..server.password_verifier import PasswordVerifier, PasswordVerifierBusy
+from ..server.storage import StorageExecutor
+from ..server.utils_auth import (
+    append_current_user,
+    login_required,
+    create_access_token,
+    decode_token,
+    token_cache
+)
+from ..frame_codec import encode_frame
+from ..utils import MessageDto, Request, Response, SessionCipher, T, get_message_dto_
 
 from .. import jim
 
@@ -23,14 +37,26 @@ class ResponseHandler:
         self,
         current_client: Client,
         clients: Clients,
+        storage: StorageExecutor,
+        history_writer: HistoryWriter,
+        password_verifier: PasswordVerifier,
+        offline_mailbox: OfflineMailbox,
+        contacts_log: ContactsLog,
     ):
         self.current_client = current_client
         self.clients = clients
-
-    def put_message_for_user(self, message: str, user: User):
+        self.storage = storage
+        self.history_writer = history_writer
+        self.password_verifier = password_verifier
+        self.offline_mailbox = offline_mailbox
+        self.contacts_log = contacts_log
+        self.presence = clients.presence
+
+    def put_message_for_user(self, message: str, user: UserIdentity):
         self.clients.users_messages.put_message_to_queue(
             target=user.id,
-            message=message
+            message=message,
+            bulk=True
         )
 
     def put_message_for_current_client(self, message: str, client: Client | None = None):
@@ -41,12 +67,15 @@ class ResponseHandler:
                 message=message
             )
 
-    def put_message_for_all_users_exclude_current(self, message: str, users_ids: list[int]):
+    def put_message_for_all_users_exclude_current(self, message: str, users_ids: frozenset[int]):
+        # Кодируем и оформляем кадр один раз, получатели делят одни байты
+        frame = encode_frame(message.encode())
         for user_id in users_ids:
             if user_id != self.current_client.user_id:
                 self.clients.users_messages.put_message_to_queue(
                     target=user_id,
-                    message=message
+                    message=frame,
+                    bulk=True
                 )
 
     @staticmethod
@@ -80,7 +109,7 @@ class ResponseHandler:
 
         return message_model
 
-    def processing_request(self, request: Request) -> str:
+    async def processing_request(self, request: Request) -> str:
         try:
             data: dict[str, Any] = json.loads(request)
         except json.decoder.JSONDecodeError as exc:
@@ -88,10 +117,10 @@ class ResponseHandler:
             return Response(jim.MessageError(
                 response=jim.StatusCodes.HTTP_400_BAD_REQUEST,
                 error=str(exc)).json())
-        response = self.dispatch_request(data)
+        response = await self.dispatch_request(data)
         return response
 
-    def dispatch_request(self, incomming_data: dict[str, Any]) -> Response:
+    async def dispatch_request(self, incomming_data: dict[str, Any]) -> Response:
         action = incomming_data.get('action')
         try:
             if not action:
@@ -105,23 +134,27 @@ class ResponseHandler:
                 self.put_message_for_current_client(message_error)
                 return
             if action == jim.ClientActions.authenticate.value:
-                return self.processing_login_user(data=incomming_data)
+                return await self.processing_login_user(data=incomming_data)
             elif action == jim.ClientActions.presence.value:
-                return self.processing_presence(data=incomming_data)
+                return await self.processing_presence(data=incomming_data)
             elif action == jim.ClientActions.quit.value:
-                return self.processing_logout_user(data=incomming_data)
+                return await self.processing_logout_user(data=incomming_data)
             elif action == jim.ClientActions.msg.value:
-                return self.processing_message(data=incomming_data)
+                return await self.processing_message(data=incomming_data)
             elif action == jim.ClientActions.get_contacts.value:
-                return self.processing_get_contacts(data=incomming_data)
+                return await self.processing_get_contacts(data=incomming_data)
             elif action == jim.ClientActions.add_contact.value:
-                return self.processing_add_contact(data=incomming_data)
+                return await self.processing_add_contact(data=incomming_data)
             elif action == jim.ClientActions.del_contact.value:
-                return self.processing_delete_contact(data=incomming_data)
+                return await self.processing_delete_contact(data=incomming_data)
             elif action == jim.ClientActions.join_.value:
-                return self.processing_join_room(data=incomming_data)
+                return await self.processing_join_room(data=incomming_data)
             elif action == jim.ClientActions.leave.value:
-                return self.processing_leave_room(data=incomming_data)
+                return await self.processing_leave_room(data=incomming_data)
+            elif action == jim.ClientActions.session_key.value:
+                return await self.processing_session_key(data=incomming_data)
+            elif action == jim.ClientActions.resume.value:
+                return await self.processing_resume_session(data=incomming_data)
             else:
                 logger.error(
                     f'Unknown action for incomming_data={incomming_data} '
@@ -158,65 +191,176 @@ class ResponseHandler:
         self.put_message_for_current_client(error_message)
         return
 
+    async def processing_session_key(self, data: dict[str, Any]) -> None:
+        message_model: jim.MessageSessionKey = self.get_message_model(
+            schema=jim.MessageSessionKey,
+            data=data
+        )
+        self.current_client.cipher = SessionCipher(
+            base64.b64decode(message_model.key)
+        )
+        logger.debug(
+            'session key accepted for %s', self.current_client.socket.fileno()
+        )
+        ok_message = jim.MessageAlert(
+            chain_id=message_model.id,
+            response=jim.StatusCodes.HTTP_200_OK,
+            alert='Session key accepted'
+        ).json()
+        self.put_message_for_current_client(ok_message)
+
     @append_current_user
-    def processing_login_user(self, data: dict[str, Any], current_user: User | None) -> Response:
+    async def processing_login_user(self, data: dict[str, Any], current_user: UserIdentity | None) -> Response:
         message_model: jim.MessageUserAuth = self.get_message_model(
             schema=jim.MessageUserAuth,
             data=data
         )
-        with SessionLocal() as session:
-            if not current_user:
-                return self.return_error(
-                    chain_id=message_model.id,
-                    response=jim.StatusCodes.HTTP_402_BAD_PASSWORD_OR_LOGIN,
-                    error_text="Bad password or login"
-                )
-            session.add(current_user)
-            plain_passord = message_model.user.password
-            hashed_password = current_user.password
-            if not current_user.__class__.verify_password(
+        if not current_user:
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_402_BAD_PASSWORD_OR_LOGIN,
+                error_text="Bad password or login"
+            )
+        plain_passord = message_model.user.password
+        hashed_password = await self.storage.get_user_password(current_user)
+        if hashed_password is None:
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_402_BAD_PASSWORD_OR_LOGIN,
+                error_text="Bad password or login"
+            )
+        try:
+            password_verified = await self.password_verifier.verify(
                 plain_passord,
-                    hashed_password):
-                return self.return_error(
-                    chain_id=message_model.id,
-                    response=jim.StatusCodes.HTTP_402_BAD_PASSWORD_OR_LOGIN,
-                    error_text="Bad password or login"
-                )
-            if current_user.is_online() and self.current_client.user_id == current_user.id:
-                return self.return_error(
-                    chain_id=message_model.id,
-                    response=jim.StatusCodes.HTTP_409_CONFLICT,
-                    error_text="You are already login"
-                )
-            if current_user.is_online() and not self.current_client.user_id:
-                self.clients.remove_another_client_with_user(current_user.id)
-            user_service = UserService(session=session)
-            user_service.login(current_user, message_model.time)
-            self.current_client.user_id = current_user.id
-            logger.debug(
-                'login_user: %s current_user=%s', message_model, current_user
+                hashed_password
             )
-            session.commit()
-            user_model = jim.UserBase(account_name=current_user.account_name)
-            token = create_access_token(
-                data=user_model.dict(),
-                expires_delta=dt.timedelta(days=1)
+        except PasswordVerifierBusy as exc:
+            logger.error('login rejected: %s', exc)
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_503_SERVICE_UNAVAILABLE,
+                error_text="Server is busy, try to login later"
             )
-            token_message = jim.MessageToken(
+        if not password_verified:
+            return self.return_error(
                 chain_id=message_model.id,
-                response=jim.StatusCodes.HTTP_201_CREATED,
-                token=token
-            ).json()
-            self.put_message_for_current_client(token_message)
+                response=jim.StatusCodes.HTTP_402_BAD_PASSWORD_OR_LOGIN,
+                error_text="Bad password or login"
+            )
+        is_online = self.presence.is_online(current_user.id)
+        if is_online and self.current_client.user_id == current_user.id:
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_409_CONFLICT,
+                error_text="You are already login"
+            )
+        if is_online and not self.current_client.user_id:
+            self.clients.remove_another_client_with_user(current_user.id)
+        self.bind_current_client(current_user)
+        self.set_user_online(current_user, message_model.time)
+        logger.debug(
+            'login_user: %s current_user=%s', message_model, current_user
+        )
+        user_model = jim.UserBase(account_name=current_user.account_name)
+        token = create_access_token(
+            data=user_model.dict(),
+            expires_delta=dt.timedelta(days=1)
+        )
+        token_message = jim.MessageToken(
+            chain_id=message_model.id,
+            response=jim.StatusCodes.HTTP_201_CREATED,
+            token=token
+        ).json()
+        self.put_message_for_current_client(token_message)
+
+    def bind_current_client(self, current_user: UserIdentity) -> None:
+        # Привязываем подключение до записи в базу, чтобы отложенный выход
+        # прежнего подключения не затер этот вход
+        self.clients.login(
+            self.current_client,
+            user_id=current_user.id,
+            account_name=current_user.account_name
+        )
+        self.clients.users_messages.replay.open(current_user.id)
+
+    def set_user_online(self, current_user: UserIdentity, time: dt.datetime) -> None:
+        # История и столбец has_entered пишутся подписчиками присутствия
+        self.presence.set_online(
+            current_user.id, current_user.account_name, time
+        )
+        self.offline_mailbox.request_delivery(current_user.id)
+
+    @append_current_user
+    async def processing_resume_session(self, data: dict[str, Any], current_user: UserIdentity | None) -> Response:
+        """Возобновляет сессию после переподключения по токену
+
+        Пароль не проверяется, клиенту повторяются сообщения чата,
+        отправленные после last_seq"""
+        message_model: jim.MessageSessionResume = self.get_message_model(
+            schema=jim.MessageSessionResume,
+            data=data
+        )
+        try:
+            account_name = decode_token(message_model.token).get('account_name')
+        except JWTError:
+            account_name = None
+        if not current_user or current_user.account_name != account_name:
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_401_UNAUTHORIZED,
+                error_text='Auth required'
+            )
+        if self.current_client.user_id:
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_409_CONFLICT,
+                error_text="You are already login"
+            )
+        users_messages = self.clients.users_messages
+        ring = users_messages.replay.get(current_user.id)
+        if not ring or not ring.can_resume(message_model.last_seq):
+            users_messages.replay.rejected += 1
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_410_GONE,
+                error_text='Session expired, login required'
+            )
+        if self.presence.is_online(current_user.id):
+            self.clients.remove_another_client_with_user(current_user.id)
+        self.bind_current_client(current_user)
+        if message_model.room:
+            self.clients.join_to_room(self.current_client, message_model.room)
+        # Ответ и повтор ставятся в очередь до первого ожидания, пока
+        # кольцо не изменилось, ответ уйдет раньше повтора
+        replayed = users_messages.resume_messages(
+            current_user.id, message_model.last_seq
+        )
+        ok_message = jim.MessageAlert(
+            chain_id=message_model.id,
+            response=jim.StatusCodes.HTTP_200_OK,
+            alert=f'Session resumed, {replayed} messages replayed'
+        ).json()
+        self.put_message_for_current_client(ok_message)
+        self.set_user_online(current_user, message_model.time)
+        logger.debug(
+            'resume_session: %s current_user=%s replayed=%s',
+            message_model,
+            current_user,
+            replayed
+        )
 
     @append_current_user
     @login_required
-    def processing_logout_user(self, data: dict[str, Any], current_user: User | None) -> Response:
+    async def processing_logout_user(self, data: dict[str, Any], current_user: UserIdentity | None) -> Response:
         message_model: jim.MessageUserQuit = self.get_message_model(
             schema=jim.MessageUserQuit,
             data=data
         )
 
+        if self.current_client.user_id == current_user.id:
+            self.clients.logout(self.current_client)
+        self.clients.users_messages.replay.discard(current_user.id)
+        token_cache.evict_account(message_model.user.account_name)
         ok_message = jim.MessageAlert(
             chain_id=message_model.id,
             response=jim.StatusCodes.HTTP_200_OK,
@@ -224,40 +368,30 @@ class ResponseHandler:
         ).json()
         self.put_message_for_current_client(ok_message)
 
-        with SessionLocal() as session:
-            user_service = UserService(session=session)
-            current_user = user_service.get_user_by_account_name(
-                message_model.user.account_name
+        if self.presence.set_offline(current_user.id, message_model.time):
+            logger.debug(
+                'logout_user: %s current_user=%s',
+                message_model,
+                current_user
             )
 
-            if current_user and current_user.is_online():
-                user_service.logout(current_user, message_model.time)
-                logger.debug(
-                    'logout_user: %s current_user=%s',
-                    message_model,
-                    current_user
-                )
-                session.commit()
-
     @append_current_user
     @login_required
-    def processing_presence(self, data: dict[str, Any], current_user: User) -> None:
+    async def processing_presence(self, data: dict[str, Any], current_user: UserIdentity) -> None:
         message_model: jim.MessageUserPresence = self.get_message_model(
             schema=jim.MessageUserPresence,
             data=data
         )
-        with SessionLocal() as session:
-            user_service = UserService(session=session)
-            user_service.presence(
-                user=current_user,
-                time=message_model.time
-            )
-            logger.debug(
-                'processing_presence: %s current_user=%s',
-                message_model,
-                current_user
-            )
-            session.commit()
+        self.history_writer.record(
+            History.Event.user_send_message_to_server,
+            user_id=current_user.id,
+            time=message_model.time
+        )
+        logger.debug(
+            'processing_presence: %s current_user=%s',
+            message_model,
+            current_user
+        )
         message = jim.MessageAlert(
             chain_id=message_model.id,
             response=jim.StatusCodes.HTTP_202_ACCEPTED,
@@ -268,85 +402,81 @@ class ResponseHandler:
 
     @append_current_user
     @login_required
-    def processing_message(self, data: dict[str, Any], current_user: User) -> None:
+    async def processing_message(self, data: dict[str, Any], current_user: UserIdentity) -> None:
         message_model: jim.MessageSendMessage = self.get_message_model(
             schema=jim.MessageSendMessage,
             data=data
         )
 
-        with SessionLocal() as session:
-            user_service = UserService(session=session)
-            session.add(current_user)
-
-            user_service.presence(
-                user=current_user,
-                time=message_model.time
-            )
+        self.history_writer.record(
+            History.Event.user_send_message_to_server,
+            user_id=current_user.id,
+            time=message_model.time
+        )
 
-            message_accepted = jim.MessageAlert(
-                chain_id=message_model.id,
-                response=jim.StatusCodes.HTTP_202_ACCEPTED,
-                alert='message accepted'
-            ).json()
+        message_accepted = jim.MessageAlert(
+            chain_id=message_model.id,
+            response=jim.StatusCodes.HTTP_202_ACCEPTED,
+            alert='message accepted'
+        ).json()
 
-            if '#' in message_model.to_:
-                target_room = message_model.to_.replace('#', '')
-                if not target_room:
-                    # Отошлем в текущю комнату юзера
-                    target_room = self.clients.get_room_name(
-                        self.current_client
-                    )
-                users_ids = self.clients.get_users_ids_in_room(target_room)
-                self.put_message_for_all_users_exclude_current(
-                    message_model.json(),
-                    users_ids
+        if '#' in message_model.to_:
+            target_room = message_model.to_.replace('#', '')
+            if not target_room:
+                # Отошлем в текущю комнату юзера
+                target_room = self.clients.get_room_name(
+                    self.current_client
                 )
-                self.put_message_for_current_client(message_accepted)
-                return
-            target_user = user_service.get_user_by_account_name(
-                account_name=message_model.to_
+            users_ids = self.clients.get_users_ids_in_room(target_room)
+            self.put_message_for_all_users_exclude_current(
+                message_model.json(),
+                users_ids
             )
+            self.put_message_for_current_client(message_accepted)
+            return
+        target_user = await self.storage.get_identity(message_model.to_)
 
-            if not target_user:
-                return self.return_error(
-                    chain_id=message_model.id,
-                    response=jim.StatusCodes.HTTP_404_NOT_FOUND,
-                    error_text=f"Target user {message_model.to_} not found"
-                )
-
-            if not target_user.is_online():
-                return self.return_error(
-                    chain_id=message_model.id,
-                    response=jim.StatusCodes.HTTP_401_UNAUTHORIZED,
-                    error_text=f"Target user {message_model.to_} offline"
-                )
+        if not target_user:
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_404_NOT_FOUND,
+                error_text=f"Target user {message_model.to_} not found"
+            )
 
+        if not self.presence.is_online(target_user.id):
+            self.offline_mailbox.store(target_user.id, message_model.json())
             logger.debug(
-                'processing_presence: %s current_user=%s',
-                message_model,
-                current_user
+                'message for offline user %s stored', message_model.to_
             )
-            self.put_message_for_user(message_model.json(), target_user)
-            session.commit()
+            stored_message = jim.MessageAlert(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_202_ACCEPTED,
+                alert=f'Target user {message_model.to_} offline, message stored'
+            ).json()
+            self.put_message_for_current_client(stored_message)
+            return
+
+        logger.debug(
+            'processing_presence: %s current_user=%s',
+            message_model,
+            current_user
+        )
+        self.put_message_for_user(message_model.json(), target_user)
         self.put_message_for_current_client(message_accepted)
 
     @append_current_user
     @login_required
-    def processing_join_room(self, data: dict[str, Any], current_user: User) -> Response:
+    async def processing_join_room(self, data: dict[str, Any], current_user: UserIdentity) -> Response:
         message_model: jim.MessageUserJoinRoom = self.get_message_model(
             schema=jim.MessageUserJoinRoom,
             data=data
         )
 
-        with SessionLocal() as session:
-            session.add(current_user)
+        self.clients.join_to_room(self.current_client, message_model.room)
 
-            self.clients.join_to_room(self.current_client, message_model.room)
-
-            logger.debug(
-                'current_user=%s joined to room=%s', current_user, message_model.room
-            )
-            session.commit()
+        logger.debug(
+            'current_user=%s joined to room=%s', current_user, message_model.room
+        )
         ok_message = jim.MessageAlert(
             chain_id=message_model.id,
             response=jim.StatusCodes.HTTP_200_OK,
@@ -356,22 +486,17 @@ class ResponseHandler:
 
     @append_current_user
     @login_required
-    def processing_leave_room(self, data: dict[str, Any], current_user: User) -> Response:
+    async def processing_leave_room(self, data: dict[str, Any], current_user: UserIdentity) -> Response:
         message_model: jim.MessageUserLeaveRoom = self.get_message_model(
             schema=jim.MessageUserLeaveRoom,
             data=data
         )
 
-        with SessionLocal() as session:
-            session.add(current_user)
-
-            self.clients._leave_current_room(self.current_client.user_id)
-            room = self.clients.get_room_name(self.current_client)
+        room = self.clients.leave_room(self.current_client)
 
-            logger.debug(
-                'current_user=%s left room=%s', current_user, room
-            )
-            session.commit()
+        logger.debug(
+            'current_user=%s left room=%s', current_user, room
+        )
         ok_message = jim.MessageAlert(
             chain_id=message_model.id,
             response=jim.StatusCodes.HTTP_200_OK,
@@ -381,58 +506,117 @@ class ResponseHandler:
 
     @append_current_user
     @login_required
-    def processing_get_contacts(self, data: dict[str, Any], current_user: User) -> Response:
+    async def processing_get_contacts(self, data: dict[str, Any], current_user: UserIdentity) -> Response:
         message_model: jim.MessageGetContacts = self.get_message_model(
             schema=jim.MessageGetContacts,
             data=data
         )
 
-        with SessionLocal() as session:
-            session.add(current_user)
-            friends = [
-                dict(account_name=u.account_name)
-                for u in current_user.friends
-            ]
-            logger.debug(
-                'current_user=%s get contancts', current_user
+        since_version = message_model.since_version
+        if since_version is not None:
+            changes = self.contacts_log.changes_since(
+                current_user.id, since_version
             )
+            if changes is not None:
+                added, removed = squash_changes(changes)
+                self.presence.unwatch(current_user.id, removed)
+                self.presence.watch(current_user.id, added)
+                logger.debug(
+                    'current_user=%s get contancts since version=%s',
+                    current_user, since_version
+                )
+                contacts_message = jim.MessageContacts(
+                    chain_id=message_model.id,
+                    response=jim.StatusCodes.HTTP_200_OK,
+                    alert=[dict(account_name=name) for name in added],
+                    removed=[dict(account_name=name) for name in removed],
+                    online=[
+                        dict(account_name=name)
+                        for name in self.presence.get_online_account_names(added)
+                    ],
+                    version=self.contacts_log.get_version(current_user.id),
+                    since_version=since_version
+                ).json()
+                self.put_message_for_current_client(contacts_message)
+                return
+
+        # Версию берем до запроса: изменения, сделанные пока он идет,
+        # клиент получит еще раз, повтор изменения ничего не портит
+        version = self.contacts_log.get_version(current_user.id)
+        account_names = await self.storage.run(
+            lambda user_service: user_service.get_friends_account_names(
+                current_user.id
+            ),
+            name='get_contacts'
+        )
+        self.presence.watch(current_user.id, account_names, replace=True)
+        logger.debug(
+            'current_user=%s get contancts', current_user
+        )
         contacts_message = jim.MessageContacts(
             chain_id=message_model.id,
             response=jim.StatusCodes.HTTP_200_OK,
-            alert=friends
+            alert=[dict(account_name=name) for name in account_names],
+            online=[
+                dict(account_name=name)
+                for name in self.presence.get_online_account_names(account_names)
+            ],
+            version=version
         ).json()
         self.put_message_for_current_client(contacts_message)
 
+    def push_contacts_change(self, current_user: UserIdentity, account_name: str, added: bool) -> None:
+        """Отправляет пользователю изменение его списка контактов"""
+        since_version, change = self.contacts_log.record(
+            current_user.id, account_name, added
+        )
+        if added:
+            self.presence.watch(current_user.id, [account_name])
+        else:
+            self.presence.unwatch(current_user.id, [account_name])
+        contacts = [dict(account_name=account_name)]
+        contacts_message = jim.MessageContacts(
+            response=jim.StatusCodes.HTTP_200_OK,
+            alert=contacts if added else [],
+            removed=[] if added else contacts,
+            online=(
+                contacts
+                if added and self.presence.is_account_online(account_name)
+                else []
+            ),
+            version=change.version,
+            since_version=since_version
+        ).json()
+        self.put_message_for_user(contacts_message, current_user)
+
     @append_current_user
     @login_required
-    def processing_add_contact(self, data: dict[str, Any], current_user: User) -> Response:
+    async def processing_add_contact(self, data: dict[str, Any], current_user: UserIdentity) -> Response:
         message_model: jim.MessageAddContact = self.get_message_model(
             schema=jim.MessageAddContact,
             data=data
         )
 
-        with SessionLocal() as session:
-            user_service = UserService(session=session)
-            session.add(current_user)
-
-            target_user = user_service.get_user_by_account_name(
-                account_name=message_model.target_user.account_name
-            )
-            if not target_user:
-                return self.return_error(
-                    chain_id=message_model.id,
-                    response=jim.StatusCodes.HTTP_400_BAD_REQUEST,
-                    error_text=f"Target user {message_model.target_user.account_name} not exist"
-                )
-
-            user_service.add_contact_for_user(
-                current_user=current_user,
-                contact=target_user
+        target_user = await self.storage.run(
+            lambda user_service: user_service.add_contact_by_account_name(
+                current_user.id,
+                message_model.target_user.account_name
+            ),
+            name='add_contact'
+        )
+        if not target_user:
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_400_BAD_REQUEST,
+                error_text=f"Target user {message_model.target_user.account_name} not exist"
             )
 
-            logger.debug(
-                'current_user=%s add contancts', current_user
-            )
+        logger.debug(
+            'current_user=%s add contancts', current_user
+        )
+        self.push_contacts_change(
+            current_user, target_user.account_name, added=True
+        )
         ok_message = jim.MessageAlert(
             chain_id=message_model.id,
             response=jim.StatusCodes.HTTP_200_OK,
@@ -442,32 +626,31 @@ class ResponseHandler:
 
     @append_current_user
     @login_required
-    def processing_delete_contact(self, data: dict[str, Any], current_user: User) -> Response:
+    async def processing_delete_contact(self, data: dict[str, Any], current_user: UserIdentity) -> Response:
         message_model: jim.MessageDeleteContact = self.get_message_model(
             schema=jim.MessageDeleteContact,
             data=data
         )
-        with SessionLocal() as session:
-            user_service = UserService(session=session)
-            session.add(current_user)
-            target_user = user_service.get_user_by_account_name(
-                account_name=message_model.target_user.account_name
-            )
-            if not target_user:
-                return self.return_error(
-                    chain_id=message_model.id,
-                    response=jim.StatusCodes.HTTP_400_BAD_REQUEST,
-                    error_text=f"Target user {message_model.target_user.account_name} not exist"
-                )
-
-            user_service.delete_contact_for_user(
-                current_user=current_user,
-                contact=target_user
+        target_user = await self.storage.run(
+            lambda user_service: user_service.delete_contact_by_account_name(
+                current_user.id,
+                message_model.target_user.account_name
+            ),
+            name='delete_contact'
+        )
+        if not target_user:
+            return self.return_error(
+                chain_id=message_model.id,
+                response=jim.StatusCodes.HTTP_400_BAD_REQUEST,
+                error_text=f"Target user {message_model.target_user.account_name} not exist"
             )
 
-            logger.debug(
-                'current_user=%s delete contancts', current_user
-            )
+        logger.debug(
+            'current_user=%s delete contancts', current_user
+        )
+        self.push_contacts_change(
+            current_user, target_user.account_name, added=False
+        )
         ok_message = jim.MessageAlert(
             chain_id=message_model.id,
             response=jim.StatusCodes.HTTP_200_OK,
@@ -4,18 +4,29 @@ import signal
 import sys
 import logging
 import select
+import time
 import datetime as dt
 import trio
 import sqlalchemy as sa
 from dataclasses import dataclass, field
-from ..utils import Request, Response
-from ..server.clients import Client, Clients
-from ..server.db import SessionLocal, User
-from ..server.user_service import UserService
+from ..utils import Request
+from ..server.clients import Client, Clients, QueueMessage
+from ..server.db import SessionLocal, User, History
+from ..server.history_writer import HistoryWriter
+from ..server.storage import StorageExecutor
+from ..server.heartbeat import HeartbeatScheduler
+from ..server.outbox import OutboxLimits, SequencedMessage
+from ..server.offline_mailbox import OfflineMailbox
+from ..server.contacts_log import ContactsLog
+from ..server.presence import PresenceEvent
+from ..server.utils_auth import token_cache
+from ..server.password_verifier import PasswordVerifier
 from ..server.response_handler import ResponseHandler
 from .. import jim
+from .. import settings
 from ..server.server_verifier import ServerVerifier
 from ..utils import decrypt, load_keys
+from ..frame_codec import HEAD_SIZE, encode_frame
 
 logger = logging.getLogger('server-logger')
 
@@ -78,7 +89,9 @@ class ServerChat(metaclass=ServerVerifier):
         self, port: int,
         max_users: int,
         accept_timeout: float = 0.02,
-        select_timeout: float = 0.03
+        select_timeout: float = 0.03,
+        idle_timeout: float | None = settings.IDLE_TIMEOUT,
+        outbox_limits: OutboxLimits | None = None
     ):
         logger.debug(
             'Инициализируем сервер используя %s %s',
@@ -90,11 +103,40 @@ class ServerChat(metaclass=ServerVerifier):
         self.accept_timeout = accept_timeout
         self.select_timeout = select_timeout
         self.clients = Clients()
+        if outbox_limits:
+            self.clients.users_messages.limits = outbox_limits
+        self.clients.users_messages.overflow_listener = self.disconnect_target
         self.sockets = Sokets()
-        self.message_head_size = 4
+        self.message_head_size = HEAD_SIZE
         self.throttle = 0.01
+        # Сообщений за одну отправку и порог, ниже которого буфер сокета
+        # пополняется: остальное ждет в очереди, где служебные идут первыми
+        self.send_batch_size = 256
+        self.send_buffer_low_water = 64 * 1024
         self.period_probe = dt.timedelta(seconds=20)
+        self.heartbeats = HeartbeatScheduler(
+            period_probe=self.period_probe.total_seconds(),
+            idle_timeout=idle_timeout,
+            is_active=self.is_client_connected
+        )
+        self._heartbeat_wakeup = trio.Event()
+        self.heartbeats.on_earlier_deadline = self.wakeup_heartbeats
         self.socket_connected = False
+        self.storage = StorageExecutor()
+        self.history_writer = HistoryWriter()
+        self.password_verifier = PasswordVerifier()
+        self.offline_mailbox = OfflineMailbox(
+            storage=self.storage,
+            users_messages=self.clients.users_messages,
+            is_online=lambda user_id: bool(
+                self.clients.get_client_by_user_id(user_id)
+            )
+        )
+        self.contacts_log = ContactsLog()
+        self.presence = self.clients.presence
+        self.presence.subscribe(self.record_presence)
+        self.presence.subscribe(self.notify_watchers)
+        self.nursery: trio.Nursery | None = None
         private_key, _ = load_keys()
         self.private_key = private_key
         signal.signal(signal.SIGTERM, self.close_server)
@@ -113,6 +155,21 @@ class ServerChat(metaclass=ServerVerifier):
         signame = signal.Signals(signum).name
         logger.info(f'Signal handler called with signal {signame} ({signum})')
         self.chat_socket.close()
+        self.password_verifier.shutdown()
+        self.storage.drain()
+        self.save_offline_messages()
+        self.history_writer.flush()
+        self.presence.flush()
+        logger.info('Время операций с базой: %s', self.storage.get_stats())
+        logger.info(
+            'Кэш пользователей: %s', self.storage.identities.get_stats()
+        )
+        logger.info('Кэш токенов: %s', token_cache.get_stats())
+        logger.info(
+            'Журнал повтора: %s', self.clients.users_messages.replay.get_stats()
+        )
+        logger.info('Версии контактов: %s', self.contacts_log.get_stats())
+        logger.info('Присутствие: %s', self.presence.get_stats())
         sys.exit(0)
 
     def init_socket(self) -> None:
@@ -138,39 +195,41 @@ class ServerChat(metaclass=ServerVerifier):
             return
         return Sokets(for_reading=r, for_writing=w, for_error=e)
 
-    def get_message_size(self, head: str) -> int:
-        return int(head, 16)
+    def get_request(self, sock: socket.socket) -> list[Request]:
+        client = self.clients.get_client_by_socket(sock)
+        if not client.decoder.recv_into(sock):
+            raise ConnectionResetError('socket connection broken')
+        self.heartbeats.touch(client, received=True)
+        requests = []
+        for data_bytes in client.decoder.pop_frames():
+            request = self.decode_request(client, data_bytes)
+            if request:
+                requests.append(request)
+        return requests
 
-    def get_request(self, sock: socket.socket) -> Request:
-        message_head = (
-            sock.recv(self.message_head_size).decode()
-        )
-        if len(message_head) == 0:
+    def decode_request(self, client: Client, data_bytes: bytes) -> Request | None:
+        if client.cipher:
+            # Клиент переходит на ключ сессии только после ответа сервера,
+            # поэтому не прошедший проверку кадр по rsa не расшифровываем
+            decrypted = client.cipher.decrypt(data_bytes)
+        else:
+            # До подтверждения ключа сессии клиент шифрует запросы по rsa
+            decrypted = decrypt(data_bytes, self.private_key)
+        if decrypted is False:
+            logger.error(
+                'Не удалось расшифровать запрос от %s', client.socket.fileno()
+            )
             return
-        message_size = self.get_message_size(message_head)
-        chunks = []
-        bytes_recd = 0
-        while bytes_recd < message_size:
-            chunk = sock.recv(min(message_size - bytes_recd, 2048))
-            if chunk == b'':
-                raise RuntimeError("socket connection broken")
-            chunks.append(chunk)
-            bytes_recd = bytes_recd + len(chunk)
-        data_bytes = b''.join(chunks)
-        request = Request(
-            decrypt(data_bytes, self.private_key)
-        )
+        request = Request(decrypted)
         logger.debug('get_request: %s', request)
-        with SessionLocal() as session:
-            client = self.clients.get_client_by_socket(sock)
-            user_service = UserService(session=session)
-            user_service.user_send_message_to_server(
-                user=client.user_id,
-                adress=client.socket.getsockname()[0]
-            )
+        self.history_writer.record(
+            History.Event.user_send_message_to_server,
+            user_id=client.user_id,
+            adress=client.socket.getsockname()[0]
+        )
         return request
 
-    def get_requests(self, sockets: Sokets) -> dict[socket.socket, Request]:
+    def get_requests(self, sockets: Sokets) -> dict[socket.socket, list[Request]]:
         requests = {}
         for sock in sockets.for_reading:
             client = self.clients.get_client_by_socket(sock)
@@ -187,43 +246,116 @@ class ServerChat(metaclass=ServerVerifier):
         return requests
 
     def form_data(self, data: str) -> bytes:
-        length = len(data.encode())
-        hex_legth = hex(length)[2:]
-        head_message = f'00{hex_legth}'[-4:]
-        return f'{head_message}{data}'.encode()
-
-    def send_response(self, client: Client, response: Response) -> None:
-        with SessionLocal() as session:
-            UserService(session).user_get_message_from_server(
-                user=client.user_id,
-                adress=client.socket.getsockname()[0]
-            )
+        return encode_frame(data.encode())
+
+    def prepare_response(self, client: Client, response: QueueMessage) -> list[bytes]:
+        """Кадры одного сообщения, у сообщения чата перед ним кадр номера"""
+        self.history_writer.record(
+            History.Event.user_get_message_from_server,
+            user_id=client.user_id,
+            adress=client.socket.getsockname()[0]
+        )
+        if isinstance(response, SequencedMessage):
+            return response.to_frames()
+        if isinstance(response, bytes):
+            # Кадр рассылки уже сформирован один раз для всех получателей
+            return [response]
+        return [self.form_data(str(response))]
+
+    def put_response_to_buffer(self, client: Client, response: QueueMessage) -> None:
+        *headers, frame = self.prepare_response(client, response)
+        for header in headers:
+            client.send_buffer.append(header)
+        client.send_buffer.append(frame, response)
+
+    def send_buffered_responses(self, client: Client) -> None:
         try:
+            sent = client.send_buffer.send(client.socket)
+            if sent:
+                self.heartbeats.touch(client)
             logger.debug(
-                'send_response %s %s response=%s',
+                'send_response %s sent=%s pending=%s',
                 client.socket.fileno(),
-                client.socket.getpeername(),
-                response
+                sent,
+                len(client.send_buffer)
             )
-            client.socket.send(self.form_data(str(response)))
         except OSError:
             logger.debug(
-                'Клиент %s %s отключился',
-                client.socket.fileno(),
-                client.socket.getpeername()
+                'Клиент %s отключился',
+                client.socket.fileno()
             )
             if client.user_id:
-                self.clients.users_messages.put_back_message_to_queue(
-                    client.user_id,
-                    str(response)
-                )
-
+                for response in reversed(client.send_buffer.pending_messages()):
+                    self.clients.users_messages.put_back_message_to_queue(
+                        client.user_id,
+                        response
+                    )
+            client.send_buffer.clear()
             client.socket.close()
             self.clients.remove(client)
+            return
+        if client.send_buffer.would_block:
+            logger.debug(
+                'Сокет %s не принял все данные, осталось %s байт',
+                client.socket.fileno(),
+                len(client.send_buffer)
+            )
 
-    def send_message(self, client: Client, message: str) -> None:
-        if message:
-            self.send_response(client, Response(message))
+    def get_client_messages(self, client: Client) -> list[QueueMessage]:
+        messages = []
+        if client.user_id:
+            messages.extend(
+                self.clients.users_messages.take_messages_from_queue(
+                    target=client.user_id,
+                    max_messages=self.send_batch_size
+                )
+            )
+        messages.extend(
+            self.clients.users_messages.take_messages_from_queue(
+                target=client.socket,
+                max_messages=self.send_batch_size - len(messages)
+            )
+        )
+        return messages
+
+    def is_client_connected(self, client: Client) -> bool:
+        return self.clients.get_client_by_socket(client.socket) is client
+
+    def disconnect_client(self, client: Client) -> None:
+        logger.debug('Отключаем неактивного клиента %s', client.fileno)
+        client.socket.close()
+        self.clients.remove(client)
+
+    def disconnect_target(self, target: int | socket.socket) -> None:
+        if isinstance(target, int):
+            client = self.clients.get_client_by_user_id(target)
+        else:
+            client = self.clients.get_client_by_socket(target)
+        if client:
+            self.disconnect_client(client)
+
+    async def run_heartbeats(self) -> None:
+        """Отправляет проверки и отключает неактивных клиентов по сроку"""
+        while True:
+            to_probe, to_reap = self.heartbeats.pop_due()
+            for client in to_probe:
+                self.clients.users_messages.put_message_to_queue(
+                    target=client.user_id,
+                    message=jim.MessageProbe().json()
+                )
+            for client in to_reap:
+                self.disconnect_client(client)
+            deadline = self.heartbeats.next_deadline()
+            self._heartbeat_wakeup = trio.Event()
+            if deadline is None:
+                await self._heartbeat_wakeup.wait()
+                continue
+            # Срок считается по time.monotonic, а не по часам trio
+            with trio.move_on_after(max(deadline - time.monotonic(), 0)):
+                await self._heartbeat_wakeup.wait()
+
+    def wakeup_heartbeats(self) -> None:
+        self._heartbeat_wakeup.set()
 
     def processing_queues_messages(
         self,
@@ -231,35 +363,60 @@ class ServerChat(metaclass=ServerVerifier):
     ) -> None:
         for sock in sockets.for_writing:
             client = self.clients.get_client_by_socket(sock)
-            message = None
             if not client:
                 continue
-            if client.user_id:
-                message = self.clients.users_messages.get_message_from_queue(
-                    target=client.user_id
-                )
-            if not message:
-                message = self.clients.users_messages.get_message_from_queue(
-                    target=sock
-                )
-            if (client.user_id
-                and not message
-                    and client.time + self.period_probe < dt.datetime.now()):
-                client.time = dt.datetime.now()
-                message = jim.MessageProbe().json()
-
-            # if client.user_id and message:
-            #     logger.debug(
-            #         'Отправляем сообщения для юзера user_id=%s', client.user_id
-            #     )
-            # else:
-            #     logger.debug(
-            #         'Отправляем сообщения для sock=%s', sock
-            #     )
-
-            self.send_message(client, message)
+            if len(client.send_buffer) < self.send_buffer_low_water:
+                for message in self.get_client_messages(client):
+                    self.put_response_to_buffer(client, message)
+            self.send_buffered_responses(client)
 
     async def run(self) -> None:
+        try:
+            async with trio.open_nursery() as nursery:
+                self.nursery = nursery
+                nursery.start_soon(self.password_verifier.warm_up)
+                nursery.start_soon(self.storage.serve)
+                nursery.start_soon(self.history_writer.run, self.storage)
+                nursery.start_soon(self.presence.run, self.storage)
+                nursery.start_soon(self.run_heartbeats)
+                nursery.start_soon(self.offline_mailbox.run)
+                await self.serve()
+        finally:
+            self.password_verifier.shutdown()
+            self.storage.drain()
+            self.save_offline_messages()
+            self.history_writer.flush()
+            self.presence.flush()
+
+    def record_presence(self, event: PresenceEvent) -> None:
+        self.history_writer.record(
+            History.Event.login if event.online else History.Event.logout,
+            user_id=event.user_id,
+            time=event.time
+        )
+
+    def notify_watchers(self, event: PresenceEvent) -> None:
+        """Сообщает о входе и выходе тем, у кого пользователь в контактах"""
+        watchers = self.presence.get_watchers(event.account_name)
+        if not watchers:
+            return
+        frame = encode_frame(jim.MessageContactPresence(
+            user=dict(account_name=event.account_name),
+            online=event.online
+        ).json().encode())
+        for user_id in watchers:
+            self.clients.users_messages.put_message_to_queue(
+                target=user_id,
+                message=frame,
+                bulk=True
+            )
+
+    def save_offline_messages(self) -> None:
+        saved = self.offline_mailbox.save_queued()
+        self.offline_mailbox.flush()
+        logger.info('Неотправленных сообщений сохранено в ящик: %s', saved)
+
+    async def serve(self) -> None:
         self.init_socket()
         logger.debug('Старт цикла')
         while True:
@@ -272,7 +429,10 @@ class ServerChat(metaclass=ServerVerifier):
                 # logger.debug('Timeout ожидания подключений вышел')
             else:
                 logger.debug('Получен запрос на соединение от %s', addr)
-                self.clients.append(Client(socket=sock))
+                sock.setblocking(False)
+                client = Client(socket=sock)
+                self.clients.append(client)
+                self.heartbeats.add(client)
             finally:
                 sockets = self.__class__.get_sockets(
                     clients=self.clients,
@@ -289,16 +449,36 @@ class ServerChat(metaclass=ServerVerifier):
                 self.dispatch_requests(requests)
             self.processing_queues_messages(sockets)
 
-    def dispatch_requests(self, requests: dict[socket.socket, Request]) -> None:
-        for sock, request in requests.items():
-            if not request:
-                continue
-            logger.debug(
-                'Пришел новый запрос request=%s', request
-            )
+    def dispatch_requests(self, requests: dict[socket.socket, list[Request]]) -> None:
+        # Запросы клиентов обрабатываются параллельно, пока цикл select
+        # продолжает обслуживать сокеты
+        for sock, client_requests in requests.items():
             client = self.clients.get_client_by_socket(sock)
-            response_handler = ResponseHandler(
-                current_client=client,
-                clients=self.clients
-            )
-            response_handler.processing_request(request)
+            if client and client_requests:
+                self.nursery.start_soon(
+                    self.dispatch_client_requests, client, client_requests
+                )
+
+    async def dispatch_client_requests(self, client: Client, requests: list[Request]) -> None:
+        # Замок сохраняет порядок запросов одного клиента между пачками
+        async with client.request_lock:
+            for request in requests:
+                logger.debug(
+                    'Пришел новый запрос request=%s', request
+                )
+                await self.dispatch_request(client, request)
+
+    def get_response_handler(self, client: Client) -> ResponseHandler:
+        return ResponseHandler(
+            current_client=client,
+            clients=self.clients,
+            storage=self.storage,
+            history_writer=self.history_writer,
+            password_verifier=self.password_verifier,
+            offline_mailbox=self.offline_mailbox,
+            contacts_log=self.contacts_log
+        )
+
+    async def dispatch_request(self, client: Client, request: Request) -> None:
+        response_handler = self.get_response_handler(client)
+        await response_handler.processing_request(request)
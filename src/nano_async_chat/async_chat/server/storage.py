@@ -0,0 +1,208 @@
+"""Выполнение операций с базой данных вне цикла событий
+
+Операции UserService выполняются в пуле потоков trio, число одновременно
+работающих потоков ограничено CapacityLimiter. Каждая операция получает
+свою сессию в рабочем потоке, поэтому медленный запрос к базе не
+останавливает обслуживание остальных клиентов.
+
+Для каждой операции ведется гистограмма времени выполнения."""
+import time
+import bisect
+import logging
+from collections import defaultdict
+from typing import Any, Callable, TypeVar
+import trio
+from ..server.db import SessionLocal
+from ..server.identity_cache import (
+    IdentityCache,
+    UserIdentity,
+    get_password_version,
+)
+from ..server.user_service import UserService
+
+logger = logging.getLogger('server-logger')
+
+R = TypeVar('R')
+
+# Верхние границы корзин гистограммы в миллисекундах
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+
+class LatencyHistogram:
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        # Последняя корзина для значений больше верхней границы
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds: float) -> None:
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает q-я доля значений"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return float(bound)
+        return self.max_ms
+
+    def get_stats(self) -> dict[str, float]:
+        return {
+            'count': self.count,
+            'avg_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max_ms,
+        }
+
+
+class StorageExecutor:
+    def __init__(self, max_threads: int = 4, max_pending: int = 10000):
+        self.limiter = trio.CapacityLimiter(max_threads)
+        self.histograms: dict[str, LatencyHistogram] = defaultdict(
+            LatencyHistogram
+        )
+        # Операции без ожидания результата, например выход при отключении
+        self._send_channel, self._receive_channel = trio.open_memory_channel(
+            max_pending
+        )
+        self.dropped = 0
+        self.identities = IdentityCache()
+
+    async def run_sync(self, func: Callable[..., R], *args: Any, name: str | None = None) -> R:
+        name = name or func.__name__
+        start = time.perf_counter()
+        try:
+            return await trio.to_thread.run_sync(
+                func, *args, limiter=self.limiter
+            )
+        finally:
+            self.histograms[name].observe(time.perf_counter() - start)
+
+    async def run(self, operation: Callable[[UserService], R], name: str | None = None) -> R:
+        """Выполняет operation(user_service) в рабочем потоке
+
+        Объекты orm, которые возвращает операция, отвязаны от сессии:
+        доступны только загруженные поля"""
+        result, changed = await self.run_sync(
+            self.call_in_session,
+            operation,
+            name=name or operation.__name__
+        )
+        self.invalidate_identities(changed)
+        return result
+
+    def invalidate_identities(self, account_names: set[str]) -> None:
+        for account_name in account_names:
+            self.identities.invalidate(account_name)
+
+    async def get_user_password(self, identity: UserIdentity) -> str | None:
+        """Читает хэш пароля для входа и сверяет его версию с кэшем"""
+        password = await self.run(
+            lambda user_service: user_service.get_user_password(identity.id),
+            name='get_user_password'
+        )
+        if (password is None
+                or get_password_version(password) != identity.password_version):
+            # Пользователя изменили в обход сервера
+            self.identities.invalidate(identity.account_name)
+        return password
+
+    async def get_identity(self, account_name: str) -> UserIdentity | None:
+        identity = self.identities.get(account_name)
+        if identity:
+            return identity
+        generation = self.identities.generation
+        user = await self.run(
+            lambda user_service: user_service.get_user_by_account_name(
+                account_name=account_name
+            ),
+            name='get_user_by_account_name'
+        )
+        if not user:
+            return None
+        identity = UserIdentity.from_user(user)
+        self.identities.put(identity, generation)
+        return identity
+
+    @staticmethod
+    def call_in_session(operation: Callable[[UserService], R]) -> tuple[R, set[str]]:
+        """Возвращает результат и имена измененных пользователей"""
+        with SessionLocal(expire_on_commit=False) as session:
+            user_service = UserService(session=session)
+            result = operation(user_service)
+            return result, user_service.get_changed_account_names()
+
+    def submit(
+        self,
+        operation: Callable[[UserService], Any],
+        name: str | None = None,
+        on_done: Callable[[Any], None] | None = None
+    ) -> bool:
+        """Ставит операцию в очередь без ожидания результата
+
+        on_done вызывается с результатом в цикле событий"""
+        try:
+            self._send_channel.send_nowait((operation, name, on_done))
+        except (trio.WouldBlock, RuntimeError):
+            self.dropped += 1
+            logger.error(
+                'Очередь операций с базой переполнена, %s отброшена', name
+            )
+            return False
+        return True
+
+    async def _run_submitted(
+        self,
+        operation: Callable[[UserService], Any],
+        name: str | None,
+        on_done: Callable[[Any], None] | None
+    ) -> None:
+        try:
+            result = await self.run(operation, name)
+        except Exception as exc:
+            logger.error('Операция %s не выполнена: %s', name, exc.__repr__())
+            return
+        if on_done:
+            on_done(result)
+
+    async def serve(self) -> None:
+        async with trio.open_nursery() as nursery:
+            async for operation, name, on_done in self._receive_channel:
+                nursery.start_soon(
+                    self._run_submitted, operation, name, on_done
+                )
+
+    def drain(self) -> None:
+        """Синхронно выполняет оставшиеся операции при остановке сервера"""
+        while True:
+            try:
+                operation, name, on_done = self._receive_channel.receive_nowait()
+            except (trio.WouldBlock, trio.EndOfChannel, trio.ClosedResourceError):
+                return
+            try:
+                result, changed = self.call_in_session(operation)
+            except Exception as exc:
+                logger.error(
+                    'Операция %s не выполнена: %s', name, exc.__repr__()
+                )
+                continue
+            self.invalidate_identities(changed)
+            if on_done:
+                on_done(result)
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        return {
+            name: histogram.get_stats()
+            for name, histogram in self.histograms.items()
+        }
@@ -0,0 +1,144 @@
+"""Движок сервера чата на задачах trio
+
+Каждое подключение обслуживается своей задачей: запросы читаются потоком
+из SocketStream, а отправка просыпается по событию появления сообщения
+в очереди клиента, без опроса сокетов по таймауту."""
+import socket
+import logging
+from typing import Awaitable, Callable
+import trio
+from ..utils import Request
+from ..frame_codec import FrameError
+from ..server.clients import Client, QueueMessage
+from ..server.server import ServerChat
+
+logger = logging.getLogger('server-logger')
+
+CONNECTION_ERRORS = (
+    trio.BrokenResourceError,
+    trio.ClosedResourceError,
+    FrameError,
+    OSError
+)
+
+
+class TrioServerChat(ServerChat):
+    """Сервер чата с отдельной задачей trio на каждое подключение"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.clients.users_messages.listener = self.wakeup_target
+
+    def wakeup_target(self, target: int | socket.socket) -> None:
+        if isinstance(target, int):
+            client = self.clients.get_client_by_user_id(target)
+        else:
+            client = self.clients.get_client_by_socket(target)
+        if client and client.wakeup:
+            client.wakeup()
+
+    async def init_listener(self) -> trio.SocketListener:
+        self.chat_socket = trio.socket.socket(
+            family=socket.AF_INET,
+            type=socket.SOCK_STREAM
+        )
+        self.chat_socket.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEADDR, 1
+        )
+        await self.chat_socket.bind(('localhost', self.port))
+        self.chat_socket.listen(self.max_users)
+        self.socket_connected = True
+        return trio.SocketListener(self.chat_socket)
+
+    async def receiving_loop(self, client: Client, stream: trio.SocketStream) -> None:
+        while await client.decoder.receive_into(stream.socket):
+            self.heartbeats.touch(client, received=True)
+            for data_bytes in client.decoder.pop_frames():
+                request: Request | None = self.decode_request(
+                    client, data_bytes
+                )
+                if request:
+                    logger.debug('Пришел новый запрос request=%s', request)
+                    await self.dispatch_request(client, request)
+
+    async def wait_messages(self, client: Client) -> list[QueueMessage]:
+        # Проверки соединения кладет в очередь планировщик run_heartbeats
+        messages = self.get_client_messages(client)
+        while not messages:
+            event = trio.Event()
+            client.wakeup = event.set
+            await event.wait()
+            client.wakeup = None
+            messages = self.get_client_messages(client)
+        return messages
+
+    async def sending_loop(self, client: Client, stream: trio.SocketStream) -> None:
+        while True:
+            messages = await self.wait_messages(client)
+            logger.debug(
+                'send_response %s count=%s',
+                client.socket.fileno(),
+                len(messages)
+            )
+            frames = [
+                frame
+                for message in messages
+                for frame in self.prepare_response(client, message)
+            ]
+            data = frames[0] if len(frames) == 1 else b''.join(frames)
+            try:
+                await stream.send_all(data)
+                self.heartbeats.touch(client)
+            except (trio.BrokenResourceError, trio.ClosedResourceError):
+                if client.user_id:
+                    for message in reversed(messages):
+                        self.clients.users_messages.put_back_message_to_queue(
+                            client.user_id,
+                            message
+                        )
+                raise
+
+    async def run_until_closed(
+        self,
+        loop: Callable[[Client, trio.SocketStream], Awaitable[None]],
+        client: Client,
+        stream: trio.SocketStream,
+        cancel_scope: trio.CancelScope
+    ) -> None:
+        """Ошибки соединения ловятся до детской, иначе при строгих группах
+        исключений trio они уйдут в serve_listeners и остановят сервер"""
+        try:
+            await loop(client, stream)
+        except CONNECTION_ERRORS as exc:
+            logger.debug('Соединение %s оборвано: %r', client.fileno, exc)
+        finally:
+            cancel_scope.cancel()
+
+    async def handle_connection(self, stream: trio.SocketStream) -> None:
+        client = Client(socket=stream.socket)
+        self.clients.append(client)
+        self.heartbeats.add(client)
+        logger.debug(
+            'Получен запрос на соединение от %s', stream.socket.getpeername()
+        )
+        try:
+            async with trio.open_nursery() as nursery:
+                for loop in (self.sending_loop, self.receiving_loop):
+                    nursery.start_soon(
+                        self.run_until_closed,
+                        loop,
+                        client,
+                        stream,
+                        nursery.cancel_scope
+                    )
+        finally:
+            logger.debug('Клиент %s отключился', stream.socket.fileno())
+            client.wakeup = None
+            self.heartbeats.remove(client)
+            self.clients.remove(client)
+            await stream.aclose()
+
+    async def serve(self) -> None:
+        listener = await self.init_listener()
+        logger.debug('Старт сервера на задачах trio')
+        await trio.serve_listeners(self.handle_connection, [listener])
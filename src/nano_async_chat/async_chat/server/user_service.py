@@ -2,11 +2,45 @@
 
 Позволяет сгруппировать основные операциями над orm сущностями"""
 import datetime as dt
-from sqlalchemy import select, delete, func
+from dataclasses import dataclass
+from sqlalchemy import select, delete, func, case, event, inspect
 from sqlalchemy.orm import (
     Session,
 )
-from ..server.db import User, History, Contact
+from ..server.db import SessionLocal, User, History, Contact, OfflineMessage
+
+CHANGED_USERS_KEY = 'changed_account_names'
+
+
+@event.listens_for(SessionLocal, 'before_flush')
+def remember_changed_users(session: Session, flush_context, instances) -> None:
+    """Запоминает имена измененных и удаленных пользователей сессии
+
+    По ним StorageExecutor сбрасывает записи кэша учетных данных"""
+    for instance in (*session.dirty, *session.deleted):
+        if not isinstance(instance, User):
+            continue
+        # Добавление контакта меняет только коллекцию, кэш это не задевает
+        if (instance not in session.deleted
+                and not session.is_modified(instance, include_collections=False)):
+            continue
+        names = session.info.setdefault(CHANGED_USERS_KEY, set())
+        names.add(instance.account_name)
+        # При переименовании сбрасывается и старое имя
+        names.update(inspect(instance).attrs.account_name.history.deleted)
+
+
+@dataclass(slots=True)
+class UserStat:
+    id: int
+    account_name: str
+    has_entered: bool
+    last_login_time: dt.datetime | None
+    last_message_time: dt.datetime | None
+    send_messages_count: int
+
+    def is_online(self) -> bool:
+        return bool(self.has_entered)
 
 
 class UserService:
@@ -17,9 +51,9 @@ class UserService:
         return self.session.scalars(select(User)).all()
 
     def get_online_users(self) -> list[User]:
-        users = self.get_users()
-        online_users = [u for u in users if u.is_online()]
-        return online_users
+        return self.session.scalars(
+            select(User).where(User.has_entered.is_(True))
+        ).all()
 
     def get_user_send_messages_count(self, user: User) -> int:
         session = Session.object_session(user)
@@ -35,6 +69,51 @@ class UserService:
         result = session.scalars(stm).first()
         return result
 
+    def get_users_stats(self) -> list[UserStat]:
+        """Статистика всех пользователей одним сгруппированным запросом"""
+        login = History.Event.login
+        send = History.Event.user_send_message_to_server
+        stats = (
+            select(
+                History.user_id,
+                func.max(
+                    case((History.event == login, History.time))
+                ).label('last_login_time'),
+                func.max(
+                    case((History.event == send, History.time))
+                ).label('last_message_time'),
+                func.count(
+                    case((History.event == send, 1))
+                ).label('send_messages_count'),
+            )
+            .where(History.event.in_((login, send)))
+            .group_by(History.user_id)
+            .subquery()
+        )
+        rows = self.session.execute(
+            select(
+                User.id,
+                User.account_name,
+                User.has_entered,
+                stats.c.last_login_time,
+                stats.c.last_message_time,
+                stats.c.send_messages_count,
+            )
+            .outerjoin(stats, stats.c.user_id == User.id)
+            .order_by(User.id)
+        )
+        return [
+            UserStat(
+                id=row.id,
+                account_name=row.account_name,
+                has_entered=row.has_entered,
+                last_login_time=row.last_login_time,
+                last_message_time=row.last_message_time,
+                send_messages_count=row.send_messages_count or 0,
+            )
+            for row in rows
+        ]
+
     def get_all_users_ids(self) -> list[int]:
         ids = self.session.scalars(select(User.id).select_from(User)).all()
         return ids
@@ -44,6 +123,14 @@ class UserService:
             select(User).filter(User.account_name == account_name)
         ).first()
 
+    def get_changed_account_names(self) -> set[str]:
+        return self.session.info.get(CHANGED_USERS_KEY, set())
+
+    def get_user_password(self, user_id: int) -> str | None:
+        return self.session.scalars(
+            select(User.password).where(User.id == user_id)
+        ).first()
+
     def get_user_by_id(self, id: int | None) -> User | None:
         if not id:
             return None
@@ -162,6 +249,32 @@ class UserService:
         self.session.add(history)
         self.session.commit()
 
+    def get_friends_account_names(self, user_id: int) -> list[str]:
+        stmt = (
+            select(User.account_name)
+            .join(Contact, User.id == Contact.friend_id)
+            .filter(Contact.user_id == user_id)
+        )
+        return self.session.scalars(stmt).all()
+
+    def add_contact_by_account_name(self, user_id: int, account_name: str) -> User | None:
+        contact = self.get_user_by_account_name(account_name)
+        if contact:
+            self.add_contact_for_user(
+                current_user=self.get_user_by_id(user_id),
+                contact=contact
+            )
+        return contact
+
+    def delete_contact_by_account_name(self, user_id: int, account_name: str) -> User | None:
+        contact = self.get_user_by_account_name(account_name)
+        if contact:
+            self.delete_contact_for_user(
+                current_user=self.get_user_by_id(user_id),
+                contact=contact
+            )
+        return contact
+
     def get_users_with_no_friends(self) -> list[User]:
         stmt = select(User).where(~User.contacts.any())
         return self.session.scalars(stmt).all()
@@ -186,3 +299,20 @@ class UserService:
         )
         self.session.execute(query)
         self.session.commit()
+
+    def take_offline_messages(self, user_id: int, limit: int) -> list[str]:
+        """Забирает из почтового ящика страницу сообщений по порядку"""
+        rows = self.session.execute(
+            select(OfflineMessage.id, OfflineMessage.message)
+            .filter_by(user_id=user_id)
+            .order_by(OfflineMessage.id)
+            .limit(limit)
+        ).all()
+        if rows:
+            self.session.execute(
+                delete(OfflineMessage)
+                .filter_by(user_id=user_id)
+                .filter(OfflineMessage.id <= rows[-1].id)
+            )
+            self.session.commit()
+        return [row.message for row in rows]
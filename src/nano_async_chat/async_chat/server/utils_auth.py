@@ -1,34 +1,120 @@
 """Декораторы и фукнции аутентификации"""
 from typing import Any
+import time
+import hashlib
 import logging
 import datetime as dt
+from collections import OrderedDict, defaultdict
 from functools import wraps
 from jose import JWTError, jwt
-from ..server.db import SessionLocal, User
-from ..server.user_service import UserService
+from ..server.identity_cache import UserIdentity
 from .. import settings
 from .. import jim
 
 logger = logging.getLogger('server-logger')
 
 
+class TokenCache:
+    """Проверенные токены до истечения их срока действия
+
+    Клиент присылает один и тот же токен в каждом запросе, поэтому
+    подпись проверяется один раз, а дальше берутся сохраненные claims"""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        # digest токена -> (claims, время истечения)
+        self._tokens: OrderedDict[bytes, tuple[dict[str, Any], float]] = OrderedDict()
+        self._digests_by_account: dict[str, set[bytes]] = defaultdict(set)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    @staticmethod
+    def get_digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict[str, Any] | None:
+        digest = self.get_digest(token)
+        cached = self._tokens.get(digest)
+        if cached is None:
+            self.misses += 1
+            return None
+        claims, expire = cached
+        if expire <= time.time():
+            self._forget(digest)
+            self.misses += 1
+            return None
+        self._tokens.move_to_end(digest)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict[str, Any]) -> None:
+        expire = claims.get('exp')
+        if expire is None:
+            return
+        digest = self.get_digest(token)
+        self._tokens[digest] = (claims, float(expire))
+        self._tokens.move_to_end(digest)
+        self._digests_by_account[claims.get('account_name')].add(digest)
+        if len(self._tokens) > self.max_size:
+            self._forget(next(iter(self._tokens)))
+
+    def evict_account(self, account_name: str) -> None:
+        for digest in self._digests_by_account.pop(account_name, ()):
+            self._tokens.pop(digest, None)
+
+    def _forget(self, digest: bytes) -> None:
+        claims, _ = self._tokens.pop(digest)
+        account_name = claims.get('account_name')
+        digests = self._digests_by_account.get(account_name)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._digests_by_account[account_name]
+
+    def get_stats(self) -> dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._tokens),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+token_cache = TokenCache()
+
+
+def decode_token(token: str) -> dict[str, Any]:
+    """Возвращает claims токена, подпись проверяется только при промахе кэша"""
+    if not isinstance(token, str):
+        raise JWTError('Token is required')
+    claims = token_cache.get(token)
+    if claims is None:
+        claims = jwt.decode(
+            token, settings.SECRET_KEY,
+            algorithms=[settings.ALGORITHM]
+        )
+        token_cache.put(token, claims)
+    return claims
+
+
 def login_required(func):
     @wraps(func)
-    def wrapper(self, data: dict[str, Any], current_user: User | None, *args, **kwargs):
+    async def wrapper(self, data: dict[str, Any], current_user: UserIdentity | None, *args, **kwargs):
         credentials_exception = False
         if not current_user:
             credentials_exception = True
-        if not current_user.is_online():
+        elif not self.presence.is_online(current_user.id):
             credentials_exception = True
 
         payload = None
         if not credentials_exception:
             token = data.get('token')
             try:
-                payload = jwt.decode(
-                    token, settings.SECRET_KEY,
-                    algorithms=[settings.ALGORITHM]
-                )
+                payload = decode_token(token)
                 account_name = payload.get('account_name')
             except JWTError:
                 credentials_exception = True
@@ -44,35 +130,31 @@ def login_required(func):
             )
             self.put_message_for_current_client(error_message)
             return
-        return func(self, data, current_user, *args, **kwargs)
+        return await func(self, data, current_user, *args, **kwargs)
     return wrapper
 
 
 def append_current_user(func):
     @wraps(func)
-    def wrapper(self, data: dict[str, Any], *args, **kwargs):
+    async def wrapper(self, data: dict[str, Any], *args, **kwargs):
         account_name: dict[str, str] | None = (
             data.get('user', {}).get('account_name')
         )
         current_user = None
         if account_name:
-            with SessionLocal() as session:
-                user_service = UserService(session=session)
-                current_user = user_service.get_user_by_account_name(
-                    account_name=account_name
+            current_user = await self.storage.get_identity(account_name)
+            if not current_user:
+                error_message = jim.MessageError(
+                    chain_id=data.get('id'),
+                    response=jim.StatusCodes.HTTP_404_NOT_FOUND,
+                    error='User not found'
+                ).json()
+                logger.error(
+                    f'User not found for data={data} '
                 )
-                if not current_user:
-                    error_message = jim.MessageError(
-                        chain_id=data.get('id'),
-                        response=jim.StatusCodes.HTTP_404_NOT_FOUND,
-                        error='User not found'
-                    ).json()
-                    logger.error(
-                        f'User not found for data={data} '
-                    )
-                    self.put_message_for_current_client(error_message)
-                    return
-        return func(self, data, current_user, *args, **kwargs)
+                self.put_message_for_current_client(error_message)
+                return
+        return await func(self, data, current_user, *args, **kwargs)
     return wrapper
 
 
@@ -9,6 +9,9 @@ BASE_DIR = Path(__file__).resolve().parent
 load_dotenv()
 
 database_path = os.environ['database']
+# Клиент без запросов дольше стольких секунд отключается, 0 - не отключать.
+# Клиенты не отвечают на MessageProbe, поэтому по умолчанию выключено
+IDLE_TIMEOUT = float(os.environ.get('idle_timeout', 0)) or None
 PRIVATE_KEY_PATH = BASE_DIR/'publc_key.pem'
 PUBLICK_KEY_PATH = BASE_DIR/'private_key.pem'
 
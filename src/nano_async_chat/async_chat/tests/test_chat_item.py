@@ -0,0 +1,67 @@
+import unittest
+from ..client.client_ui.chat_item import (
+    ChatItem,
+    ChatLine,
+    OutgoingChatLine
+)
+
+
+class TestChatItem(unittest.TestCase):
+    def test_append_and_trim(self):
+        chat_item = ChatItem(max_lines=10, trim_step=3)
+        for i in range(10):
+            self.assertEqual(chat_item.append_line(ChatLine(str(i))), i)
+        self.assertEqual(chat_item.get_overflow(), 0)
+        chat_item.append_line(ChatLine('10'))
+        overflow = chat_item.get_overflow()
+        self.assertEqual(overflow, 4)
+        chat_item.trim(overflow)
+        self.assertEqual(
+            [line.message for line in chat_item.lines],
+            [str(i) for i in range(4, 11)]
+        )
+
+    def test_accepted_lines(self):
+        chat_item = ChatItem()
+        chat_item.append_line(OutgoingChatLine('a', message_id='1'))
+        chat_item.append_line(ChatLine('command'))
+        chat_item.append_line(OutgoingChatLine('b', message_id='2'))
+        self.assertEqual(chat_item.accepted_lines('2'), 2)
+        self.assertTrue(chat_item.lines[2].accepted)
+        self.assertFalse(chat_item.lines[0].accepted)
+        self.assertIsNone(chat_item.accepted_lines('3'))
+
+    def test_index_after_trim(self):
+        chat_item = ChatItem(max_lines=3, trim_step=1)
+        for i in range(5):
+            chat_item.append_line(ChatLine(
+                str(i), message_id=f'id{i}', message_chain_id=f'chain{i}'
+            ))
+            overflow = chat_item.get_overflow()
+            if overflow:
+                chat_item.trim(overflow)
+        self.assertEqual(chat_item.offset, 2)
+        self.assertIsNone(chat_item.get_line_by_message_id('id1'))
+        self.assertEqual(chat_item.get_line_by_message_id('id4').message, '4')
+        self.assertEqual(
+            chat_item.get_line_by_message_chain_id('chain3').message, '3'
+        )
+        self.assertEqual(chat_item.get_line_by_chain_id('id3').message, '3')
+        self.assertEqual(chat_item.accepted_lines('id4'), 2)
+
+    def test_dirty_range(self):
+        chat_item = ChatItem(max_lines=4, trim_step=2)
+        for i in range(4):
+            chat_item.append_line(OutgoingChatLine(str(i), message_id=str(i)))
+        self.assertIsNone(chat_item.pop_dirty())
+        chat_item.accepted_lines('1')
+        chat_item.accepted_lines('3')
+        self.assertEqual(chat_item.pop_dirty(), (1, 3))
+        self.assertIsNone(chat_item.pop_dirty())
+
+        chat_item.accepted_lines('1')
+        chat_item.accepted_lines('3')
+        chat_item.append_line(ChatLine('4'))
+        chat_item.trim(chat_item.get_overflow())
+        # Строка 1 срезана, строка 3 теперь первая в окне
+        self.assertEqual(chat_item.pop_dirty(), (0, 0))
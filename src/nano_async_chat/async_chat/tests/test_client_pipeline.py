@@ -0,0 +1,81 @@
+import json
+import unittest
+from functools import partial
+import trio
+from .. import jim
+from ..client import ClientChat
+from ..client.client_ui.client_ui_talk import ClientUiTalk
+from ..frame_codec import FrameDecoder, encode_frame
+from ..utils import decrypt, load_keys
+
+
+class TestClientPipeline(unittest.TestCase):
+    def make_client(self, port: int) -> tuple[ClientChat, ClientUiTalk]:
+        client_ui_talk = ClientUiTalk()
+        client_chat = ClientChat(
+            account_name=None,
+            password=None,
+            ip_address='127.0.0.1',
+            port=port,
+            client_ui_talk=client_ui_talk,
+            session_encryption=False
+        )
+        return client_chat, client_ui_talk
+
+    def test_receive_burst_and_send_batch(self):
+        private_key, _ = load_keys()
+        count = 200
+        requests = []
+
+        async def handler(stream: trio.SocketStream) -> None:
+            burst = b''.join(
+                encode_frame(b'{"seq": %d}' % seq) + encode_frame(
+                    jim.MessageSendMessage(
+                        from_='Ivan1',
+                        to_='Ivan2',
+                        message=f'm{seq}',
+                        user=dict(account_name='Ivan1'),
+                        token='token'
+                    ).json().encode()
+                )
+                for seq in range(1, count + 1)
+            )
+            await stream.send_all(burst)
+            decoder = FrameDecoder()
+            while len(requests) < 3:
+                await decoder.receive_into(stream.socket)
+                requests.extend(
+                    json.loads(decrypt(frame, private_key))
+                    for frame in decoder.pop_frames()
+                )
+
+        async def main() -> list[str]:
+            async with trio.open_nursery() as nursery:
+                listeners = await nursery.start(
+                    partial(trio.serve_tcp, handler, 0, host='127.0.0.1')
+                )
+                port = listeners[0].socket.getsockname()[1]
+                client_chat, client_ui_talk = self.make_client(port)
+                for message in ('a', 'b', 'c'):
+                    await client_chat.send_outgoing_message(
+                        json.dumps({'message': message})
+                    )
+                nursery.start_soon(client_chat.connection_loop)
+                messages = []
+                with trio.fail_after(5):
+                    while len(messages) < count:
+                        message_model = (
+                            await client_ui_talk.receive_channel_to_ui.receive()
+                        )
+                        messages.append(message_model.message)
+                    while len(requests) < 3:
+                        await trio.sleep(0.01)
+                self.assertEqual(client_chat.last_seq, count)
+                nursery.cancel_scope.cancel()
+            return messages
+
+        messages = trio.run(main)
+        self.assertEqual(messages, [f'm{seq}' for seq in range(1, count + 1)])
+        self.assertEqual(
+            [request['message'] for request in requests], ['a', 'b', 'c']
+        )
@@ -0,0 +1,117 @@
+import unittest
+from unittest.mock import MagicMock
+from ..server.clients import Client, Clients
+
+
+class FakeSocket:
+    def __init__(self, fileno: int):
+        self._fileno = fileno
+
+    def fileno(self) -> int:
+        return self._fileno
+
+
+class TestClients(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clients = Clients()
+        self.clients.logout_client = MagicMock()
+        self.client = Client(socket=FakeSocket(10))
+        self.clients.append(self.client)
+
+    def test_append(self):
+        self.assertEqual(len(self.clients), 1)
+        self.assertIs(
+            self.clients.get_client_by_socket(self.client.socket),
+            self.client
+        )
+        self.assertIs(self.clients.get_client_by_fileno(10), self.client)
+        self.assertIsNone(self.clients.get_client_by_user_id(1))
+
+    def test_login_logout(self):
+        self.clients.login(self.client, user_id=1, account_name='Ivan1')
+        self.assertIs(self.clients.get_client_by_user_id(1), self.client)
+        self.assertIs(
+            self.clients.get_client_by_account_name('Ivan1'),
+            self.client
+        )
+        self.clients.logout(self.client)
+        self.assertIsNone(self.client.user_id)
+        self.assertIsNone(self.clients.get_client_by_user_id(1))
+        self.assertIsNone(self.clients.get_client_by_account_name('Ivan1'))
+        self.assertEqual(len(self.clients), 1)
+
+    def test_remove(self):
+        self.clients.login(self.client, user_id=1, account_name='Ivan1')
+        self.clients.remove(self.client)
+        self.clients.logout_client.assert_called_once()
+        self.assertEqual(len(self.clients), 0)
+        self.assertIsNone(self.clients.get_client_by_fileno(10))
+        self.assertIsNone(self.clients.get_client_by_user_id(1))
+        self.clients.remove(self.client)
+        self.clients.logout_client.assert_called_once()
+
+    def test_remove_another_client_with_user(self):
+        self.clients.login(self.client, user_id=1, account_name='Ivan1')
+        new_client = Client(socket=FakeSocket(11))
+        self.clients.append(new_client)
+        self.clients.remove_another_client_with_user(1)
+        self.clients.login(new_client, user_id=1, account_name='Ivan1')
+        self.assertIs(self.clients.get_client_by_user_id(1), new_client)
+        self.assertEqual(list(self.clients), [new_client.socket])
+        self.clients.remove(self.client)
+        self.clients.logout_client.assert_not_called()
+
+
+class TestClientsRooms(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clients = Clients()
+        self.clients.logout_client = MagicMock()
+        self.items = []
+        for i in range(1, 4):
+            client = Client(socket=FakeSocket(10 + i))
+            self.clients.append(client)
+            self.clients.login(client, user_id=i, account_name=f'Ivan{i}')
+            self.items.append(client)
+
+    def test_common_room(self):
+        self.assertEqual(
+            self.clients.get_users_ids_in_room('common'),
+            frozenset({1, 2, 3})
+        )
+        self.assertEqual(
+            self.clients.get_users_ids_in_room(None),
+            frozenset({1, 2, 3})
+        )
+
+    def test_snapshot_cached_until_membership_changes(self):
+        snapshot = self.clients.get_users_ids_in_room('common')
+        self.assertIs(self.clients.get_users_ids_in_room('common'), snapshot)
+        self.clients.join_to_room(self.items[0], 'gamers')
+        self.assertIs(self.clients.get_users_ids_in_room('common'), snapshot)
+        self.clients.logout(self.items[2])
+        new_snapshot = self.clients.get_users_ids_in_room('common')
+        self.assertIsNot(new_snapshot, snapshot)
+        self.assertEqual(new_snapshot, frozenset({1, 2}))
+
+    def test_join_leave(self):
+        gamer = self.items[0]
+        self.clients.join_to_room(gamer, 'gamers')
+        self.assertEqual(self.clients.get_room_name(gamer), 'gamers')
+        self.assertEqual(
+            self.clients.get_users_ids_in_room('gamers'),
+            frozenset({1})
+        )
+        self.clients.join_to_room(gamer, 'readers')
+        self.assertEqual(self.clients.get_users_ids_in_room('gamers'), frozenset())
+        self.assertEqual(self.clients.leave_room(gamer), 'readers')
+        self.assertEqual(self.clients.get_room_name(gamer), 'common')
+        self.assertEqual(self.clients.get_users_ids_in_room('readers'), frozenset())
+
+    def test_remove_leaves_rooms(self):
+        self.clients.join_to_room(self.items[1], 'gamers')
+        self.clients.remove(self.items[1])
+        self.assertEqual(self.clients.get_users_ids_in_room('gamers'), frozenset())
+        self.assertEqual(
+            self.clients.get_users_ids_in_room('common'),
+            frozenset({1, 3})
+        )
@@ -0,0 +1,93 @@
+import unittest
+from .. import jim
+from ..client.client_response_handler import ClientResponseHandler
+from ..client.current_user import User
+from ..server.contacts_log import ContactsLog, squash_changes
+
+
+class TestContactsLog(unittest.TestCase):
+    def test_record_and_changes_since(self):
+        contacts_log = ContactsLog(start_version=100)
+        self.assertEqual(contacts_log.get_version(1), 100)
+        self.assertEqual(contacts_log.record(1, 'Ivan2', added=True)[0], 100)
+        contacts_log.record(2, 'Ivan1', added=True)
+        since_version, change = contacts_log.record(1, 'Ivan3', added=True)
+        self.assertEqual((since_version, change.version), (101, 103))
+        self.assertEqual(contacts_log.get_version(1), 103)
+        self.assertEqual(
+            [change.account_name for change in contacts_log.changes_since(1, 100)],
+            ['Ivan2', 'Ivan3']
+        )
+        self.assertEqual(contacts_log.changes_since(1, 103), [])
+        # Версии до начала журнала и из будущего журнал не покрывает
+        self.assertIsNone(contacts_log.changes_since(1, 99))
+        self.assertIsNone(contacts_log.changes_since(1, 104))
+
+    def test_max_changes(self):
+        contacts_log = ContactsLog(max_changes=2, start_version=0)
+        for name in ('Ivan2', 'Ivan3', 'Ivan4'):
+            contacts_log.record(1, name, added=True)
+        self.assertIsNone(contacts_log.changes_since(1, 0))
+        self.assertEqual(len(contacts_log.changes_since(1, 1)), 2)
+
+    def test_evicted_user_version_grows(self):
+        contacts_log = ContactsLog(max_users=1, start_version=0)
+        contacts_log.record(1, 'Ivan2', added=True)
+        contacts_log.record(2, 'Ivan1', added=True)
+        # Журнал пользователя 1 вытеснен, его версия 1 больше не покрыта
+        self.assertIsNone(contacts_log.changes_since(1, 1))
+        self.assertEqual(contacts_log.get_version(1), 2)
+
+    def test_squash_changes(self):
+        contacts_log = ContactsLog(start_version=0)
+        contacts_log.record(1, 'Ivan2', added=True)
+        contacts_log.record(1, 'Ivan3', added=True)
+        contacts_log.record(1, 'Ivan2', added=False)
+        self.assertEqual(
+            squash_changes(contacts_log.changes_since(1, 0)),
+            (['Ivan3'], ['Ivan2'])
+        )
+
+
+class TestApplyContacts(unittest.TestCase):
+    def setUp(self):
+        self.handler = ClientResponseHandler()
+        self.handler.current_user = User()
+
+    def contacts(self, alert, removed=(), version=None, since_version=None):
+        return jim.MessageContacts(
+            response=jim.StatusCodes.HTTP_200_OK,
+            alert=[dict(account_name=name) for name in alert],
+            removed=[dict(account_name=name) for name in removed],
+            version=version,
+            since_version=since_version
+        )
+
+    def get_names(self):
+        return [
+            contact.account_name
+            for contact in self.handler.current_user.contacts
+        ]
+
+    def test_full_and_delta(self):
+        self.assertTrue(self.handler.apply_contacts(
+            self.contacts(['Ivan2', 'Ivan3'], version=10)
+        ))
+        self.assertTrue(self.handler.apply_contacts(
+            self.contacts(['Ivan4'], ['Ivan2'], version=12, since_version=10)
+        ))
+        self.assertEqual(self.get_names(), ['Ivan3', 'Ivan4'])
+        self.assertEqual(self.handler.current_user.contacts_version, 12)
+        # Старое изменение после нового ничего не меняет
+        self.assertTrue(self.handler.apply_contacts(
+            self.contacts(['Ivan4'], version=11, since_version=10)
+        ))
+        self.assertEqual(self.get_names(), ['Ivan3', 'Ivan4'])
+
+    def test_gap_resets_version(self):
+        self.handler.apply_contacts(self.contacts(['Ivan2'], version=10))
+        self.assertFalse(self.handler.apply_contacts(
+            self.contacts(['Ivan4'], version=13, since_version=12)
+        ))
+        self.assertIsNone(self.handler.current_user.contacts_version)
+        self.assertEqual(self.get_names(), ['Ivan2'])
@@ -0,0 +1,106 @@
+import unittest
+from ..frame_codec import FrameDecoder, FrameError, SendBuffer, encode_frame
+
+
+class FakeSocket:
+    def __init__(self, chunks: list[bytes]):
+        self.chunks = chunks
+
+    def recv_into(self, buffer: memoryview) -> int:
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class FakeSendSocket:
+    def __init__(self, limits: list[int]):
+        self.limits = limits
+        self.calls = 0
+        self.data = b''
+
+    def sendmsg(self, buffers: list[memoryview]) -> int:
+        self.calls += 1
+        limit = self.limits.pop(0)
+        if limit == 0:
+            raise BlockingIOError()
+        data = b''.join(buffers)[:limit]
+        self.data += data
+        return len(data)
+
+
+class TestFrameCodec(unittest.TestCase):
+    def test_encode_frame(self):
+        self.assertEqual(encode_frame(b'hello'), b'0005hello')
+        self.assertEqual(encode_frame(b''), b'0000')
+
+    def test_encode_too_big_frame(self):
+        with self.assertRaises(FrameError):
+            encode_frame(b'x' * 0x10000)
+
+    def test_many_frames_in_one_read(self):
+        data = b''.join(encode_frame(f'm{i}'.encode()) for i in range(50))
+        decoder = FrameDecoder()
+        nbytes = decoder.recv_into(FakeSocket([data]))
+        self.assertEqual(nbytes, len(data))
+        frames = decoder.pop_frames()
+        self.assertEqual(frames, [f'm{i}'.encode() for i in range(50)])
+        self.assertEqual(len(decoder), 0)
+
+    def test_partial_frame_kept_between_reads(self):
+        data = encode_frame(b'first') + encode_frame(b'second')
+        decoder = FrameDecoder()
+        sock = FakeSocket([data[:2], data[2:12], data[12:]])
+        decoder.recv_into(sock)
+        self.assertEqual(decoder.pop_frames(), [])
+        decoder.recv_into(sock)
+        self.assertEqual(decoder.pop_frames(), [b'first'])
+        decoder.recv_into(sock)
+        self.assertEqual(decoder.pop_frames(), [b'second'])
+
+    def test_closed_socket(self):
+        decoder = FrameDecoder()
+        self.assertEqual(decoder.recv_into(FakeSocket([])), 0)
+
+    def test_bad_head(self):
+        decoder = FrameDecoder()
+        decoder.feed(b'zzzzdata')
+        with self.assertRaises(FrameError):
+            decoder.pop_frames()
+
+    def test_signed_or_prefixed_head(self):
+        for head in (b'-004', b'0x04', b' +04', b'+004', b'004 '):
+            with self.subTest(head=head):
+                decoder = FrameDecoder()
+                decoder.feed(head + b'xxxx')
+                with self.assertRaises(FrameError):
+                    decoder.pop_frames()
+
+    def test_send_buffer_one_call_for_backlog(self):
+        send_buffer = SendBuffer()
+        frames = [encode_frame(f'm{i}'.encode()) for i in range(100)]
+        for i, frame in enumerate(frames):
+            send_buffer.append(frame, f'm{i}')
+        sock = FakeSendSocket([10 ** 6])
+        send_buffer.send(sock)
+        self.assertEqual(sock.calls, 1)
+        self.assertEqual(sock.data, b''.join(frames))
+        self.assertEqual(len(send_buffer), 0)
+        self.assertFalse(send_buffer.would_block)
+
+    def test_send_buffer_partial_send(self):
+        send_buffer = SendBuffer()
+        send_buffer.append(encode_frame(b'first'), 'first')
+        send_buffer.append(encode_frame(b'second'), 'second')
+        sock = FakeSendSocket([7, 0, 100])
+        send_buffer.send(sock)
+        self.assertTrue(send_buffer.would_block)
+        self.assertEqual(send_buffer.pending_messages(), ['first', 'second'])
+        send_buffer.send(sock)
+        self.assertTrue(send_buffer.would_block)
+        self.assertEqual(len(send_buffer), 12)
+        send_buffer.send(sock)
+        self.assertFalse(send_buffer.would_block)
+        self.assertEqual(sock.data, b'0005first0006second')
+        self.assertEqual(send_buffer.pending_messages(), [])
@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import MagicMock
+import trio
+from ..server import ServerChat
+from ..server.clients import Client
+from ..server.heartbeat import HeartbeatScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestHeartbeatScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.scheduler = HeartbeatScheduler(
+            period_probe=10,
+            idle_timeout=25,
+            clock=self.clock
+        )
+        self.client = Client(socket=None, user_id=1)
+        self.scheduler.add(self.client)
+
+    def test_probe_after_period(self):
+        self.clock.now = 9
+        self.assertEqual(self.scheduler.pop_due(), ([], []))
+        self.clock.now = 10
+        self.assertEqual(self.scheduler.pop_due(), ([self.client], []))
+        self.assertEqual(self.scheduler.next_deadline(), 20)
+
+    def test_traffic_reschedules(self):
+        self.clock.now = 8
+        self.scheduler.touch(self.client, received=True)
+        self.clock.now = 10
+        self.assertEqual(self.scheduler.pop_due(), ([], []))
+        self.assertEqual(self.scheduler.next_deadline(), 18)
+        self.assertEqual(len(self.scheduler), 1)
+
+    def test_reap_idle(self):
+        for now in (10, 20):
+            self.clock.now = now
+            self.assertEqual(self.scheduler.pop_due(), ([self.client], []))
+        self.clock.now = 25
+        self.assertEqual(self.scheduler.pop_due(), ([], [self.client]))
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_removed_and_inactive_clients_dropped(self):
+        anonymous = Client(socket=None)
+        self.scheduler.is_active = lambda client: client is not anonymous
+        self.scheduler.add(anonymous)
+        self.scheduler.remove(self.client)
+        self.clock.now = 10
+        self.assertEqual(self.scheduler.pop_due(), ([], []))
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_on_earlier_deadline(self):
+        self.scheduler.on_earlier_deadline = MagicMock()
+        self.clock.now = 5
+        # Срок нового клиента позже текущего ближайшего
+        self.scheduler.add(Client(socket=None, user_id=2))
+        self.scheduler.on_earlier_deadline.assert_not_called()
+        self.scheduler.pop_due()
+        self.scheduler.idle_timeout = 1
+        self.scheduler.add(Client(socket=None, user_id=3))
+        self.scheduler.on_earlier_deadline.assert_called_once()
+
+
+class TestRunHeartbeats(unittest.TestCase):
+    def test_wakes_up_for_new_client(self):
+        server = ServerChat(port=0, max_users=1, idle_timeout=0.05)
+        server.disconnect_client = MagicMock()
+        server.heartbeats.is_active = None
+        client = Client(socket=None, user_id=1)
+
+        async def main():
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(server.run_heartbeats)
+                # Куча пуста, цикл ждет без срока
+                await trio.sleep(0.01)
+                server.heartbeats.add(client)
+                with trio.fail_after(1):
+                    while not server.disconnect_client.called:
+                        await trio.sleep(0.01)
+                nursery.cancel_scope.cancel()
+
+        trio.run(main)
+        server.disconnect_client.assert_called_once_with(client)
@@ -0,0 +1,52 @@
+import unittest
+from unittest.mock import MagicMock
+from sqlalchemy import delete, select, func
+from ..server.db import SessionLocal, History
+from ..server.history_writer import HistoryWriter
+
+
+class TestHistoryWriter(unittest.TestCase):
+    adress = 'test_history_writer'
+
+    def tearDown(self):
+        with SessionLocal() as session:
+            session.execute(delete(History).filter_by(adress=self.adress))
+            session.commit()
+
+    def get_history_count(self) -> int:
+        with SessionLocal() as session:
+            return session.scalars(
+                select(func.count('*')).select_from(History)
+            ).one()
+
+    def test_flush_writes_all_events_in_one_batch(self):
+        writer = HistoryWriter()
+        writer.write_events = MagicMock(wraps=writer.write_events)
+        count_before = self.get_history_count()
+        for _ in range(10):
+            writer.record(
+                History.Event.user_send_message_to_server,
+                user_id=None,
+                adress=self.adress
+            )
+        self.assertEqual(self.get_history_count(), count_before)
+        self.assertEqual(writer.flush(), 10)
+        writer.write_events.assert_called_once()
+        self.assertEqual(self.get_history_count(), count_before + 10)
+        self.assertEqual(writer.get_stats()['flushed'], 10)
+        self.assertEqual(writer.flush(), 0)
+
+    def test_max_size(self):
+        writer = HistoryWriter(max_size=3)
+        for _ in range(5):
+            writer.record(History.Event.login, user_id=None)
+        self.assertEqual(len(writer), 3)
+        self.assertEqual(writer.get_stats()['dropped'], 2)
+
+    def test_failed_write_counted_as_dropped(self):
+        writer = HistoryWriter()
+        writer.write_events = MagicMock(side_effect=Exception('db is locked'))
+        writer.record(History.Event.login, user_id=None)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.get_stats()['dropped'], 1)
+        self.assertEqual(len(writer), 0)
@@ -0,0 +1,41 @@
+import unittest
+from ..server.identity_cache import IdentityCache, UserIdentity
+
+
+def make_identity(account_name: str, user_id: int = 1) -> UserIdentity:
+    return UserIdentity(
+        id=user_id,
+        account_name=account_name,
+        password_version='hash'
+    )
+
+
+class TestIdentityCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = IdentityCache(max_size=2)
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get('Ivan1'))
+        self.cache.put(make_identity('Ivan1'), self.cache.generation)
+        self.assertEqual(self.cache.get('Ivan1').id, 1)
+        self.assertEqual(self.cache.get_stats(), dict(size=1, hits=1, misses=1))
+
+    def test_lru_eviction(self):
+        for user_id, name in enumerate(('Ivan1', 'Ivan2', 'Ivan3')):
+            if name == 'Ivan3':
+                self.cache.get('Ivan1')
+            self.cache.put(make_identity(name, user_id), self.cache.generation)
+        self.assertIsNotNone(self.cache.get('Ivan1'))
+        self.assertIsNone(self.cache.get('Ivan2'))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_invalidate(self):
+        self.cache.put(make_identity('Ivan1'), self.cache.generation)
+        self.cache.invalidate('Ivan1')
+        self.assertIsNone(self.cache.get('Ivan1'))
+
+    def test_stale_put_ignored(self):
+        generation = self.cache.generation
+        self.cache.invalidate('Ivan2')
+        self.assertFalse(self.cache.put(make_identity('Ivan1'), generation))
+        self.assertIsNone(self.cache.get('Ivan1'))
@@ -0,0 +1,64 @@
+import unittest
+from ..client.message_chain import AutoCleaningDict
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestAutoCleaningDict(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.chain = AutoCleaningDict(timeout=10, max_size=3, clock=self.clock)
+
+    def test_get_keeps_value(self):
+        self.chain['a'] = 1
+        self.assertEqual(self.chain.get('a'), 1)
+        self.assertEqual(self.chain.get('a'), 1)
+        self.assertIsNone(self.chain.get('b'))
+
+    def test_expire(self):
+        self.chain['a'] = 1
+        self.clock.now = 5
+        self.chain['b'] = 2
+        self.clock.now = 10
+        self.assertIsNone(self.chain.get('a'))
+        self.assertEqual(list(self.chain), ['b'])
+        self.clock.now = 15
+        self.assertEqual(len(self.chain), 0)
+        self.assertEqual(self.chain.expired, 2)
+
+    def test_cleanup_on_insert(self):
+        self.chain['a'] = 1
+        self.clock.now = 10
+        self.chain['b'] = 2
+        self.assertEqual(self.chain.get_stats()['size'], 1)
+        self.assertEqual(self.chain.get_stats()['expiry_queue'], 1)
+
+    def test_lru_eviction(self):
+        self.chain['a'] = 1
+        self.chain['b'] = 2
+        self.chain['c'] = 3
+        self.chain['a']
+        self.chain['d'] = 4
+        self.assertEqual(sorted(self.chain), ['a', 'c', 'd'])
+        self.assertEqual(self.chain.evicted, 1)
+
+    def test_overwrite_extends_expiry(self):
+        self.chain['a'] = 1
+        self.clock.now = 5
+        self.chain['a'] = 2
+        self.clock.now = 12
+        self.assertEqual(self.chain['a'], 2)
+        del self.chain['a']
+        self.assertNotIn('a', self.chain)
+
+    def test_expiry_queue_bounded(self):
+        for index in range(100):
+            self.chain['a'] = index
+        self.assertLessEqual(self.chain.get_stats()['expiry_queue'], 6)
+        self.assertEqual(self.chain['a'], 99)
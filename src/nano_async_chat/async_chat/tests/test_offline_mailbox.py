@@ -0,0 +1,93 @@
+import unittest
+import threading
+from unittest.mock import MagicMock
+import trio
+from ..frame_codec import encode_frame
+from ..server.clients import UsersMessages
+from ..server.db import SessionLocal
+from ..server.offline_mailbox import OfflineMailbox
+from ..server.storage import StorageExecutor
+from ..server.user_service import UserService
+
+
+class TestOfflineMailbox(unittest.TestCase):
+    def setUp(self):
+        with SessionLocal() as session:
+            self.user_id = UserService(session).get_users()[0].id
+        self.users_messages = UsersMessages()
+        self.mailbox = OfflineMailbox(
+            storage=StorageExecutor(),
+            users_messages=self.users_messages,
+            is_online=lambda user_id: True,
+            page_size=2
+        )
+
+    def take_page(self) -> list[str]:
+        with SessionLocal() as session:
+            return UserService(session).take_offline_messages(
+                self.user_id, self.mailbox.page_size
+            )
+
+    def test_store_and_take_pages(self):
+        for i in range(3):
+            self.mailbox.store(self.user_id, f'message{i}')
+        self.assertEqual(self.mailbox.flush(), 3)
+        self.assertEqual(self.take_page(), ['message0', 'message1'])
+        self.assertEqual(self.take_page(), ['message2'])
+        self.assertEqual(self.take_page(), [])
+
+    def test_failed_flush_keeps_messages(self):
+        self.mailbox.write_messages = MagicMock(side_effect=OSError('disk'))
+        self.mailbox.store(self.user_id, 'message')
+        with self.assertLogs('server-logger', level='ERROR'):
+            self.assertEqual(self.mailbox.flush(), 0)
+        self.assertEqual(len(self.mailbox), 1)
+
+    def test_save_queued_chat_messages(self):
+        self.users_messages.put_message_to_queue(self.user_id, 'ack')
+        self.users_messages.put_message_to_queue(
+            self.user_id, encode_frame(b'room message'), bulk=True
+        )
+        self.users_messages.put_message_to_queue(
+            self.user_id, 'direct message', bulk=True
+        )
+        self.assertEqual(self.mailbox.save_queued(), 2)
+        self.mailbox.flush()
+        self.assertEqual(self.take_page(), ['room message', 'direct message'])
+        self.assertEqual(
+            self.users_messages.get_all_messages_from_queue(self.user_id),
+            ['ack']
+        )
+        self.assertEqual(self.users_messages.total_messages, 0)
+
+    def test_deliver_waits_for_running_flush(self):
+        started = threading.Event()
+        release = threading.Event()
+        write_messages = self.mailbox.write_messages
+
+        def slow_write(messages):
+            started.set()
+            release.wait(1)
+            write_messages(messages)
+
+        self.mailbox.write_messages = slow_write
+        self.mailbox.store(self.user_id, 'message')
+
+        async def release_later():
+            await trio.sleep(0.05)
+            release.set()
+
+        async def main():
+            async with trio.open_nursery() as nursery:
+                # Периодическое сохранение уже забрало сообщение из буфера
+                nursery.start_soon(self.mailbox.flush_in_thread)
+                while not started.is_set():
+                    await trio.sleep(0.01)
+                nursery.start_soon(release_later)
+                return await self.mailbox.deliver(self.user_id)
+
+        self.assertEqual(trio.run(main), 1)
+        self.assertEqual(
+            self.users_messages.get_all_messages_from_queue(self.user_id),
+            ['message']
+        )
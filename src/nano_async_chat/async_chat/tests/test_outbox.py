@@ -0,0 +1,114 @@
+import unittest
+from ..server.clients import UsersMessages
+from ..server.outbox import Outbox, OutboxLimits, OverflowPolicy
+
+
+class TestOutbox(unittest.TestCase):
+    def make_outbox(self, policy: OverflowPolicy) -> Outbox:
+        return Outbox(OutboxLimits(max_messages=3, max_bytes=100, policy=policy))
+
+    def test_drop_oldest(self):
+        outbox = self.make_outbox(OverflowPolicy.drop_oldest)
+        for message in ('a', 'b', 'c', 'd'):
+            outbox.append(message)
+        self.assertEqual(outbox.take_all(), ['b', 'c', 'd'])
+        self.assertEqual(outbox.dropped, 1)
+        self.assertEqual(outbox.size, 0)
+
+    def test_drop_newest(self):
+        outbox = self.make_outbox(OverflowPolicy.drop_newest)
+        for message in ('a', 'b', 'c', 'd'):
+            outbox.append(message)
+        self.assertEqual(list(outbox), ['a', 'b', 'c'])
+
+    def test_byte_limit_and_high_water(self):
+        outbox = self.make_outbox(OverflowPolicy.drop_oldest)
+        outbox.append(b'x' * 60)
+        outbox.append(b'y' * 60)
+        self.assertEqual(list(outbox), [b'y' * 60])
+        self.assertEqual(outbox.size, 60)
+        self.assertEqual(outbox.high_water_bytes, 120)
+
+    def test_disconnect_keeps_messages(self):
+        outbox = self.make_outbox(OverflowPolicy.disconnect)
+        for message in ('a', 'b', 'c', 'd'):
+            self.assertEqual(outbox.append(message), 0)
+        self.assertTrue(outbox.is_overflowed())
+
+
+class TestUsersMessages(unittest.TestCase):
+    def test_totals(self):
+        users_messages = UsersMessages(
+            limits=OutboxLimits(max_messages=2)
+        )
+        for message in ('aa', 'bb', 'cc'):
+            users_messages.put_message_to_queue(1, message)
+        users_messages.put_message_to_queue(2, b'frame')
+        self.assertEqual(users_messages.total_messages, 3)
+        self.assertEqual(users_messages.total_bytes, 9)
+        self.assertEqual(users_messages.dropped, 1)
+        self.assertEqual(
+            users_messages.get_all_messages_from_queue(1), ['bb', 'cc']
+        )
+        users_messages.discard(2)
+        self.assertEqual(users_messages.total_messages, 0)
+        self.assertEqual(users_messages.total_bytes, 0)
+        self.assertEqual(users_messages.get_all_messages_from_queue(3), [])
+
+    def test_disconnect_policy(self):
+        overflowed = []
+        users_messages = UsersMessages(
+            limits=OutboxLimits(
+                max_messages=2, policy=OverflowPolicy.disconnect
+            ),
+            overflow_listener=overflowed.append
+        )
+        for message in ('a', 'b', 'c'):
+            users_messages.put_message_to_queue(1, message)
+        self.assertEqual(overflowed, [1])
+        self.assertEqual(users_messages.total_messages, 0)
+        self.assertEqual(users_messages.get_stats()['disconnected'], 1)
+        self.assertEqual(users_messages.get_stats()['largest'][0]['dropped'], 3)
+
+
+class TestOutboxLanes(unittest.TestCase):
+    def setUp(self):
+        self.outbox = Outbox(OutboxLimits(max_messages=100, bulk_share=0.25))
+
+    def test_control_before_bulk(self):
+        for i in range(3):
+            self.outbox.append(f'chat{i}', bulk=True)
+        self.outbox.append('ack')
+        self.assertEqual(
+            self.outbox.take_batch(10), ['ack', 'chat0', 'chat1', 'chat2']
+        )
+        self.assertEqual(self.outbox.size, 0)
+
+    def test_bulk_not_starved(self):
+        for i in range(10):
+            self.outbox.append(f'ack{i}')
+            self.outbox.append(f'chat{i}', bulk=True)
+        batch = self.outbox.take_batch(4)
+        self.assertEqual(batch, ['ack0', 'ack1', 'ack2', 'chat0'])
+        self.assertEqual(len(self.outbox), 16)
+
+    def test_bulk_dropped_first(self):
+        outbox = Outbox(OutboxLimits(max_messages=2))
+        outbox.append('token')
+        outbox.append('chat0', bulk=True)
+        outbox.append('chat1', bulk=True)
+        self.assertEqual(list(outbox), ['token', 'chat1'])
+
+    def test_put_back_to_own_lane(self):
+        self.outbox.append('chat0', bulk=True)
+        self.outbox.append('chat1', bulk=True)
+        self.outbox.append('ack')
+        batch = self.outbox.take_batch(2)
+        self.assertEqual(batch, ['ack', 'chat0'])
+        for message in reversed(batch):
+            self.outbox.appendleft(message)
+        self.assertEqual(self.outbox.bulk_count, 2)
+        self.outbox.append('token')
+        self.assertEqual(
+            self.outbox.take_all(), ['ack', 'token', 'chat0', 'chat1']
+        )
@@ -0,0 +1,84 @@
+import sys
+import unittest
+from unittest.mock import MagicMock
+from concurrent.futures.process import BrokenProcessPool
+import trio
+from ..server import db
+from ..server.auth import AuthMixin
+from ..server.password_verifier import PasswordVerifier, PasswordVerifierBusy
+
+
+class TestPasswordVerifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.hashed_password = AuthMixin.get_password_hash('secret')
+
+    def setUp(self):
+        self.verifier = PasswordVerifier(max_workers=1, max_pending=2)
+        self.verifier.start()
+
+    def tearDown(self):
+        self.verifier.shutdown()
+
+    def test_verify(self):
+        async def main():
+            return (
+                await self.verifier.verify('secret', self.hashed_password),
+                await self.verifier.verify('wrong', self.hashed_password),
+            )
+
+        self.assertEqual(trio.run(main), (True, False))
+        self.assertEqual(self.verifier.get_stats()['verified'], 2)
+        self.assertEqual(self.verifier.pending, 0)
+
+    def test_warm_up(self):
+        async def main():
+            await self.verifier.warm_up()
+            return await self.verifier.verify('secret', self.hashed_password)
+
+        self.assertTrue(trio.run(main))
+        self.assertEqual(
+            self.verifier._executor._mp_context.get_start_method(), 'spawn'
+        )
+
+    def test_worker_skips_server_package(self):
+        self.assertIn(db.__name__, sys.modules)
+        loaded = self.verifier._executor.submit(
+            eval, f"{db.__name__!r} in __import__('sys').modules"
+        )
+        self.assertFalse(loaded.result(timeout=30))
+
+    def test_warm_up_failure(self):
+        broken = MagicMock()
+        broken.submit.side_effect = BrokenProcessPool('worker died')
+        self.verifier.shutdown()
+        self.verifier._executor = broken
+
+        async def main():
+            await self.verifier.warm_up()
+            self.assertIsNone(self.verifier._executor)
+            return await self.verifier.verify('secret', self.hashed_password)
+
+        with self.assertLogs('server-logger', level='ERROR'):
+            self.assertTrue(trio.run(main))
+        broken.shutdown.assert_called_once()
+
+    def test_busy(self):
+        results = []
+
+        async def verify():
+            try:
+                results.append(
+                    await self.verifier.verify('secret', self.hashed_password)
+                )
+            except PasswordVerifierBusy:
+                results.append('busy')
+
+        async def main():
+            async with trio.open_nursery() as nursery:
+                for _ in range(3):
+                    nursery.start_soon(verify)
+
+        trio.run(main)
+        self.assertEqual(sorted(map(str, results)), ['True', 'True', 'busy'])
+        self.assertEqual(self.verifier.get_stats()['rejected'], 1)
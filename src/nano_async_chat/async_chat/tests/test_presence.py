@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import MagicMock
+from sqlalchemy import delete
+from ..server.db import SessionLocal, User
+from ..server.presence import PresenceService
+
+
+class Window:
+    def __init__(self):
+        self.events = []
+
+    def on_presence_changed(self, event):
+        self.events.append(event)
+
+
+class TestPresenceService(unittest.TestCase):
+    def setUp(self):
+        self.presence = PresenceService()
+        self.events = []
+        self.presence.subscribe(self.events.append)
+
+    def delete_user(self, user_id: int) -> None:
+        with SessionLocal() as session:
+            session.execute(delete(User).where(User.id == user_id))
+            session.commit()
+
+    def test_online_offline(self):
+        self.assertTrue(self.presence.set_online(1, 'Ivan1'))
+        self.assertFalse(self.presence.set_online(1, 'Ivan1'))
+        self.assertTrue(self.presence.is_online(1))
+        self.assertTrue(self.presence.is_account_online('Ivan1'))
+        self.assertEqual(
+            self.presence.get_online_account_names(['Ivan2', 'Ivan1']),
+            ['Ivan1']
+        )
+        self.assertTrue(self.presence.set_offline(1))
+        self.assertFalse(self.presence.set_offline(1))
+        self.assertFalse(self.presence.is_account_online('Ivan1'))
+        self.assertEqual(
+            [(event.account_name, event.online) for event in self.events],
+            [('Ivan1', True), ('Ivan1', False)]
+        )
+
+    def test_subscribers(self):
+        window = Window()
+        self.presence.subscribe(window.on_presence_changed)
+        self.presence.subscribe(MagicMock(side_effect=Exception('boom')))
+        self.presence.set_online(1, 'Ivan1')
+        # Упавший подписчик не мешает остальным
+        self.assertEqual(len(window.events), 1)
+        self.assertEqual(len(self.events), 1)
+        # Закрытое окно отписывается само
+        del window
+        self.presence.set_offline(1)
+        self.assertEqual(len(self.presence._subscribers), 2)
+        self.presence.unsubscribe(self.events.append)
+        self.presence.set_online(1, 'Ivan1')
+        self.assertEqual(len(self.events), 2)
+
+    def test_watch(self):
+        self.presence.set_online(1, 'Ivan1')
+        self.presence.watch(1, ['Ivan2', 'Ivan3'])
+        self.assertEqual(self.presence.get_watchers('Ivan2'), {1})
+        self.presence.watch(1, ['Ivan3'], replace=True)
+        self.assertEqual(self.presence.get_watchers('Ivan2'), set())
+        self.presence.unwatch(1, ['Ivan3'])
+        self.assertEqual(self.presence.get_watchers('Ivan3'), set())
+        # Вышедший пользователь ни за кем не следит
+        self.presence.watch(1, ['Ivan2'])
+        self.presence.set_offline(1)
+        self.assertEqual(self.presence.get_watchers('Ivan2'), set())
+
+    def test_flush_writes_last_state(self):
+        with SessionLocal() as session:
+            user = User(account_name='presence', password='', has_entered=False)
+            session.add(user)
+            session.commit()
+            user_id = user.id
+        self.addCleanup(self.delete_user, user_id)
+        self.presence.write_states = MagicMock(
+            wraps=self.presence.write_states
+        )
+        self.presence.set_online(user_id, 'presence')
+        self.presence.set_offline(user_id)
+        self.presence.set_online(user_id, 'presence')
+        self.assertEqual(self.presence.flush(), 1)
+        self.presence.write_states.assert_called_once_with({user_id: True})
+        with SessionLocal() as session:
+            self.assertTrue(session.get(User, user_id).has_entered)
+        self.assertEqual(self.presence.flush(), 0)
+
+    def test_failed_write_keeps_newer_state(self):
+        self.presence.write_states = MagicMock(
+            side_effect=Exception('db is locked')
+        )
+        self.presence.set_online(1, 'Ivan1')
+        self.assertEqual(self.presence.flush(), 0)
+        self.presence.set_offline(1)
+        self.assertEqual(self.presence.take_pending(), {1: False})
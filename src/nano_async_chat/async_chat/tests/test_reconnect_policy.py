@@ -0,0 +1,56 @@
+import unittest
+from ..client.reconnect_policy import ReconnectPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestReconnectPolicy(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.policy = ReconnectPolicy(
+            base_delay=1,
+            max_delay=10,
+            reset_after=5,
+            random_=lambda: 1.0,
+            clock=self.clock
+        )
+
+    def test_exponential_with_cap(self):
+        delays = [self.policy.next_delay() for _ in range(6)]
+        self.assertEqual(delays, [1, 2, 4, 8, 10, 10])
+        self.assertEqual(self.policy.total_delay, 35)
+
+    def test_full_jitter(self):
+        self.policy.random = lambda: 0.25
+        self.policy.attempts = 3
+        self.assertEqual(self.policy.next_delay(), 2)
+
+    def test_reset_after_stable_connection(self):
+        for _ in range(3):
+            self.policy.next_delay()
+        self.policy.on_connected()
+        self.clock.now = 5
+        self.policy.on_disconnected()
+        self.assertEqual(self.policy.attempts, 0)
+        self.assertEqual(self.policy.next_delay(), 1)
+
+    def test_no_reset_after_short_connection(self):
+        for _ in range(3):
+            self.policy.next_delay()
+        self.policy.on_connected()
+        self.clock.now = 1
+        self.policy.on_disconnected()
+        self.assertEqual(self.policy.next_delay(), 8)
+        self.assertEqual(self.policy.get_stats()['disconnects'], 1)
+
+    def test_long_outage(self):
+        for _ in range(5000):
+            delay = self.policy.next_delay()
+        self.assertEqual(delay, 10)
+        self.assertEqual(self.policy.attempts, 5000)
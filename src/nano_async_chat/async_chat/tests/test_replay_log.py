@@ -0,0 +1,139 @@
+import json
+import unittest
+from ..frame_codec import HEAD_SIZE, encode_frame
+from ..server.clients import UsersMessages
+from ..server.outbox import SequencedMessage
+from ..server.replay_log import ReplayLog, ReplayRing
+
+
+class TestSequencedMessage(unittest.TestCase):
+    def test_to_frames(self):
+        for message in ('{"a": 1}', encode_frame(b'{"a": 1}')):
+            sequenced = SequencedMessage(seq=7, message=message)
+            header, frame = sequenced.to_frames()
+            self.assertEqual(json.loads(header[HEAD_SIZE:]), {'seq': 7})
+            self.assertEqual(frame, encode_frame(b'{"a": 1}'))
+
+    def test_shared_frame_not_copied(self):
+        frame = encode_frame(b'{"a": 1}')
+        self.assertIs(
+            SequencedMessage(seq=1, message=frame).to_frames()[1], frame
+        )
+
+
+class TestReplayRing(unittest.TestCase):
+    def test_push_and_evict(self):
+        ring = ReplayRing(max_messages=3, max_bytes=100)
+        for message in ('a', 'b', 'c', 'd'):
+            ring.push(message)
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.first_seq, 2)
+        self.assertEqual(ring.next_seq, 5)
+        self.assertEqual(ring.size, 3)
+
+    def test_can_resume(self):
+        ring = ReplayRing(max_messages=3, max_bytes=100)
+        self.assertTrue(ring.can_resume(0))
+        for message in ('a', 'b', 'c', 'd'):
+            ring.push(message)
+        self.assertFalse(ring.can_resume(0))
+        self.assertTrue(ring.can_resume(1))
+        self.assertTrue(ring.can_resume(4))
+        self.assertFalse(ring.can_resume(5))
+
+    def test_take_since(self):
+        ring = ReplayRing(max_messages=10, max_bytes=100)
+        for message in ('a', 'b', 'c', 'd'):
+            ring.push(message)
+        self.assertEqual(
+            [message.message for message in ring.take_since(1)],
+            ['b', 'c', 'd']
+        )
+        self.assertEqual(
+            [message.seq for message in ring.take_since(1, before_seq=4)],
+            [2, 3]
+        )
+        self.assertEqual(ring.take_since(4), [])
+
+
+class TestReplayLog(unittest.TestCase):
+    def test_push_without_session(self):
+        replay = ReplayLog()
+        self.assertEqual(replay.push(1, 'a'), 'a')
+        replay.open(1)
+        self.assertEqual(replay.push(1, 'a').seq, 1)
+        replay.discard(1)
+        self.assertIsNone(replay.get(1))
+
+    def test_max_rings(self):
+        replay = ReplayLog(max_rings=2)
+        replay.open(1)
+        replay.open(2)
+        replay.open(1)
+        replay.open(3)
+        self.assertIsNotNone(replay.get(1))
+        self.assertIsNone(replay.get(2))
+
+    def test_expire_after_disconnect(self):
+        now = [0.0]
+        replay = ReplayLog(ring_ttl=10, clock=lambda: now[0])
+        replay.open(1)
+        replay.open(2)
+        replay.push(1, 'a')
+        replay.detach(1)
+        replay.detach(2)
+        # Переподключение до срока сохраняет кольцо
+        replay.open(2)
+        now[0] = 10
+        self.assertEqual(replay.expire(), 1)
+        self.assertIsNone(replay.get(1))
+        self.assertIsNotNone(replay.get(2))
+        self.assertEqual(replay.size, 0)
+
+    def test_max_total_bytes(self):
+        replay = ReplayLog(max_bytes=10, max_total_bytes=5)
+        for user_id in (1, 2, 3):
+            replay.open(user_id)
+        replay.push(1, 'aa')
+        replay.push(2, 'bb')
+        replay.detach(2)
+        replay.push(3, 'cc')
+        # Сначала вытесняется кольцо отключенного пользователя
+        self.assertIsNone(replay.get(2))
+        self.assertIsNotNone(replay.get(1))
+        replay.push(3, 'dd')
+        self.assertIsNone(replay.get(1))
+        self.assertEqual(replay.size, 4)
+
+
+class TestResumeMessages(unittest.TestCase):
+    def setUp(self):
+        self.users_messages = UsersMessages()
+        self.users_messages.replay.open(1)
+
+    def test_bulk_messages_numbered(self):
+        self.users_messages.put_message_to_queue(1, 'control')
+        self.users_messages.put_message_to_queue(1, 'a', bulk=True)
+        messages = self.users_messages.get_all_messages_from_queue(1)
+        self.assertEqual(messages[0], 'control')
+        self.assertEqual(messages[1], SequencedMessage(seq=1, message='a'))
+
+    def test_replay_sent_messages_only(self):
+        for message in ('a', 'b', 'c'):
+            self.users_messages.put_message_to_queue(1, message, bulk=True)
+        # Два сообщения ушли в сокет, третье осталось в очереди
+        self.users_messages.take_messages_from_queue(1, max_messages=2)
+        self.assertEqual(self.users_messages.resume_messages(1, 1), 1)
+        messages = self.users_messages.get_all_messages_from_queue(1)
+        self.assertEqual([message.seq for message in messages], [2, 3])
+        self.assertEqual(self.users_messages.total_messages, 0)
+
+    def test_reject_lost_messages(self):
+        self.users_messages.replay.max_messages = 2
+        self.users_messages.replay.discard(1)
+        self.users_messages.replay.open(1)
+        for message in ('a', 'b', 'c'):
+            self.users_messages.put_message_to_queue(1, message, bulk=True)
+        self.assertIsNone(self.users_messages.resume_messages(1, 0))
+        self.assertIsNone(self.users_messages.resume_messages(2, 0))
+        self.assertEqual(self.users_messages.replay.rejected, 2)
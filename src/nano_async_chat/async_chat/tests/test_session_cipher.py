@@ -0,0 +1,47 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from ..server import server
+from ..server.clients import Client
+from ..utils import SessionCipher
+
+
+class TestSessionCipher(unittest.TestCase):
+    def test_encrypt_decrypt(self):
+        client_cipher = SessionCipher()
+        server_cipher = SessionCipher(client_cipher.key)
+        message = 'Привет ' * 1000
+        ciphertext = client_cipher.encrypt(message)
+        self.assertNotIn(message.encode(), ciphertext)
+        self.assertEqual(server_cipher.decrypt(ciphertext), message)
+
+    def test_nonce_is_unique(self):
+        cipher = SessionCipher()
+        self.assertNotEqual(cipher.encrypt('text'), cipher.encrypt('text'))
+
+    def test_wrong_key(self):
+        ciphertext = SessionCipher().encrypt('text')
+        self.assertIs(SessionCipher().decrypt(ciphertext), False)
+
+    def test_rsa_ciphertext_is_rejected(self):
+        self.assertIs(SessionCipher().decrypt(b'\x00' * 512), False)
+
+
+class TestDecodeRequest(unittest.TestCase):
+    def setUp(self):
+        self.server = MagicMock()
+        socket = MagicMock()
+        socket.getsockname.return_value = ('127.0.0.1', 7777)
+        self.client = Client(socket=socket, cipher=SessionCipher())
+
+    def test_session_frame(self):
+        data = self.client.cipher.encrypt('{"action": "probe"}')
+        request = server.ServerChat.decode_request(self.server, self.client, data)
+        self.assertEqual(request, '{"action": "probe"}')
+
+    def test_no_rsa_after_session_key(self):
+        with patch.object(server, 'decrypt') as decrypt:
+            request = server.ServerChat.decode_request(
+                self.server, self.client, b'\x00' * 512
+            )
+        self.assertIsNone(request)
+        decrypt.assert_not_called()
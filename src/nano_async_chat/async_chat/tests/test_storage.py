@@ -0,0 +1,130 @@
+import threading
+import unittest
+import trio
+from sqlalchemy import delete, update
+from ..server.auth import AuthMixin
+from ..server.db import SessionLocal, User
+from ..server.storage import LatencyHistogram, StorageExecutor
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_observe(self):
+        histogram = LatencyHistogram(bounds=(1, 10, 100))
+        for seconds in (0.0005, 0.005, 0.005, 0.05, 0.5):
+            histogram.observe(seconds)
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.count, 5)
+        self.assertEqual(histogram.percentile(0.5), 10)
+        self.assertEqual(histogram.percentile(1), 500)
+        self.assertEqual(histogram.get_stats()['max_ms'], 500)
+
+    def test_empty(self):
+        self.assertEqual(LatencyHistogram().percentile(0.99), 0.0)
+
+
+class TestStorageExecutor(unittest.TestCase):
+    def test_run_in_worker_thread(self):
+        executor = StorageExecutor(max_threads=2)
+        main_thread = threading.get_ident()
+
+        async def main():
+            return await executor.run(
+                lambda user_service: (
+                    threading.get_ident(),
+                    user_service.session is not None
+                ),
+                name='probe'
+            )
+
+        thread_id, has_session = trio.run(main)
+        self.assertNotEqual(thread_id, main_thread)
+        self.assertTrue(has_session)
+        self.assertEqual(executor.get_stats()['probe']['count'], 1)
+
+    def test_limiter_bounds_concurrency(self):
+        executor = StorageExecutor(max_threads=2)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def operation():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            threading.Event().wait(0.02)
+            with lock:
+                running[0] -= 1
+
+        async def main():
+            async with trio.open_nursery() as nursery:
+                for _ in range(6):
+                    nursery.start_soon(executor.run_sync, operation)
+
+        trio.run(main)
+        self.assertEqual(running[1], 2)
+        self.assertEqual(executor.get_stats()['operation']['count'], 6)
+
+    def test_submit_and_drain(self):
+        executor = StorageExecutor(max_pending=1)
+        done = []
+        self.assertTrue(executor.submit(lambda _: done.append(1), name='a'))
+        self.assertFalse(executor.submit(lambda _: done.append(2), name='b'))
+        self.assertEqual(executor.dropped, 1)
+        executor.drain()
+        self.assertEqual(done, [1])
+
+
+async def run_inline(func, *args, name=None):
+    # База в памяти у каждого потока своя, поэтому без рабочих потоков
+    return func(*args)
+
+
+class TestStorageIdentities(unittest.TestCase):
+    def setUp(self):
+        self.executor = StorageExecutor()
+        self.executor.run_sync = run_inline
+        with SessionLocal() as session:
+            user = User(
+                account_name='cached',
+                password=AuthMixin.get_password_hash('secret')
+            )
+            session.add(user)
+            session.commit()
+            self.user_id = user.id
+
+    def tearDown(self):
+        with SessionLocal() as session:
+            session.execute(delete(User).where(User.id == self.user_id))
+            session.commit()
+
+    def test_changed_user_invalidated(self):
+        def rename(user_service):
+            user_service.get_user_by_id(self.user_id).account_name = 'renamed'
+            user_service.session.commit()
+
+        async def main():
+            await self.executor.get_identity('cached')
+            self.assertEqual(len(self.executor.identities), 1)
+            await self.executor.run(rename)
+            self.assertEqual(len(self.executor.identities), 0)
+            return await self.executor.get_identity('renamed')
+
+        self.assertEqual(trio.run(main).id, self.user_id)
+
+    def test_password_changed_outside(self):
+        new_password = AuthMixin.get_password_hash('changed')
+
+        async def main():
+            identity = await self.executor.get_identity('cached')
+            with SessionLocal() as session:
+                session.execute(
+                    update(User)
+                    .where(User.id == self.user_id)
+                    .values(password=new_password)
+                )
+                session.commit()
+            password = await self.executor.get_user_password(identity)
+            return password, self.executor.identities.get('cached')
+
+        password, identity = trio.run(main)
+        self.assertEqual(password, new_password)
+        self.assertIsNone(identity)
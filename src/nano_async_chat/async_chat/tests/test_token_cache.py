@@ -0,0 +1,60 @@
+import time
+import unittest
+import datetime as dt
+from unittest.mock import patch
+from jose import JWTError, jwt
+from ..server.utils_auth import (
+    TokenCache, create_access_token, decode_token, token_cache
+)
+
+
+class TestTokenCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = TokenCache(max_size=2)
+
+    def test_put_and_get(self):
+        claims = dict(account_name='Ivan1', exp=time.time() + 60)
+        self.assertIsNone(self.cache.get('token'))
+        self.cache.put('token', claims)
+        self.assertEqual(self.cache.get('token'), claims)
+        self.assertEqual(self.cache.get_stats()['hit_rate'], 0.5)
+
+    def test_expired(self):
+        self.cache.put('token', dict(account_name='Ivan1', exp=time.time() - 1))
+        self.assertIsNone(self.cache.get('token'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_max_size(self):
+        for i in range(3):
+            self.cache.put(
+                f'token{i}', dict(account_name=f'Ivan{i}', exp=time.time() + 60)
+            )
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('token0'))
+
+    def test_evict_account(self):
+        exp = time.time() + 60
+        self.cache.put('token1', dict(account_name='Ivan1', exp=exp))
+        self.cache.put('token2', dict(account_name='Ivan2', exp=exp))
+        self.cache.evict_account('Ivan1')
+        self.assertIsNone(self.cache.get('token1'))
+        self.assertIsNotNone(self.cache.get('token2'))
+
+
+class TestDecodeToken(unittest.TestCase):
+    def test_signature_checked_once(self):
+        token = create_access_token(
+            data=dict(account_name='Ivan1'),
+            expires_delta=dt.timedelta(minutes=5)
+        )
+        with patch.object(jwt, 'decode', wraps=jwt.decode) as decode:
+            self.assertEqual(decode_token(token)['account_name'], 'Ivan1')
+            self.assertEqual(decode_token(token)['account_name'], 'Ivan1')
+        decode.assert_called_once()
+        token_cache.evict_account('Ivan1')
+
+    def test_bad_token(self):
+        with self.assertRaises(JWTError):
+            decode_token('bad token')
+        with self.assertRaises(JWTError):
+            decode_token(None)
@@ -0,0 +1,74 @@
+import socket
+import struct
+import unittest
+import trio
+from ..frame_codec import encode_frame
+from ..server import TrioServerChat
+
+
+async def sleep_forever(client, stream):
+    await trio.sleep_forever()
+
+
+class TestTrioServerChat(unittest.TestCase):
+    def setUp(self):
+        self.server = TrioServerChat(port=0, max_users=5)
+
+    async def wait_for(self, predicate):
+        with trio.fail_after(5):
+            while not predicate():
+                await trio.sleep(0.01)
+
+    async def connect(self, address) -> trio.socket.SocketType:
+        sock = trio.socket.socket()
+        await sock.connect(address)
+        await self.wait_for(lambda: len(self.server.clients) == 1)
+        return sock
+
+    def reset(self, sock: trio.socket.SocketType) -> None:
+        # SO_LINGER с нулевым таймаутом закрывает соединение через RST
+        sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0)
+        )
+        sock.close()
+
+    def serve(self, break_connection) -> None:
+        async def main():
+            listeners = await trio.open_tcp_listeners(0, host='127.0.0.1')
+            address = listeners[0].socket.getsockname()
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(
+                    trio.serve_listeners,
+                    self.server.handle_connection,
+                    listeners
+                )
+                sock = await self.connect(address)
+                await break_connection(sock)
+                await self.wait_for(lambda: not self.server.clients)
+                # Сервер продолжает принимать подключения
+                sock = await self.connect(address)
+                sock.close()
+                nursery.cancel_scope.cancel()
+
+        trio.run(main)
+
+    def test_survives_client_reset(self):
+        async def break_connection(sock):
+            self.reset(sock)
+
+        self.serve(break_connection)
+
+    def test_survives_send_failure(self):
+        self.server.receiving_loop = sleep_forever
+        users_messages = self.server.clients.users_messages
+
+        async def break_connection(sock):
+            target = next(iter(self.server.clients))
+            self.reset(sock)
+            while self.server.clients:
+                users_messages.put_message_to_queue(
+                    target, encode_frame(b'x' * 1000)
+                )
+                await trio.sleep(0.01)
+
+        self.serve(break_connection)
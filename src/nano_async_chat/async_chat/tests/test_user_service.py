@@ -0,0 +1,71 @@
+import unittest
+import datetime as dt
+from sqlalchemy import delete, event
+from ..server.db import SessionLocal, User, History, engine
+from ..server.user_service import UserService
+
+
+class TestUsersStats(unittest.TestCase):
+    def setUp(self):
+        start = dt.datetime(2023, 1, 1, tzinfo=dt.timezone.utc)
+        with SessionLocal() as session:
+            self.active = User(account_name='stat_active', password='')
+            self.silent = User(account_name='stat_silent', password='')
+            session.add_all([self.active, self.silent])
+            session.flush()
+            user_service = UserService(session)
+            for day in range(3):
+                time = start + dt.timedelta(days=day)
+                user_service.login(self.active, time)
+                user_service.user_send_message_to_server(
+                    self.active, time + dt.timedelta(minutes=1)
+                )
+                user_service.logout(self.active, time + dt.timedelta(minutes=2))
+            user_service.login(self.silent, start)
+            self.ids = (self.active.id, self.silent.id)
+
+    def tearDown(self):
+        with SessionLocal() as session:
+            session.execute(
+                delete(History).where(History.user_id.in_(self.ids))
+            )
+            session.execute(delete(User).where(User.id.in_(self.ids)))
+            session.commit()
+
+    def get_stats(self, session):
+        return {
+            stat.id: stat
+            for stat in UserService(session).get_users_stats()
+            if stat.id in self.ids
+        }
+
+    def test_matches_per_user_queries(self):
+        with SessionLocal() as session:
+            stats = self.get_stats(session)
+            for user_id in self.ids:
+                user = session.get(User, user_id)
+                stat = stats[user_id]
+                self.assertEqual(stat.account_name, user.account_name)
+                self.assertEqual(stat.last_login_time, user.last_login)
+                self.assertEqual(stat.last_message_time, user.last_send_message)
+                self.assertEqual(
+                    stat.send_messages_count,
+                    user.user_service.get_user_send_messages_count(user)
+                )
+        self.assertEqual(stats[self.ids[0]].send_messages_count, 3)
+        self.assertIsNone(stats[self.ids[1]].last_message_time)
+        self.assertEqual(stats[self.ids[1]].send_messages_count, 0)
+
+    def test_one_query(self):
+        statements = []
+
+        def count(*args):
+            statements.append(args)
+
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            with SessionLocal() as session:
+                UserService(session).get_users_stats()
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        self.assertEqual(len(statements), 1)
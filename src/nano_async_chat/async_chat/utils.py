@@ -1,5 +1,7 @@
+import os
 from typing import Any, Generic, NewType, Type, TypeVar
 import rsa
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from pydantic import BaseModel
 from pydantic.generics import GenericModel
 
@@ -67,3 +69,29 @@ def decrypt(ciphertext: bytes, key: bytes):
         return rsa.decrypt(ciphertext, key).decode()
     except Exception:
         return False
+
+
+class SessionCipher:
+    """Симметричный шифр сессии
+
+    Ключ передается серверу один раз, зашифрованным по rsa, дальше
+    сообщения шифруются AES-GCM без ограничения на размер"""
+    nonce_size = 12
+
+    def __init__(self, key: bytes | None = None):
+        self.key = key or AESGCM.generate_key(bit_length=256)
+        self._aead = AESGCM(self.key)
+
+    def encrypt(self, message: str) -> bytes:
+        nonce = os.urandom(self.nonce_size)
+        return nonce + self._aead.encrypt(nonce, message.encode(), None)
+
+    def decrypt(self, ciphertext: bytes):
+        try:
+            return self._aead.decrypt(
+                ciphertext[:self.nonce_size],
+                ciphertext[self.nonce_size:],
+                None
+            ).decode()
+        except Exception:
+            return False
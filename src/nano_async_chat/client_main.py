@@ -1,6 +1,6 @@
 import click
 import trio
-from .async_chat.client import ClientChat
+from .async_chat.client import ClientChat, ReconnectPolicy
 from .log_config import client_log_config  # noqa
 from .async_chat.client.console import ConsoleServer
 from .async_chat.client.client_ui.client_ui_talk import ClientUiTalk
@@ -11,11 +11,13 @@ from .async_chat.client.client_ui.client_ui_talk import ClientUiTalk
 @click.option('--password', type=str)
 @click.option('--ip_address', default='127.0.0.1', type=str)
 @click.option('--port', default=3000, type=int)
+@click.option('--reconnect_max_delay', default=30.0, type=float)
 def main(
     account_name: str | None,
     password: str | None,
     ip_address: str,
-    port: int
+    port: int,
+    reconnect_max_delay: float
 ):
     print(
         f'Инициализируем клента {account_name=}, используя {ip_address=} {port=}'
@@ -29,7 +31,8 @@ def main(
         password=password,
         ip_address=ip_address,
         port=port,
-        client_ui_talk=client_ui_talk
+        client_ui_talk=client_ui_talk,
+        reconnect_policy=ReconnectPolicy(max_delay=reconnect_max_delay)
     )
     client_ui_talk.put_client(client_chat)
 
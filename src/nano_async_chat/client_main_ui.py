@@ -2,4 +2,5 @@ from .log_config import client_log_config  # noqa
 from .async_chat.client.client_ui.client_ui import main
 
 
-main()
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,13 @@
+"""Запуск сервера чата из командной строки
+
+Процессы проверки паролей запускаются через spawn и заново импортируют
+этот модуль, поэтому пакет сервера и настройка логов импортируются
+только внутри main()."""
 import click
 import trio
-from .async_chat.server import ServerChat
-from .log_config import server_log_config  # noqa
+from .async_chat import settings
+
+ENGINES = ('trio', 'select')
 
 
 def start_shell():
@@ -17,14 +23,46 @@ def start_shell():
 @click.option('--port', default=3000, type=int)
 @click.option('--max_users', default=1000, type=int)
 @click.option('--shell', default=False, type=bool)
-def main(port: int, max_users: int, shell: bool):
+@click.option('--engine', default='trio', type=click.Choice(ENGINES))
+@click.option('--outbox_max_messages', default=10000, type=int)
+@click.option('--outbox_max_bytes', default=8 * 1024 * 1024, type=int)
+@click.option(
+    '--outbox_policy',
+    default='drop_oldest',
+    type=click.Choice(['drop_oldest', 'drop_newest', 'disconnect'])
+)
+@click.option('--idle_timeout', default=settings.IDLE_TIMEOUT or 0, type=float)
+def main(
+    port: int,
+    max_users: int,
+    shell: bool,
+    engine: str,
+    outbox_max_messages: int,
+    outbox_max_bytes: int,
+    outbox_policy: str,
+    idle_timeout: float
+):
+    from .log_config import server_log_config  # noqa
+    from .async_chat.server import ServerChat, TrioServerChat
+    from .async_chat.server.outbox import OutboxLimits, OverflowPolicy
+
     if shell:
         start_shell()
         return
 
-    server_chat = ServerChat(
+    engines = {
+        'trio': TrioServerChat,
+        'select': ServerChat,
+    }
+    server_chat = engines[engine](
         port=port,
-        max_users=max_users
+        max_users=max_users,
+        idle_timeout=idle_timeout or None,
+        outbox_limits=OutboxLimits(
+            max_messages=outbox_max_messages,
+            max_bytes=outbox_max_bytes,
+            policy=OverflowPolicy(outbox_policy)
+        )
     )
     trio.run(server_chat.run)
 
@@ -1,5 +1,6 @@
-from .log_config import server_log_config  # noqa
-from .async_chat.server.admin_ui.main import main
+if __name__ == '__main__':
+    # Процессы проверки паролей заново импортируют этот модуль
+    from .log_config import server_log_config  # noqa
+    from .async_chat.server.admin_ui.main import main
 
-
-main()
+    main()